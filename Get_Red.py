@@ -1,24 +1,60 @@
 import os
+import re
+import sys
 import time
 import json
+import contextlib
 import csv
 import html
 import random
 import shutil
+import sqlite3
+import tempfile
+import struct
+import zlib
+import hashlib
+import heapq
 import threading
 import traceback
+import queue
+import multiprocessing
+from array import array
+from bisect import bisect_left
+from collections import deque, Counter, OrderedDict
+from multiprocessing import shared_memory
 from datetime import datetime, timedelta, timezone
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urlencode, urljoin
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlencode, urljoin, quote
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 from bs4 import BeautifulSoup
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+try:
+    import orjson  # 可选：更快的 JSON 解码
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa  # 可选：Parquet 输出
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import xlsxwriter  # 可选：constant_memory 模式写 xlsx 更快
+except ImportError:
+    xlsxwriter = None
+
 # =========================
 # 固定代理（只在代码里维护）
 # =========================
@@ -143,6 +179,12 @@ UA_POOL = [
     "reddit/2024.6.0 (iOS 16.7; iPhone14,5; Scale/2.00)"
 ]
 
+# /api/info 每次最多支持 100 个 fullname
+INFO_BATCH_SIZE = 100
+# /api/morechildren 每次最多展开 100 个 id；多轮展开的上限
+MORECHILDREN_BATCH_SIZE = 100
+MORECHILDREN_MAX_ROUNDS = 10
+
 CSV_HEADERS = [
     "post_subreddit", "post_id", "post_author", "post_author_flair","post_title", "post_body",
     "post_ups", "post_downs", "post_score", "post_created_utc", "post_url",
@@ -151,6 +193,8 @@ CSV_HEADERS = [
     "comment_url",
     "source"
 ]
+_ROW_POST_ID = CSV_HEADERS.index("post_id")
+_ROW_COMMENT_ID = CSV_HEADERS.index("comment_id")
 
 def desktop_dir() -> Path:
     home = Path.home()
@@ -160,13 +204,699 @@ def desktop_dir() -> Path:
             return p
     return home
 
-def interruptible_sleep(rt, total_seconds: float, step: float = 0.2):
-    slept = 0.0
-    while slept < total_seconds:
-        if rt.stop_event.is_set():
+def interruptible_sleep(rt, total_seconds: float):
+    """睡眠 total_seconds，stop_event 一旦触发立即返回（不轮询）"""
+    if total_seconds > 0:
+        rt.stop_event.wait(total_seconds)
+
+
+class ControlEvent:
+    """
+    与 threading.Event 接口一致（set/clear/is_set/wait），但共享同一个条件变量：
+    暂停/继续/停止任何一个变化都会立刻唤醒所有等待中的 worker。
+    """
+
+    def __init__(self, cond: threading.Condition, on_set=None):
+        self._cond = cond
+        self._flag = False
+        self._on_set = on_set
+
+    def is_set(self) -> bool:
+        return self._flag
+
+    def set(self):
+        with self._cond:
+            first = not self._flag
+            self._flag = True
+            self._cond.notify_all()
+        if first and self._on_set:
+            self._on_set()
+
+    def clear(self):
+        with self._cond:
+            self._flag = False
+            self._cond.notify_all()
+
+    def wait(self, timeout: float = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._flag, timeout)
+
+def proxy_label(proxy) -> str:
+    """代理展示名：host:port#session（不暴露账号密码）"""
+    if not proxy:
+        return "direct"
+    url = str(proxy.get("https") or proxy.get("http") or "")
+    hostport = url.rsplit("@", 1)[-1]
+    sess = ""
+    if "_session-" in url:
+        sess = url.split("_session-", 1)[1].split("_")[0]
+    return f"{hostport}#{sess}" if sess else hostport
+
+
+class ProxyManager:
+    """
+    代理健康度管理：
+    - 每个代理记录成功率、延迟 EWMA、最近 429 次数
+    - pick() 按健康分加权挑选，隔离中的代理不参与
+    - 连续失败或短时间内多次 429 -> 定时隔离（冷却时间指数增长，成功后复位）
+    """
+
+    EWMA_ALPHA = 0.3
+    RECENT_429_WINDOW = 60.0
+
+    def __init__(self, pool, fail_threshold: int = 3, throttle_threshold: int = 3,
+                 quarantine_base: float = 30.0, quarantine_max: float = 600.0):
+        self.pool = list(pool or [])
+        self.fail_threshold = fail_threshold
+        self.throttle_threshold = throttle_threshold
+        self.quarantine_base = quarantine_base
+        self.quarantine_max = quarantine_max
+        self.lock = threading.Lock()
+        self.stats = {}
+        for p in self.pool:
+            self.stats[proxy_label(p)] = {
+                "ok": 0,
+                "fail": 0,
+                "throttled": 0,
+                "consecutive_fail": 0,
+                "latency_ewma": None,
+                "recent_429": deque(),
+                "quarantine_until": 0.0,
+                "quarantine_count": 0,
+            }
+
+    def _score(self, st) -> float:
+        total = st["ok"] + st["fail"] + st["throttled"]
+        # 拉普拉斯平滑：新代理默认 50% 成功率
+        success_rate = (st["ok"] + 1) / (total + 2)
+        latency = st["latency_ewma"] or 1.0
+        return success_rate / max(latency, 0.05) / (1 + len(st["recent_429"]))
+
+    def pick(self):
+        if not self.pool:
+            return None
+        now = time.time()
+        with self.lock:
+            healthy, weights = [], []
+            for p in self.pool:
+                st = self.stats[proxy_label(p)]
+                self._prune_429(st, now)
+                if st["quarantine_until"] > now:
+                    continue
+                healthy.append(p)
+                weights.append(self._score(st))
+            if not healthy:
+                # 全部隔离：选最早解除隔离的那个，避免完全停摆
+                return min(self.pool, key=lambda p: self.stats[proxy_label(p)]["quarantine_until"])
+        return random.choices(healthy, weights=weights, k=1)[0]
+
+    def _prune_429(self, st, now):
+        q = st["recent_429"]
+        while q and now - q[0] > self.RECENT_429_WINDOW:
+            q.popleft()
+
+    def _quarantine(self, st, now):
+        st["quarantine_count"] += 1
+        wait = min(self.quarantine_base * (2 ** (st["quarantine_count"] - 1)), self.quarantine_max)
+        st["quarantine_until"] = now + wait
+        st["consecutive_fail"] = 0
+        st["recent_429"].clear()
+        return wait
+
+    def hold(self, proxy, seconds: float):
+        """该代理的配额见底：暂停挑选到 reset（不算失败，不增加隔离次数）"""
+        if not proxy:
+            return
+        with self.lock:
+            st = self.stats.get(proxy_label(proxy))
+            if st is not None:
+                st["quarantine_until"] = max(st["quarantine_until"], time.time() + float(seconds))
+
+    def report(self, proxy, outcome: str, latency: float = None):
+        """
+        outcome: "ok" | "throttled"(429) | "fail"(超时/连接错误/5xx)
+        返回隔离秒数（未隔离返回 0）
+        """
+        if not proxy:
+            return 0
+        now = time.time()
+        with self.lock:
+            st = self.stats.get(proxy_label(proxy))
+            if st is None:
+                return 0
+            if latency is not None:
+                prev = st["latency_ewma"]
+                st["latency_ewma"] = latency if prev is None else (
+                    self.EWMA_ALPHA * latency + (1 - self.EWMA_ALPHA) * prev)
+
+            if outcome == "ok":
+                st["ok"] += 1
+                st["consecutive_fail"] = 0
+                st["quarantine_count"] = 0
+                return 0
+
+            if outcome == "throttled":
+                st["throttled"] += 1
+                st["recent_429"].append(now)
+                self._prune_429(st, now)
+                if len(st["recent_429"]) >= self.throttle_threshold:
+                    return self._quarantine(st, now)
+                return 0
+
+            st["fail"] += 1
+            st["consecutive_fail"] += 1
+            if st["consecutive_fail"] >= self.fail_threshold:
+                return self._quarantine(st, now)
+            return 0
+
+    def snapshot(self):
+        now = time.time()
+        out = []
+        with self.lock:
+            for name, st in self.stats.items():
+                self._prune_429(st, now)
+                total = st["ok"] + st["fail"] + st["throttled"]
+                out.append({
+                    "proxy": name,
+                    "requests": total,
+                    "success_rate": round(st["ok"] / total, 3) if total else None,
+                    "latency_ewma": round(st["latency_ewma"], 3) if st["latency_ewma"] is not None else None,
+                    "recent_429": len(st["recent_429"]),
+                    "quarantined_for": max(round(st["quarantine_until"] - now, 1), 0),
+                })
+        return out
+
+
+def classify_endpoint(url: str) -> str:
+    """把 URL 归到限流桶：search(HTML 搜索页) / post_json(/comments/*.json) / listing(/new/.json) / api(/api/*) / other"""
+    u = (url or "").split("?")[0]
+    if "/search" in u:
+        return "search"
+    if "/comments/" in u and u.endswith(".json"):
+        return "post_json"
+    if u.endswith("/new/.json") or u.endswith("/new.json"):
+        return "listing"
+    if "/api/" in u:
+        return "api"
+    return "other"
+
+
+# 每类端点的默认速率上限（请求/秒）；可用 cfg["rate_limits"] 覆盖
+DEFAULT_RATE_LIMITS = {
+    "search": 4.0,
+    "post_json": 15.0,
+    "listing": 4.0,
+    "api": 4.0,
+    "other": 4.0,
+}
+
+
+class AdaptiveRateLimiter:
+    """
+    全局令牌桶（按端点类别分桶），所有 worker 共用：
+    - acquire(): 预约一个令牌，不够就等（可被 stop 打断）
+    - 429 -> 乘性降速（AIMD 的 MD）；正常返回 -> 加性回升到上限（AIMD 的 AI）
+    - x-ratelimit-remaining 见底 / 429 带 reset：Reddit 按客户端 IP 计数，
+      只暂停（端点类别, 出口）这一组到 reset，不影响其他代理，也不降共享速率
+    """
+
+    DECREASE_FACTOR = 0.5
+    MIN_RATE_RATIO = 0.05
+
+    def __init__(self, rate_limits: dict = None):
+        limits = dict(DEFAULT_RATE_LIMITS)
+        limits.update(rate_limits or {})
+        self.lock = threading.Lock()
+        now = time.monotonic()
+        self.buckets = {}
+        for name, max_rate in limits.items():
+            max_rate = float(max_rate)
+            self.buckets[name] = {
+                "max_rate": max_rate,
+                "min_rate": max_rate * self.MIN_RATE_RATIO,
+                "rate": max_rate,
+                "tokens": max_rate,          # 允许 1s 的突发
+                "updated": now,
+            }
+        self.blocked_until = {}  # (端点类别, 出口) -> monotonic 时间
+
+    def _bucket(self, name):
+        return self.buckets.get(name) or self.buckets["other"]
+
+    def _block_key(self, name, client):
+        return (name if name in self.buckets else "other", client or "direct")
+
+    def reserve(self, name: str, client: str = None) -> float:
+        """预约一个令牌，返回需要等待的秒数（令牌可为负，保证先来先得）"""
+        with self.lock:
+            b = self._bucket(name)
+            now = time.monotonic()
+            b["tokens"] = min(b["rate"], b["tokens"] + (now - b["updated"]) * b["rate"])
+            b["updated"] = now
+            b["tokens"] -= 1
+            wait = 0.0 if b["tokens"] >= 0 else (-b["tokens"] / b["rate"])
+            return max(wait, self.blocked_until.get(self._block_key(name, client), 0.0) - now)
+
+    def acquire(self, rt, name: str, client: str = None):
+        wait = self.reserve(name, client)
+        if wait > 0:
+            interruptible_sleep(rt, wait)
+
+    def on_response(self, name: str, status, headers=None, client: str = None):
+        """根据响应调整速率；返回 (旧速率, 新速率, 该出口被暂停的秒数) 便于日志"""
+        remaining, reset = None, None
+        try:
+            if headers:
+                if headers.get("x-ratelimit-remaining") is not None:
+                    remaining = float(headers.get("x-ratelimit-remaining"))
+                if headers.get("x-ratelimit-reset") is not None:
+                    reset = float(headers.get("x-ratelimit-reset"))
+        except (TypeError, ValueError):
+            remaining, reset = None, None
+
+        with self.lock:
+            b = self._bucket(name)
+            old = b["rate"]
+            exhausted = (status == 429) or (remaining is not None and remaining < 1)
+            if status == 429:
+                b["rate"] = max(b["min_rate"], b["rate"] * self.DECREASE_FACTOR)
+                b["tokens"] = min(b["tokens"], 0.0)
+            elif not exhausted and status is not None and status < 500:
+                b["rate"] = min(b["max_rate"], b["rate"] + b["max_rate"] * 0.05)
+            block = 0.0
+            if exhausted and reset:
+                key = self._block_key(name, client)
+                self.blocked_until[key] = max(self.blocked_until.get(key, 0.0), time.monotonic() + reset)
+                block = reset
+            return old, b["rate"], block
+
+    def snapshot(self):
+        with self.lock:
+            return {k: round(b["rate"], 2) for k, b in self.buckets.items()}
+
+
+class PostJsonCache:
+    """
+    帖子 JSON 的本地磁盘缓存（跨关键词 / 跨关键词组 / 跨天复用）：
+    - 按内容寻址：文件名 = sha1(post_id)，post_id 在 Reddit 全站唯一，subreddit 只作为元信息
+    - zlib 压缩，文件头记录写入时间，超过 TTL 视为未命中
+    - 总大小超限时按最近访问时间（LRU）淘汰
+    - 总大小记在 size.json 里增量维护：打开缓存不扫目录；只有第一次写入且没有 size.json 时扫一次，
+      淘汰时按实际文件重新校准（异常退出导致的少量偏差在这里消除）
+    """
+
+    MAGIC = b"RPC1"
+    HEADER = struct.Struct("<4sd")
+    SIZE_FILE = "size.json"
+    SIZE_FLUSH_EVERY = 256  # 每写入这么多次落一次 size.json
+
+    def __init__(self, cache_dir, ttl_s: float = 86400, max_bytes: int = 1024 * 1024 * 1024):
+        self.dir = Path(cache_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = float(ttl_s)
+        self.max_bytes = int(max_bytes)
+        self.lock = threading.Lock()
+        self.total_bytes = None  # 第一次写入时才载入
+        self._unflushed = 0
+
+    def _load_total(self) -> int:
+        try:
+            with open(self.dir / self.SIZE_FILE, "r", encoding="utf-8") as f:
+                return int(json.load(f)["total_bytes"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return sum(x[1] for x in self._scan())
+
+    def _scan(self):
+        files = []
+        for f in self.dir.glob("*/*.bin"):
+            try:
+                st = f.stat()
+                files.append((st.st_mtime, st.st_size, f))
+            except OSError:
+                continue
+        return files
+
+    def _flush_locked(self):
+        if self.total_bytes is None:
             return
-        time.sleep(step)
-        slept += step
+        tmp = self.dir / f"{self.SIZE_FILE}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"total_bytes": self.total_bytes}, f)
+            os.replace(tmp, self.dir / self.SIZE_FILE)
+            self._unflushed = 0
+        except OSError:
+            pass
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _path(self, post_id: str) -> Path:
+        h = hashlib.sha1(str(post_id).encode("utf-8")).hexdigest()
+        return self.dir / h[:2] / f"{h}.bin"
+
+    def get(self, post_id: str):
+        """命中返回原始 JSON bytes，否则 None"""
+        path = self._path(post_id)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            magic, ts = self.HEADER.unpack_from(blob)
+            if magic != self.MAGIC:
+                return None
+            if time.time() - ts > self.ttl_s:
+                return None
+            raw = zlib.decompress(blob[self.HEADER.size:])
+            os.utime(path, None)  # 更新访问时间，供 LRU 淘汰
+            return raw
+        except (OSError, struct.error, zlib.error):
+            return None
+
+    def put(self, post_id: str, raw: bytes):
+        path = self._path(post_id)
+        blob = self.HEADER.pack(self.MAGIC, time.time()) + zlib.compress(raw, 6)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            # 取旧文件大小、替换、记账在同一把锁里，并发写同一个帖子也不会算错
+            with self.lock:
+                if self.total_bytes is None:
+                    self.total_bytes = self._load_total()
+                old_size = path.stat().st_size if path.exists() else 0
+                os.replace(tmp, path)
+                self.total_bytes += len(blob) - old_size
+                self._unflushed += 1
+                if self.total_bytes > self.max_bytes:
+                    self._evict()
+                if self._unflushed >= self.SIZE_FLUSH_EVERY:
+                    self._flush_locked()
+        except OSError:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+
+    def _evict(self):
+        # 淘汰到上限的 90%，避免每次写入都触发；顺带按实际文件校准总大小
+        target = int(self.max_bytes * 0.9)
+        files = self._scan()
+        files.sort()
+        total = sum(x[1] for x in files)
+        for _, size, f in files:
+            if total <= target:
+                break
+            try:
+                f.unlink()
+                total -= size
+            except OSError:
+                continue
+        self.total_bytes = total
+        self._flush_locked()
+
+
+class SingleFlight:
+    """
+    同一 key 的并发调用合并为一次：第一个调用者（leader）真正执行，其余调用者等待并共享结果。
+    另带一个小的内存 LRU，保存最近成功的结果（None 不缓存）。
+    """
+
+    def __init__(self, lru_size: int = 256):
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.lru = OrderedDict()
+        self.lru_size = max(int(lru_size), 0)
+
+    def do(self, key, fn):
+        """返回 (result, how)，how ∈ {"lru", "shared", "fetched"}"""
+        with self.lock:
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                return self.lru[key], "lru"
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {"event": threading.Event(), "result": None}
+                self.inflight[key] = flight
+
+        if not leader:
+            flight["event"].wait()
+            return flight["result"], "shared"
+
+        result = None
+        try:
+            result = fn()
+        finally:
+            with self.lock:
+                flight["result"] = result
+                self.inflight.pop(key, None)
+                if result is not None and self.lru_size:
+                    self.lru[key] = result
+                    self.lru.move_to_end(key)
+                    while len(self.lru) > self.lru_size:
+                        self.lru.popitem(last=False)
+            flight["event"].set()
+        return result, "fetched"
+
+
+def default_post_cache_dir() -> Path:
+    return Path.home() / ".cache" / "reddit_crawler" / "post_json"
+
+
+class CompactIdSet:
+    """
+    Reddit id（base36）去重集合，按整数紧凑存储：
+    - 新 id 先进小 set；攒满 buffer_size 后排序成 array('q') 有序段（每个 id 8 字节）
+    - 有序段按大小逐级归并（类似 LSM），段数保持在 O(log n)，查询 = 查 set + 各段二分
+    - 非 base36 的值退回普通 set 原样存放
+    add_if_absent / in 都是线程安全的；len / memory_bytes 用增量计数，O(1)。
+    """
+
+    def __init__(self, buffer_size: int = 65536):
+        self.buffer_size = int(buffer_size)
+        self.lock = threading.Lock()
+        self._buf = set()
+        self._runs = []  # 有序段，从大到小
+        self._other = set()
+        self._run_items = 0  # 各有序段的总个数（归并时更新）
+        self._other_bytes = 0
+
+    @staticmethod
+    def _key(item):
+        try:
+            k = int(item, 36)
+        except (TypeError, ValueError):
+            return None
+        return k if 0 <= k < (1 << 63) else None
+
+    def _has(self, k) -> bool:
+        if k in self._buf:
+            return True
+        for run in self._runs:
+            if k < run[0] or k > run[-1]:
+                continue
+            i = bisect_left(run, k)
+            if i < len(run) and run[i] == k:
+                return True
+        return False
+
+    def _flush(self):
+        run = array("q", sorted(self._buf))
+        self._buf = set()
+        while self._runs and len(self._runs[-1]) <= len(run):
+            run = array("q", heapq.merge(self._runs.pop(), run))
+        self._runs.append(run)
+        self._run_items = sum(len(r) for r in self._runs)
+
+    def add_if_absent(self, item) -> bool:
+        """不存在则加入并返回 True；已存在返回 False"""
+        k = self._key(item)
+        with self.lock:
+            if k is None:
+                if item in self._other:
+                    return False
+                self._other.add(item)
+                self._other_bytes += sys.getsizeof(item)
+                return True
+            if self._has(k):
+                return False
+            self._buf.add(k)
+            if len(self._buf) >= self.buffer_size:
+                self._flush()
+            return True
+
+    def __contains__(self, item) -> bool:
+        k = self._key(item)
+        with self.lock:
+            return item in self._other if k is None else self._has(k)
+
+    def __len__(self) -> int:
+        return len(self._buf) + self._run_items + len(self._other)
+
+    def dump(self, path):
+        """全部整数 id 合并成一个有序段写入文件（非 base36 的值不落盘）"""
+        with self.lock:
+            merged = array("q", heapq.merge(*self._runs, sorted(self._buf)))
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            merged.tofile(f)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        run = array("q")
+        with open(path, "rb") as f:
+            run.frombytes(f.read())
+        with self.lock:
+            self._buf = set()
+            self._runs = [run] if run else []
+            self._run_items = len(run)
+
+    def memory_bytes(self) -> int:
+        """近似占用：有序段按 8 字节/个，set 部分按对象 + 哈希表大小估算（不加锁，读的都是计数）"""
+        buf, other = self._buf, self._other
+        return (8 * self._run_items + sys.getsizeof(buf) + 32 * len(buf)
+                + sys.getsizeof(other) + self._other_bytes)
+
+
+SEEN_STATS_INTERVAL_S = 1.0
+
+
+def default_seen_store_path() -> Path:
+    return Path.home() / ".cache" / "reddit_crawler" / "seen.sqlite3"
+
+
+class SeenStore:
+    """
+    跨运行的去重索引（SQLite WAL）：
+    - 表 seen(kind, id, first_seen)：kind="p" 帖子 / "c" 评论，id 在 Reddit 全站唯一
+    - 导出的行先按输出文件暂存，该文件 finalize 成功后才写库；
+      中途停止/失败没产出结果的数据，下次运行仍会重新抓取
+    """
+
+    QUERY_BATCH = 500
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            " kind TEXT NOT NULL, id TEXT NOT NULL, first_seen REAL NOT NULL,"
+            " PRIMARY KEY (kind, id)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._pending = {}
+
+    def known(self, kind: str, ids) -> set:
+        """返回 ids 中已在库里的部分"""
+        ids = list({str(i) for i in ids if i})
+        found = set()
+        with self.lock:
+            for i in range(0, len(ids), self.QUERY_BATCH):
+                batch = ids[i:i + self.QUERY_BATCH]
+                sql = f"SELECT id FROM seen WHERE kind = ? AND id IN ({','.join('?' * len(batch))})"
+                found.update(r[0] for r in self._conn.execute(sql, [kind, *batch]))
+        return found
+
+    def mark_rows(self, key: str, rows):
+        """按输出文件暂存本批行里的帖子/评论 id（行布局同 prepare_row）"""
+        items = []
+        for r in rows:
+            cid = r[_ROW_COMMENT_ID]
+            if cid:
+                items.append(("c", str(cid)))
+            elif r[_ROW_POST_ID]:
+                items.append(("p", str(r[_ROW_POST_ID])))
+        if items:
+            with self.lock:
+                self._pending.setdefault(key, []).extend(items)
+
+    def commit(self, keys) -> int:
+        """把这些输出文件暂存的 id 写库（已存在的保留最早的 first_seen），返回新写入条数"""
+        now = time.time()
+        with self.lock:
+            items = []
+            for k in keys:
+                items.extend(self._pending.pop(k, ()))
+            if not items:
+                return 0
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO seen (kind, id, first_seen) VALUES (?, ?, ?)",
+                ((kind, i, now) for kind, i in items),
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def close(self):
+        with self.lock:
+            self._pending.clear()
+            self._conn.close()
+
+
+def parse_retry_after(value):
+    """Retry-After 支持秒数或 HTTP 日期，返回秒数（无法解析返回 None）"""
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        dt = parsedate_to_datetime(str(value))
+        return max(dt.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class RetryPolicy:
+    """
+    重试策略：
+    - 指数退避 + full jitter：sleep = uniform(0, min(max_delay, base * 2^(attempt-1)))
+    - 429 用更大的 throttle_base_delay；有 Retry-After 时直接遵守（上限 max_retry_after）
+    - 连接类错误（连不上代理/目标）换代理后只做很短的退避
+    - retry_budget：整次运行共享的重试次数上限，防止代理池退化时把时间全耗在无效重试上
+    """
+
+    def __init__(self, base_delay: float = 0.5, max_delay: float = 30.0, throttle_base_delay: float = 4.0,
+                 connect_base_delay: float = 0.1, max_retry_after: float = 120.0,
+                 retry_budget: int = 5000, connect_timeout: float = 5.0):
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.throttle_base_delay = float(throttle_base_delay)
+        self.connect_base_delay = float(connect_base_delay)
+        self.max_retry_after = float(max_retry_after)
+        self.retry_budget = int(retry_budget)
+        self.connect_timeout = float(connect_timeout)
+        self.lock = threading.Lock()
+        self.used = 0
+
+    def backoff(self, attempt: int, kind: str = "status", retry_after: float = None) -> float:
+        if kind == "throttled" and retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        base = {
+            "throttled": self.throttle_base_delay,
+            "connect": self.connect_base_delay,
+        }.get(kind, self.base_delay)
+        cap = min(self.max_delay, base * (2 ** (max(attempt, 1) - 1)))
+        return random.uniform(0, cap)
+
+    def take_budget(self) -> bool:
+        with self.lock:
+            if self.used >= self.retry_budget:
+                return False
+            self.used += 1
+            return True
+
+    def remaining(self) -> int:
+        with self.lock:
+            return max(self.retry_budget - self.used, 0)
+
 
 class CrawlerRuntime:
     def __init__(self, cfg: dict, log_q, logger_prefix: str = ""):
@@ -175,22 +905,94 @@ class CrawlerRuntime:
         self.logger_prefix = logger_prefix
 
         self.file_write_lock = threading.Lock()
-        self.seen_data_lock = threading.Lock()
-
-        self.seen_posts = set()
-        self.seen_comments = set()
-
-        self.pause_event = threading.Event()
-        self.stop_event = threading.Event()
+        self._writers = {}
+        self._closed_writer_bytes = 0
+        # 本次运行内去重：帖子 id / 评论 id（全站唯一），紧凑整数集合
+        self.seen_posts = CompactIdSet()
+        self.seen_comments = CompactIdSet()
+        self._seen_stats_cache = (0, 0)
+        self._seen_stats_ts = float("-inf")
+
+        # 暂停/停止：共享条件变量，事件驱动唤醒（不再轮询）
+        self.control_cond = threading.Condition()
+        self.pause_event = ControlEvent(self.control_cond)
+        self.stop_event = ControlEvent(self.control_cond, on_set=self._on_stop_requested)
+        self.stop_requested_ts = None
 
         self.consecutive_net_errors = 0
         self.consecutive_net_errors_lock = threading.Lock()
-        self.NETWORK_ERROR_LIMIT = 5
+
+        # 重试策略（cfg["retry_policy"] 可覆盖 RetryPolicy 的任意参数）
+        self.retry_policy = RetryPolicy(**(cfg.get("retry_policy") or {}))
 
         self.state_lock = threading.Lock()
 
         self.seen_post_ids = set()
-        self._active_keywords = set()
+        self._active_keywords = Counter()
+        # 有数据写入的 raw csv（关键词组可并行，按文件判断组是否命中）
+        self.data_files = set()
+
+        # =========================
+        # 连接池：每个代理身份一个 Session（keep-alive 复用 TCP/TLS）
+        # =========================
+        self.keep_alive = bool(cfg.get("keep_alive", True))
+        self.http_pool_size = max(int(cfg.get("http_pool_size") or 0), int(cfg.get("max_workers", 4)), 1)
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+        # 共享抓取线程池（cfg engine="pooled" 时由 run_crawler 创建）
+        self.fetch_engine = None
+        # listing 拉帖子详情的线程池：整个运行共用一个，首次用到时创建
+        self._detail_pool = None
+        self._detail_pool_lock = threading.Lock()
+
+        # 多进程解析阶段（cfg parse_processes>0 时由 run_crawler 创建）
+        self.parse_pool = None
+
+        # 断点续爬检查点（由 run_crawler 按输出目录创建）
+        self.checkpoint = None
+
+        # 帖子 JSON 磁盘缓存（默认关闭，cfg post_cache=True 开启；TTL 内会复用旧的帖子/评论数据）
+        self.post_cache = None
+        if cfg.get("post_cache", False):
+            try:
+                self.post_cache = PostJsonCache(
+                    cfg.get("post_cache_dir") or default_post_cache_dir(),
+                    ttl_s=float(cfg.get("post_cache_ttl_s", 86400)),
+                    max_bytes=int(float(cfg.get("post_cache_max_mb", 1024)) * 1024 * 1024),
+                )
+            except OSError as e:
+                self.post_cache = None
+                self.log(f"[缓存] 初始化失败，已禁用: {e}")
+
+        # 跨运行去重索引（cfg seen_store=路径或 True 开启；only_new=True 时跳过以往运行已导出的帖子/评论）
+        self.only_new = bool(cfg.get("only_new", False))
+        self.seen_store = None
+        store_path = cfg.get("seen_store") or self.only_new
+        if store_path:
+            try:
+                self.seen_store = SeenStore(default_seen_store_path() if store_path is True else store_path)
+            except (OSError, sqlite3.Error) as e:
+                self.seen_store = None
+                self.only_new = False
+                self.log(f"[去重库] 初始化失败，已禁用（本次全量抓取）: {e}")
+
+        # 帖子 JSON 并发合并 + 本次运行内 LRU
+        self.post_flight = SingleFlight(int(cfg.get("post_lru_size", 256)))
+
+        # Reddit 对同一客户端只允许一个并发的 /api/morechildren 请求
+        self.morechildren_lock = threading.Lock()
+
+        # 全局自适应限流（所有 robust_get 共用）
+        self.rate_limiter = AdaptiveRateLimiter(cfg.get("rate_limits"))
+
+        # 代理健康度 / 熔断
+        self.proxy_manager = ProxyManager(
+            PROXY_POOL,
+            fail_threshold=int(cfg.get("proxy_fail_threshold", 3)),
+            throttle_threshold=int(cfg.get("proxy_429_threshold", 3)),
+            quarantine_base=float(cfg.get("proxy_quarantine_s", 30)),
+        )
 
         # =========================
         # 运行态状态（新增，不影响爬取）
@@ -221,10 +1023,41 @@ class CrawlerRuntime:
             "end_ts": None,
             "status": "running",
 
-            "current_group_has_data": False,
             "current_keyword": None,
 
             "active_keywords": [],
+
+            "proxy_stats": self.proxy_manager.snapshot(),
+            "rate_limits": self.rate_limiter.snapshot(),
+
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "post_lru_hits": 0,
+            "post_fetch_shared": 0,
+            "info_requests": 0,
+            "prefilter_skipped": 0,
+            "morechildren_requests": 0,
+            "more_comments_expanded": 0,
+            "deep_thread_requests": 0,
+            "json_decoded_posts": 0,
+            "json_bytes": 0,
+            "json_decode_s": 0.0,
+            "parse_offloaded": 0,
+            "parse_offload_s": 0.0,
+            "parse_shm_bytes": 0,
+            "writer_queue_depth": 0,
+            "writer_bytes": 0,
+            "known_skipped": 0,
+            "rows_failed": 0,
+            "write_error": None,
+            "finalize_s": 0.0,
+
+            "retries": 0,
+            "backoff_s": 0.0,
+            "retry_budget_left": self.retry_policy.remaining(),
+
+            "stop_requested_ts": None,
+            "stop_to_idle_s": None,
         }
 
         self._emit_state()
@@ -282,18 +1115,493 @@ class CrawlerRuntime:
     def serialize_state(self):
         s = dict(self.runtime_state)
         s["hit_groups"] = len(s["hit_groups"])
+        s["seen_ids"], s["seen_mem_bytes"] = self._seen_stats(force=s.get("status") != "running")
         return s
 
+    def _seen_stats(self, force: bool = False):
+        # serialize_state 每条评论都会触发：去重集合的统计最多每秒重算一次（结束时强制刷新）
+        now = time.monotonic()
+        if force or now - self._seen_stats_ts >= SEEN_STATS_INTERVAL_S:
+            self._seen_stats_cache = (
+                len(self.seen_posts) + len(self.seen_comments),
+                self.seen_posts.memory_bytes() + self.seen_comments.memory_bytes(),
+            )
+            self._seen_stats_ts = now
+        return self._seen_stats_cache
+
     def wait_if_paused_or_stopped(self):
-        while self.pause_event.is_set() and (not self.stop_event.is_set()):
-            self.log("[系统] 暂停中…")
-            time.sleep(30)
+        if not self.pause_event.is_set() or self.stop_event.is_set():
+            return
+        self.log("[系统] 暂停中…")
+        with self.control_cond:
+            self.control_cond.wait_for(lambda: (not self.pause_event.is_set()) or self.stop_event.is_set())
+
+    def record_retry(self, wait_s: float):
+        with self.state_lock:
+            self.runtime_state["retries"] += 1
+            self.runtime_state["backoff_s"] = round(self.runtime_state["backoff_s"] + wait_s, 2)
+            self.runtime_state["retry_budget_left"] = self.retry_policy.remaining()
+
+    def _on_stop_requested(self):
+        self.stop_requested_ts = time.time()
+        with self.state_lock:
+            self.runtime_state["stop_requested_ts"] = self.stop_requested_ts
+
+    def mark_idle_after_stop(self):
+        """记录从点击停止到所有 worker 退出的耗时"""
+        if self.stop_requested_ts is None:
+            return
+        elapsed = time.time() - self.stop_requested_ts
+        self.log(f"[系统] 停止完成：stop -> idle {elapsed * 1000:.0f} ms")
+        self.update_state(stop_to_idle_s=round(elapsed, 3))
 
     def headers(self):
-        return {"User-Agent": random.choice(UA_POOL), "Connection": "close"}
+        return {"User-Agent": random.choice(UA_POOL), "Connection": "keep-alive" if self.keep_alive else "close"}
 
     def proxy(self):
-        return random.choice(PROXY_POOL) if PROXY_POOL else None
+        return self.proxy_manager.pick()
+
+    def report_proxy(self, proxy, outcome: str, latency: float = None):
+        wait = self.proxy_manager.report(proxy, outcome, latency)
+        if wait:
+            self.log(f"[代理隔离] {proxy_label(proxy)} | outcome={outcome} | 隔离 {wait:.0f}s")
+        with self.state_lock:
+            self.runtime_state["proxy_stats"] = self.proxy_manager.snapshot()
+
+    def session(self, proxy=None):
+        """
+        按代理身份取复用的 Session（同一个 iproyal session 共用一个连接池）。
+        Direct 请求用 key=None。
+        """
+        key = (proxy or {}).get("https") if proxy else None
+        with self._sessions_lock:
+            s = self._sessions.get(key)
+            if s is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=self.http_pool_size,
+                    pool_maxsize=self.http_pool_size,
+                    max_retries=0,
+                )
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                s.verify = False
+                if proxy:
+                    s.proxies.update(proxy)
+                self._sessions[key] = s
+            return s
+
+    def csv_writer(self, path: str):
+        with self.file_write_lock:
+            w = self._writers.get(path)
+            if w is None:
+                w = CsvRowWriter(
+                    self,
+                    path,
+                    queue_size=int(self.cfg.get("writer_queue_size", 256)),
+                    buffer_size=int(self.cfg.get("writer_buffer_bytes", 1 << 20)),
+                    flush_interval=float(self.cfg.get("writer_flush_s", 1.0)),
+                )
+                self._writers[path] = w
+            return w
+
+    def close_writers(self, paths=None):
+        """flush 并关闭写线程（paths=None 表示全部）；finalize 读 CSV 之前必须先关"""
+        with self.file_write_lock:
+            keys = list(self._writers) if paths is None else [p for p in paths if p in self._writers]
+            writers = [self._writers.pop(k) for k in keys]
+        for w in writers:
+            w.close()
+            self._closed_writer_bytes += w.bytes_written
+        self.update_writer_stats()
+
+    def sync_writer(self, path: str) -> int:
+        """等写线程把已排队的行刷到磁盘，返回文件当前字节数"""
+        with self.file_write_lock:
+            w = self._writers.get(path)
+        if w is not None:
+            return w.sync()
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def commit_seen(self, paths):
+        """这些输出文件已 finalize：把其中导出的帖子/评论 id 写入去重库"""
+        if self.seen_store is None:
+            return
+        try:
+            n = self.seen_store.commit(paths)
+            self.log(f"[去重库] 新记录 {n} 条 id -> {self.seen_store.path}")
+        except sqlite3.Error as e:
+            self.log(f"[去重库] 写入失败: {e}")
+
+    def detail_pool(self, workers: int) -> ThreadPoolExecutor:
+        with self._detail_pool_lock:
+            if self._detail_pool is None:
+                self._detail_pool = ThreadPoolExecutor(max_workers=max(int(workers), 1),
+                                                       thread_name_prefix="post-detail")
+            return self._detail_pool
+
+    def close_detail_pool(self):
+        with self._detail_pool_lock:
+            pool, self._detail_pool = self._detail_pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def close_seen_store(self):
+        if self.seen_store is not None:
+            self.seen_store.close()
+            self.seen_store = None
+
+    def update_writer_stats(self):
+        with self.file_write_lock:
+            writers = list(self._writers.values())
+        with self.state_lock:
+            self.runtime_state["writer_queue_depth"] = sum(w.q.qsize() for w in writers)
+            self.runtime_state["writer_bytes"] = self._closed_writer_bytes + sum(w.bytes_written for w in writers)
+
+    def close_sessions(self):
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for s in sessions:
+            try:
+                s.close()
+            except Exception:
+                pass
+
+class CrawlCheckpoint:
+    """
+    断点续爬（output_dir/_checkpoint/）：
+    - state.json：配置、每个任务（阶段 × raw csv × subreddit × keyword）的翻页游标与计数、
+      进行中关键词组 raw csv 已落盘的字节数、已 finalize 的关键词组及其输出、运行计数
+    - seen_posts.bin / seen_comments.bin：已 finalize 的关键词组导出过的 id
+    保存前先让写线程把排队的行刷盘，再记录文件长度；续爬时 raw csv 截断回该长度，
+    进行中各组的 seen id 从截断后的 csv 重建，保证游标、数据、去重集合三者一致。
+    重建口径与不中断的运行一致：seen_posts 只来自 posts 阶段 raw csv 的帖子行，
+    seen_comments 只来自 comments 阶段 raw csv（posts 阶段顺带抓的评论不进 seen_comments）。
+    多个关键词组并行时，.bin 只收录已 finalize 组 raw csv 里的 id（不直接落盘全局 seen：
+    其中可能有别的组还没写出的行，续爬时会被误跳过）。
+    """
+
+    VERSION = 2  # 2：seen_comments 只收 comments 阶段的评论
+    # 决定任务划分的配置；不一致的检查点不能续用
+    FINGERPRINT_KEYS = ("mode", "subreddits", "start_date", "end_date", "keyword_groups",
+                        "sort", "t", "post_count", "com_down", "allow_space_keyword", "listing_comments")
+    RESTORED_COUNTERS = ("posts_fetched", "comments_fetched", "comments_saved", "processed_groups")
+
+    def __init__(self, rt: CrawlerRuntime, output_dir: str, interval_s: float = 30.0):
+        self.rt = rt
+        self.dir = Path(output_dir) / "_checkpoint"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.interval_s = float(interval_s)
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.tasks = {}
+        self.finalized = {}  # file_prefix -> [输出文件]
+        self.files = []  # 进行中关键词组的 raw csv
+        # 已 finalize 关键词组导出过的 id（落盘为 .bin）
+        self.done_posts = CompactIdSet()
+        self.done_comments = CompactIdSet()
+        self._resume_sizes = {}
+        self._last_save = time.monotonic()
+        self.fingerprint = self._fingerprint(rt.cfg)
+
+    @classmethod
+    def _fingerprint(cls, cfg: dict) -> str:
+        picked = {k: cfg.get(k) for k in cls.FINGERPRINT_KEYS}
+        return hashlib.sha1(json.dumps(picked, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def saved_cfg(output_dir) -> dict:
+        """读取检查点里保存的配置（UI 续爬用）；没有检查点返回 None"""
+        try:
+            with open(Path(output_dir) / "_checkpoint" / "state.json", "r", encoding="utf-8") as f:
+                return json.load(f).get("cfg")
+        except (OSError, ValueError):
+            return None
+
+    def load(self) -> bool:
+        """载入检查点；不存在或配置不一致返回 False（按全新任务开始）"""
+        try:
+            with open(self.dir / "state.json", "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("version") != self.VERSION or state.get("fingerprint") != self.fingerprint:
+            self.rt.log("[续爬] 检查点与当前配置不一致，忽略并重新开始")
+            return False
+        self.tasks = state.get("tasks") or {}
+        self.finalized = state.get("finalized") or {}
+        self._resume_sizes = state.get("file_sizes") or {}
+        for name, sets in (("seen_posts", (self.rt.seen_posts, self.done_posts)),
+                           ("seen_comments", (self.rt.seen_comments, self.done_comments))):
+            path = self.dir / f"{name}.bin"
+            if path.exists():
+                for ids in sets:
+                    ids.load(path)
+        counters = state.get("counters") or {}
+        with self.rt.state_lock:
+            for k in self.RESTORED_COUNTERS:
+                if k in counters:
+                    self.rt.runtime_state[k] = counters[k]
+        self.rt.log(f"[续爬] 已载入检查点：已完成组={len(self.finalized)} | 任务游标={len(self.tasks)}")
+        return True
+
+    # ---------- 关键词组 ----------
+    def finalized_outputs(self, file_prefix: str):
+        return self.finalized.get(file_prefix)
+
+    def begin_group(self, paths) -> bool:
+        """
+        登记该组的 raw csv（[posts 阶段, comments 阶段]）；
+        若该组在检查点中做到一半，截断回检查点长度并重建 seen，返回 True
+        """
+        paths = list(paths)
+        with self.lock:
+            self.files.extend(paths)
+        names = {os.path.basename(p) for p in paths}
+        sizes = {p: self._resume_sizes.get(os.path.basename(p)) for p in paths}
+        if not all(sizes.values()) or not all(os.path.exists(p) for p in paths):
+            # 没有可用的半成品数据：该组的旧游标也作废，从头开始
+            with self.lock:
+                self.tasks = {k: v for k, v in self.tasks.items() if json.loads(k)[1] not in names}
+            return False
+        for p, size in sizes.items():
+            if os.path.getsize(p) > size:
+                os.truncate(p, size)
+        self._seen_from_group(paths, self.rt.seen_posts, self.rt.seen_comments)
+        self.rt.log(f"[续爬] raw csv 已恢复到检查点位置: {', '.join(os.path.basename(p) for p in paths)}")
+        return True
+
+    @classmethod
+    def _seen_from_group(cls, paths, posts: CompactIdSet, comments: CompactIdSet):
+        posts_csv, comments_csv = paths
+        cls._seen_from_csv(posts_csv, posts=posts)
+        cls._seen_from_csv(comments_csv, comments=comments)
+
+    @staticmethod
+    def _seen_from_csv(path: str, posts: CompactIdSet = None, comments: CompactIdSet = None):
+        """posts：收帖子行（无 comment_id）的 post_id；comments：收评论行的 comment_id"""
+        if not os.path.exists(path):
+            return
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for r in reader:
+                if len(r) <= _ROW_COMMENT_ID:
+                    continue
+                if r[_ROW_COMMENT_ID]:
+                    if comments is not None:
+                        comments.add_if_absent(r[_ROW_COMMENT_ID])
+                elif r[_ROW_POST_ID] and posts is not None:
+                    posts.add_if_absent(r[_ROW_POST_ID])
+
+    def seal_group(self, paths):
+        """该组抓取结束、finalize（会删除 raw csv）之前：记下其中导出的 id"""
+        self._seen_from_group(paths, self.done_posts, self.done_comments)
+
+    def finish_group(self, file_prefix: str, outputs, paths):
+        """该组已 finalize：记录输出、落盘已完成 id，清掉该组任务游标"""
+        names = {os.path.basename(p) for p in paths}
+        with self.lock:
+            self.finalized[file_prefix] = list(outputs)
+            self.tasks = {k: v for k, v in self.tasks.items() if json.loads(k)[1] not in names}
+            self.files = [p for p in self.files if os.path.basename(p) not in names]
+        self.done_posts.dump(self.dir / "seen_posts.bin")
+        self.done_comments.dump(self.dir / "seen_comments.bin")
+        self.save()
+
+    # ---------- 任务游标 ----------
+    def cursor(self, task: str) -> dict:
+        with self.lock:
+            return dict(self.tasks.get(task) or {})
+
+    def update(self, task: str, **cursor):
+        with self.lock:
+            self.tasks[task] = cursor
+        if time.monotonic() - self._last_save >= self.interval_s:
+            self.save(blocking=False)
+
+    def save(self, blocking: bool = True):
+        if not self.save_lock.acquire(blocking=blocking):
+            return  # 其他线程正在保存
+        try:
+            with self.lock:
+                tasks = json.loads(json.dumps(self.tasks))
+                finalized = dict(self.finalized)
+                files = list(self.files)
+            # 先取游标快照再刷盘：快照里的每一页都已经排进写队列，sync 之后一定在文件里
+            sizes = {os.path.basename(p): self.rt.sync_writer(p) for p in files}
+            with self.rt.state_lock:
+                counters = {k: self.rt.runtime_state.get(k) for k in self.RESTORED_COUNTERS}
+            cfg = {k: v for k, v in self.rt.cfg.items() if k not in ("output_dir", "resume")}
+            state = {
+                "version": self.VERSION,
+                "fingerprint": self.fingerprint,
+                "saved_at": time.time(),
+                "cfg": json.loads(json.dumps(cfg, ensure_ascii=False, default=str)),
+                "tasks": tasks,
+                "file_sizes": sizes,
+                "finalized": finalized,
+                "counters": counters,
+            }
+            tmp = self.dir / "state.json.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp, self.dir / "state.json")
+            self._last_save = time.monotonic()
+        except Exception as e:
+            self.rt.log(f"[检查点] 保存失败: {e}")
+        finally:
+            self.save_lock.release()
+
+    def clear(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def checkpoint_task(kind: str, out_csv: str, subreddit, keyword) -> str:
+    # JSON 数组做键：组名/关键词里有任何字符都不会串
+    return json.dumps([kind, os.path.basename(out_csv), subreddit or "", keyword], ensure_ascii=False)
+
+
+def task_cursor(rt: CrawlerRuntime, task: str) -> dict:
+    return rt.checkpoint.cursor(task) if rt.checkpoint is not None else {}
+
+
+def save_cursor(rt: CrawlerRuntime, task: str, **cursor):
+    if rt.checkpoint is not None:
+        rt.checkpoint.update(task, **cursor)
+
+
+def finish_task(rt: CrawlerRuntime, task: str):
+    # 停止导致的退出不算完成，续爬时从最后的游标继续
+    if rt.checkpoint is not None and not rt.stop_event.is_set():
+        rt.checkpoint.update(task, done=True)
+
+
+class PooledFetchEngine:
+    """
+    共享抓取线程池（cfg engine="pooled"）：所有关键词任务共用一个有界的请求线程池（全局并发上限）。
+    - submit(fn, *args)：在任务线程池上跑关键词任务（调度器的 worker），返回 Future
+    - map(fn, arg_tuples)：整批并发执行（受全局并发上限限制），按输入顺序返回结果，异常记为 None
+    requests 是阻塞的，每个在途请求占一个线程：fetch_concurrency 即在途请求上限（默认 32）。
+    """
+
+    def __init__(self, rt: CrawlerRuntime, concurrency: int = 32, job_workers: int = 4):
+        self.rt = rt
+        self.concurrency = max(int(concurrency), 1)
+        self.job_workers = max(int(job_workers), 1)
+        self.fetch_executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="fetch")
+        self.job_executor = ThreadPoolExecutor(max_workers=self.job_workers, thread_name_prefix="crawl")
+
+    def submit(self, fn, *args):
+        return self.job_executor.submit(fn, *args)
+
+    def map(self, fn, arg_tuples):
+        futures = [self.fetch_executor.submit(fn, *a) for a in arg_tuples]
+        out = []
+        for fu in futures:
+            try:
+                out.append(fu.result())
+            except Exception as e:
+                self.rt.log(f"[抓取池] 任务异常: {e}")
+                out.append(None)
+        return out
+
+    def close(self):
+        self.fetch_executor.shutdown(wait=False, cancel_futures=True)
+        self.job_executor.shutdown(wait=False, cancel_futures=True)
+
+
+# =========================
+# 多进程解析（cfg parse_processes=N 开启；默认在抓取线程里解析）
+# =========================
+PARSE_SHM_MIN_BYTES = 64 * 1024  # 超过这个大小的载荷走共享内存
+
+
+def _parse_payload(kind: str, payload: bytes, encoding=None, parser=None):
+    if kind == "post_json":
+        return project_post_json(fast_json_loads(payload))
+    # 与 requests 的 resp.text 一致：按响应编码解码，坏字节替换
+    text = str(payload, encoding or "utf-8", errors="replace")
+    if kind == "posts_page":
+        return parse_posts_search_page_with_cursor(text, parser or "fast")
+    if kind == "comments_page":
+        return parse_comments_search_page_with_cursor(text, parser or "fast")
+    raise ValueError(f"unknown parse kind: {kind}")
+
+
+def _timed_parse(kind: str, payload: bytes, encoding=None, parser=None):
+    """返回 (解析结果, 纯解析耗时秒)；耗时只含解码/解析，不含进程间传输"""
+    t0 = time.perf_counter()
+    result = _parse_payload(kind, payload, encoding, parser)
+    return result, time.perf_counter() - t0
+
+
+def _parse_job(kind: str, payload, encoding=None, parser=None, shm_name=None, size=0):
+    """子进程入口：payload 为 None 时按块名附着共享内存读取"""
+    if shm_name is not None:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            payload = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+    return _timed_parse(kind, payload, encoding, parser)
+
+
+class ParsePool:
+    """
+    多进程解析阶段：抓取线程把原始字节交给进程池，阻塞等解析结果（等待时不占 GIL，其他线程照常做网络 I/O）。
+    - 解析的是搜索结果页 HTML 和帖子 JSON（解码 + 投影），回传的是页面元信息 / 投影后的 JSON
+    - 载荷 >= shm_min_bytes 时写进 shared_memory，只把块名传给子进程，不经管道 pickle
+    - 子进程用 spawn 启动（父进程里有大量线程，fork 不安全）；进程池损坏或已关闭时退回当前线程解析
+    - run 返回 (结果, 纯解析耗时)；往返多出来的传输/排队时间计入 parse_offload_s
+    """
+
+    def __init__(self, rt: CrawlerRuntime, processes: int, shm_min_bytes: int = PARSE_SHM_MIN_BYTES):
+        self.rt = rt
+        self.processes = max(int(processes), 1)
+        self.shm_min_bytes = int(shm_min_bytes)
+        self.executor = ProcessPoolExecutor(max_workers=self.processes,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        self._broken = False
+
+    def run(self, kind: str, payload: bytes, encoding=None, parser=None):
+        if self._broken:
+            return _timed_parse(kind, payload, encoding, parser)
+        shm = fut = None
+        t0 = time.perf_counter()
+        try:
+            if len(payload) >= self.shm_min_bytes:
+                shm = shared_memory.SharedMemory(create=True, size=len(payload))
+                shm.buf[:len(payload)] = payload
+                fut = self.executor.submit(_parse_job, kind, None, encoding, parser, shm.name, len(payload))
+            else:
+                fut = self.executor.submit(_parse_job, kind, payload, encoding, parser)
+            result, parse_s = fut.result()
+        except RuntimeError as e:
+            # BrokenProcessPool（子进程被杀等）或 "cannot schedule new futures after shutdown"
+            # （运行收尾时还有线程在解析）：后续都在当前线程解析
+            if fut is not None and not isinstance(e, BrokenProcessPool):
+                raise  # 解析本身抛出的 RuntimeError，照常上抛
+            if not self._broken:
+                self._broken = True
+                self.rt.log(f"[解析] 进程池不可用，改为线程内解析: {e}")
+            return _timed_parse(kind, payload, encoding, parser)
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        with self.rt.state_lock:
+            self.rt.runtime_state["parse_offloaded"] += 1
+            self.rt.runtime_state["parse_offload_s"] = round(
+                self.rt.runtime_state["parse_offload_s"] + max(time.perf_counter() - t0 - parse_s, 0.0), 4)
+            if shm is not None:
+                self.rt.runtime_state["parse_shm_bytes"] += len(payload)
+        return result, parse_s
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 
 def parse_date_to_timestamp(date_str, end_of_day=False):
     dt = datetime.strptime(date_str, "%Y-%m-%d")
@@ -319,85 +1627,276 @@ def clean_text(s):
 def is_blocked_author(author: str) -> bool:
     return author in {"AutoModerator", "timee_bot"} if author else False
 
-def robust_get(rt: CrawlerRuntime, url, max_retries=4, timeout=8):
+def robust_get(rt: CrawlerRuntime, url, max_retries=4, timeout=8, request_lock=None):
+    """
+    timeout 为读超时；连接超时由 rt.retry_policy.connect_timeout 控制。
+    重试间隔由 RetryPolicy 决定（指数退避 + full jitter，429 优先遵守 Retry-After），
+    且整次运行共享一个重试预算，预算用完后失败请求不再重试。
+    request_lock：只在请求在途时持有（每次尝试单独获取），退避等待期间不占用。
+    """
     if rt.stop_event.is_set():
         return None, False, None
 
+    policy = rt.retry_policy
     display_url = url if len(url) < 160 else f"{url[:150]}..."
+    endpoint = classify_endpoint(url)
     for attempt in range(1, max_retries + 1):
         if rt.stop_event.is_set():
             return None, False, None
         rt.wait_if_paused_or_stopped()
 
-        interruptible_sleep(rt, random.uniform(0.05, 0.15), step=0.05)
+        proxy = rt.proxy()
+        client = proxy_label(proxy)
+        # 全局限流：替代原来每个请求前的随机小睡；该出口配额见底时等到 reset
+        rt.rate_limiter.acquire(rt, endpoint, client)
         if rt.stop_event.is_set():
             return None, False, None
 
-        proxy = rt.proxy()
         rt.log(f"[请求] {'Proxy' if proxy else 'Direct'} | {display_url} | attempt={attempt}/{max_retries}")
 
+        t0 = time.time()
         try:
-            resp = requests.get(
-                url,
-                headers=rt.headers(),
-                proxies=proxy,
-                timeout=timeout,
-                verify=False
-            )
+            with request_lock or contextlib.nullcontext():
+                resp = rt.session(proxy).get(
+                    url,
+                    headers=rt.headers(),
+                    proxies=proxy,
+                    timeout=(policy.connect_timeout, timeout),
+                    verify=False
+                )
+            latency = time.time() - t0
+            old_rate, new_rate, block_s = rt.rate_limiter.on_response(endpoint, resp.status_code, resp.headers, client)
+            if block_s:
+                # 只暂停这个出口；有代理池时其他代理照常被挑选
+                rt.proxy_manager.hold(proxy, block_s)
+                rt.log(f"[限额] {client} | {endpoint} 配额见底，暂停 {block_s:.0f}s")
+            if new_rate < old_rate:
+                rt.log(f"[限速] {endpoint} | {old_rate:.2f} -> {new_rate:.2f} req/s")
+            if new_rate != old_rate:
+                with rt.state_lock:
+                    rt.runtime_state["rate_limits"] = rt.rate_limiter.snapshot()
 
             if rt.stop_event.is_set():
                 return None, False, None
 
             if resp.status_code == 200:
+                rt.report_proxy(proxy, "ok", latency)
                 with rt.consecutive_net_errors_lock:
                     rt.consecutive_net_errors = 0
                 rt.log(f"[成功] status=200 | {display_url}")
                 return resp, True, 200
 
             if resp.status_code in (404, 410):
+                rt.report_proxy(proxy, "ok", latency)
                 rt.log(f"[失败] status={resp.status_code} | {display_url}")
                 return None, False, resp.status_code
 
-            if resp.status_code == 429:
-                with rt.consecutive_net_errors_lock:
-                    rt.consecutive_net_errors += 1
-                    cur_err = rt.consecutive_net_errors
-                rt.log(f"[限流] status=429 | 连续错误={cur_err}")
-
-                wait_time = random.uniform(8, 15)
-                rt.log(f"[冷却] {wait_time:.1f}s 后重试…")
-                interruptible_sleep(rt, wait_time, step=0.2)
-                continue
-
             with rt.consecutive_net_errors_lock:
                 rt.consecutive_net_errors += 1
                 cur_err = rt.consecutive_net_errors
-            rt.log(f"[失败] status={resp.status_code} | 连续错误={cur_err}")
 
+            if resp.status_code == 429:
+                rt.report_proxy(proxy, "throttled", latency)
+                rt.log(f"[限流] status=429 | 连续错误={cur_err}")
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                wait_time = policy.backoff(attempt, kind="throttled", retry_after=retry_after)
+            else:
+                rt.report_proxy(proxy, "fail", latency)
+                rt.log(f"[失败] status={resp.status_code} | 连续错误={cur_err}")
+                wait_time = policy.backoff(attempt, kind="status")
+
+        except requests.exceptions.ConnectTimeout as e:
+            # 连不上：多半是出口节点问题，换代理快速重试
+            rt.report_proxy(proxy, "fail", time.time() - t0)
+            rt.log(f"[连接超时] {e}")
+            wait_time = policy.backoff(attempt, kind="connect")
+        except requests.exceptions.ReadTimeout as e:
+            # 已连上但读超时：服务端慢，正常退避
+            rt.report_proxy(proxy, "fail", time.time() - t0)
+            rt.log(f"[读超时] {e}")
+            wait_time = policy.backoff(attempt, kind="read")
         except requests.RequestException as e:
+            rt.report_proxy(proxy, "fail", time.time() - t0)
             rt.log(f"[网络错误] {e}")
-            interruptible_sleep(rt, random.uniform(0.2, 1), step=0.2)
+            kind = "connect" if isinstance(e, requests.exceptions.ConnectionError) else "read"
+            wait_time = policy.backoff(attempt, kind=kind)
+
+        if attempt >= max_retries:
+            break
+        if not policy.take_budget():
+            rt.log(f"[重试预算] 本次运行重试预算已用完（{policy.retry_budget}），不再重试：{display_url}")
+            break
+        rt.record_retry(wait_time)
+        rt.log(f"[退避] {wait_time:.2f}s 后重试…")
+        interruptible_sleep(rt, wait_time)
 
     rt.log(f"[失败] 多次重试仍失败：{display_url}")
     return None, False, None
 
 
 def fetch_post_json(rt: CrawlerRuntime, subreddit, post_id):
+    """
+    同一 post_id 的并发请求只下载一次（其他线程等待并共享解析结果），
+    最近的结果留在本次运行的内存 LRU 中。返回的数据各调用方共享，只读使用。
+    """
+    data, how = rt.post_flight.do(post_id, lambda: _download_post_json(rt, subreddit, post_id))
+    if how != "fetched":
+        key = "post_lru_hits" if how == "lru" else "post_fetch_shared"
+        with rt.state_lock:
+            rt.runtime_state[key] += 1
+    return data
+
+
+# post_info_from_data 用到的帖子字段
+POST_FIELDS = (
+    "id", "subreddit", "author", "author_flair_text", "title", "selftext",
+    "ups", "downs", "score", "created_utc", "permalink",
+)
+
+
+def fast_json_loads(raw):
+    """装了 orjson 就用 orjson，否则退回标准库 json"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def fast_json_dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _project_comment_children(children):
+    """只保留评论树里 COMMENT_FIELDS / replies / more 的 children，结构不变（迭代实现）"""
+    out = []
+    stack = [(children or (), out)]
+    while stack:
+        items, dst = stack.pop()
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            kind = item.get("kind")
+            d = item.get("data") or {}
+            if kind == "t1":
+                pd_ = {k: d[k] for k in COMMENT_FIELDS if k in d}
+                replies = d.get("replies")
+                if isinstance(replies, dict):
+                    sub = []
+                    pd_["replies"] = {"kind": "Listing", "data": {"children": sub}}
+                    stack.append(((replies.get("data") or {}).get("children") or (), sub))
+                dst.append({"kind": "t1", "data": pd_})
+            elif kind == "more":
+                # 保留 id / parent_id：children 为空的 “继续这个讨论串” 节点要靠 parent_id 拉子树
+                md = {k: d[k] for k in MORE_FIELDS if k in d}
+                md["children"] = list(d.get("children") or [])
+                dst.append({"kind": "more", "data": md})
+            elif kind == "Listing":
+                sub = []
+                dst.append({"kind": "Listing", "data": {"children": sub}})
+                stack.append(((d.get("children") or ()), sub))
+    return out
+
+
+def project_post_json(data):
+    """
+    thread JSON [post_listing, comments_listing] -> 只含 POST_FIELDS / COMMENT_FIELDS 的同结构数据。
+    丢掉 media_metadata、awards 等用不到的大字段，LRU / 缓存里也只存投影后的结果。
+    幂等：对已投影的数据再投影结果不变。
+    """
+    if not (isinstance(data, list) and len(data) >= 2):
+        return None
+    try:
+        p = data[0]["data"]["children"][0]["data"]
+    except Exception:
+        return None
+    post = {k: p[k] for k in POST_FIELDS if k in p}
+    try:
+        children = data[1]["data"]["children"]
+    except Exception:
+        children = []
+    return [
+        {"kind": "Listing", "data": {"children": [{"kind": "t3", "data": post}]}},
+        {"kind": "Listing", "data": {"children": _project_comment_children(children)}},
+    ]
+
+
+def decode_post_json(rt: CrawlerRuntime, raw: bytes, post_id, source: str = "net"):
+    """解码 + 投影帖子 JSON，并记录每帖的字节数与解码耗时（走进程池时只计子进程内的解析，不含进程间往返）"""
+    if rt.parse_pool is not None:
+        data, elapsed = rt.parse_pool.run("post_json", raw)
+    else:
+        t0 = time.perf_counter()
+        data = project_post_json(fast_json_loads(raw))
+        elapsed = time.perf_counter() - t0
+    with rt.state_lock:
+        rt.runtime_state["json_decoded_posts"] += 1
+        rt.runtime_state["json_bytes"] += len(raw)
+        rt.runtime_state["json_decode_s"] = round(rt.runtime_state["json_decode_s"] + elapsed, 4)
+    rt.log(f"[JSON] post={post_id} | src={source} | bytes={len(raw)} | decode_ms={elapsed * 1000:.1f}")
+    return data
+
+
+def _download_post_json(rt: CrawlerRuntime, subreddit, post_id):
     # 如果 subreddit 是 None，就不加入 /r/{subreddit} 部分
     if subreddit:
         url = f"https://www.reddit.com/r/{subreddit}/comments/{post_id}.json?limit=500"
     else:
         url = f"https://www.reddit.com/comments/{post_id}.json?limit=500"  # 直接构建全站帖子 URL
 
+    cache = rt.post_cache
+    if cache is not None:
+        raw = cache.get(post_id)
+        if raw is not None:
+            try:
+                data = decode_post_json(rt, raw, post_id, source="cache")
+            except ValueError:
+                data = None
+            if data is not None:
+                with rt.state_lock:
+                    rt.runtime_state["cache_hits"] += 1
+                return data
+        with rt.state_lock:
+            rt.runtime_state["cache_misses"] += 1
+
     resp, ok, _ = robust_get(rt, url, max_retries=3)
     if not ok or not resp:
         return None
     try:
-        data = resp.json()
-        return data if isinstance(data, list) and len(data) >= 2 else None
+        data = decode_post_json(rt, resp.content, post_id)
+        if data is None:
+            return None
     except Exception as e:
         rt.log(f"[解析错误] JSON 失败: {e}")
         return None
+    if cache is not None:
+        # 缓存里只存投影后的 JSON：体积更小，命中时解码也更快
+        cache.put(post_id, fast_json_dumps(data))
+    return data
+
+
+def prefetch_post_jsons(rt: CrawlerRuntime, keys):
+    """
+    keys: [(subreddit, post_id), ...]
+    仅在共享抓取池（engine="pooled"）下整批并发预取，返回 {(subreddit, post_id): data}；默认引擎返回空 dict（保持逐条抓取）。
+    """
+    if rt.fetch_engine is None or not keys:
+        return {}
+    uniq = list(dict.fromkeys(keys))
+    results = rt.fetch_engine.map(fetch_post_json, [(rt, sub, pid) for sub, pid in uniq])
+    return dict(zip(uniq, results))
+
+
+def fetch_post_jsons_bounded(rt: CrawlerRuntime, keys, workers: int = 4):
+    """
+    keys: [(subreddit, post_id), ...] -> 按顺序返回 data 列表（失败为 None）。
+    共享抓取池下走池的全局并发；否则用运行内共用的 workers 线程详情池（不再每页新建）。
+    """
+    if not keys:
+        return []
+    if rt.fetch_engine is not None:
+        return rt.fetch_engine.map(fetch_post_json, [(rt, sub, pid) for sub, pid in keys])
+    return list(rt.detail_pool(workers).map(lambda k: fetch_post_json(rt, k[0], k[1]), keys))
 
 
 def extract_post_info_from_json(data, subreddit, post_id, original_url=None):
@@ -405,6 +1904,11 @@ def extract_post_info_from_json(data, subreddit, post_id, original_url=None):
         p = data[0]["data"]["children"][0]["data"]
     except Exception:
         return None
+    return post_info_from_data(p, subreddit, post_id, original_url)
+
+
+def post_info_from_data(p, subreddit, post_id, original_url=None):
+    """帖子 data（thread JSON / listing / api/info 的 t3 data 结构一致）-> post_info"""
     return {
         "subreddit": p.get("subreddit", subreddit),
         "post_id": post_id,
@@ -419,30 +1923,280 @@ def extract_post_info_from_json(data, subreddit, post_id, original_url=None):
         "post_url": original_url or ("https://www.reddit.com" + p.get("permalink", "")),
     }
 
-def _build_comment_url(post_url: str, comment: dict) -> str:
-    """Build a stable comment URL.
-    Prefer Reddit's permalink field when available.
+def fetch_things_by_fullname(rt: CrawlerRuntime, fullnames):
     """
-    try:
-        if isinstance(comment, dict):
-            permalink = comment.get("permalink")
-            if permalink:
-                return "https://www.reddit.com" + str(permalink)
-    except Exception:
-        pass
+    通过 /api/info.json 批量取 t1_/t3_ 对象，每次最多 100 个。
+    返回 {fullname: data}；缺失（删除/失败）的不在结果里。
+    """
+    out = {}
+    names = list(dict.fromkeys(fullnames))
+    for i in range(0, len(names), INFO_BATCH_SIZE):
+        if rt.stop_event.is_set():
+            break
+        batch = names[i:i + INFO_BATCH_SIZE]
+        url = "https://www.reddit.com/api/info.json?" + urlencode({"id": ",".join(batch)})
+        resp, ok, status = robust_get(rt, url, max_retries=3, timeout=10)
+        if not ok or not resp:
+            rt.log(f"[Info] 批量获取失败 size={len(batch)} status={status}")
+            continue
+        try:
+            children = (resp.json() or {}).get("data", {}).get("children", [])
+        except Exception as e:
+            rt.log(f"[Info] JSON 解析失败: {e}")
+            continue
+        for item in children:
+            d = (item or {}).get("data") or {}
+            name = d.get("name")
+            if name:
+                out[name] = d
+        with rt.state_lock:
+            rt.runtime_state["info_requests"] += 1
+    return out
+
 
-    # Fallback: best-effort. If we can't reliably construct it, return empty.
+def iter_matched_comments(rt: CrawlerRuntime, ptc: dict):
+    """
+    评论搜索页命中的 {(sub_name, pid): [cid...]} -> 逐帖产出 (new_cids, post_info, matched_comments)
+    - 帖子与评论都保持搜索结果里的顺序（输出行序、连续旧评论的提前停止都依赖它）
+    - 先按 rt.seen_comments（评论 id）去掉已处理的评论
+    - cfg comment_hydration="info"：整页命中的 t1_/t3_ 一次性走 /api/info 批量补全
+    - 默认 "thread"：逐帖下载完整 thread 再筛出命中的评论（共享抓取池下整页并发预取）
+    - only_new 模式下以往运行已导出过的评论也跳过
+    post_info 为 None 表示该帖获取失败。
+    """
+    known = skip_known(rt, "c", [cid for cids in ptc.values() for cid in cids])
+
+    def take_new(sub_name, pid, cids):
+        return [cid for cid in cids if cid not in known and rt.seen_comments.add_if_absent(cid)]
+
+    if rt.cfg.get("comment_hydration", "thread") == "info":
+        refs = []
+        for (sub_name, pid), cids in ptc.items():
+            new_cids = take_new(sub_name, pid, cids)
+            if new_cids:
+                refs.append((sub_name, pid, new_cids))
+        names = []
+        for sub_name, pid, new_cids in refs:
+            names.append(f"t3_{pid}")
+            names.extend(f"t1_{cid}" for cid in new_cids)
+        things = fetch_things_by_fullname(rt, names)
+        for sub_name, pid, new_cids in refs:
+            p = things.get(f"t3_{pid}")
+            if p is None:
+                yield new_cids, None, []
+                continue
+            post_info = post_info_from_data(p, sub_name, pid)
+            matched = [things[f"t1_{cid}"] for cid in new_cids if f"t1_{cid}" in things]
+            yield new_cids, post_info, matched
+        return
+
+    todo = [k for k, cids in ptc.items()
+            if any(cid not in known and cid not in rt.seen_comments for cid in cids)]
+    prefetched = prefetch_post_jsons(rt, todo)
+
+    for (sub_name, pid), cids in ptc.items():
+        if rt.stop_event.is_set():
+            return
+        new_cids = take_new(sub_name, pid, cids)
+        if not new_cids:
+            continue
+
+        if (sub_name, pid) in prefetched:
+            data = prefetched[(sub_name, pid)]
+        else:
+            data = fetch_post_json(rt, sub_name, pid)
+        post_info = extract_post_info_from_json(data, sub_name, pid) if data else None
+        if not post_info:
+            yield new_cids, None, []
+            continue
+
+        yield new_cids, post_info, list(thread_comments(rt, data, pid, want_ids=new_cids))
+
+
+def _build_comment_url(permalink) -> str:
+    """Build a stable comment URL from Reddit's permalink field.
+    If we can't reliably construct it, return empty.
+    """
+    if permalink:
+        return "https://www.reddit.com" + str(permalink)
     return ""
 
-def flatten_comments(children, out_list):
-    for item in children:
-        if item.get("kind") == "t1":
-            data = item.get("data", {})
-            out_list.append(data)
-            if isinstance(data.get("replies"), dict):
-                flatten_comments(data.get("replies", {}).get("data", {}).get("children", []), out_list)
-        elif item.get("kind") == "Listing":
-            flatten_comments(item.get("data", {}).get("children", []), out_list)
+# prepare_row 用到的评论字段；遍历时只保留这些，避免整棵 thread 的原始 dict 被继续引用
+COMMENT_FIELDS = (
+    "id", "parent_id", "author", "author_flair_text", "body",
+    "ups", "downs", "score", "created_utc", "permalink",
+)
+
+# more 节点保留的字段
+MORE_FIELDS = ("id", "parent_id", "count", "children")
+
+_STACK_END = object()
+
+
+def _keep_comment(c, start_ts=None, end_ts=None, skip_blocked=False, want_ids=None) -> bool:
+    if want_ids is not None and c.get("id") not in want_ids:
+        return False
+    if skip_blocked and is_blocked_author(c.get("author")):
+        return False
+    if start_ts is not None or end_ts is not None:
+        c_ts = float(c.get("created_utc") or 0)
+        if (start_ts is not None and c_ts < start_ts) or (end_ts is not None and c_ts > end_ts):
+            return False
+    return True
+
+
+def _collect_more(data, more_ids, deep_parents):
+    """more 节点：有 children 的收集折叠 id；children 为空的是 “继续这个讨论串”，收集其父评论 id"""
+    kids = data.get("children") or []
+    if kids:
+        more_ids.extend(kids)
+        return
+    parent = str(data.get("parent_id") or "")
+    if deep_parents is not None and parent.startswith("t1_"):
+        deep_parents.append(parent[3:])
+
+
+def iter_comments(children, more_ids=None, seen_ids=None,
+                  start_ts=None, end_ts=None, skip_blocked=False, want_ids=None, deep_parents=None):
+    """
+    迭代（非递归）深度优先遍历评论树，顺序与原递归版一致（先父后子）。
+    - 只产出 COMMENT_FIELDS 里的字段
+    - 过滤条件（时间窗口 / 屏蔽作者 / 指定 id）在遍历中直接生效
+    - more_ids 不为 None 时收集 kind=="more" 折叠节点的评论 id；
+      deep_parents 不为 None 时收集 “继续这个讨论串” 节点（children 为空）的父评论 id
+    - seen_ids 不为 None 时记录遍历到的所有评论 id（含被过滤掉的）
+    """
+    stack = [iter(children or ())]
+    while stack:
+        item = next(stack[-1], _STACK_END)
+        if item is _STACK_END:
+            stack.pop()
+            continue
+        if not isinstance(item, dict):
+            continue
+        kind = item.get("kind")
+        if kind == "t1":
+            data = item.get("data") or {}
+            c = {k: data.get(k) for k in COMMENT_FIELDS}
+            if seen_ids is not None:
+                seen_ids.add(c["id"])
+            replies = data.get("replies")
+            if _keep_comment(c, start_ts, end_ts, skip_blocked, want_ids):
+                yield c
+            if isinstance(replies, dict):
+                stack.append(iter((replies.get("data") or {}).get("children") or ()))
+        elif kind == "Listing":
+            stack.append(iter((item.get("data") or {}).get("children") or ()))
+        elif kind == "more" and more_ids is not None:
+            _collect_more(item.get("data") or {}, more_ids, deep_parents)
+
+
+def fetch_more_children(rt: CrawlerRuntime, post_id, ids):
+    """一次 /api/morechildren 调用（最多 MORECHILDREN_BATCH_SIZE 个 id），返回 things 列表"""
+    params = {
+        "api_type": "json",
+        "link_id": f"t3_{post_id}",
+        "children": ",".join(ids),
+        "limit_children": "false",
+    }
+    url = "https://www.reddit.com/api/morechildren.json?" + urlencode(params)
+    resp, ok, status = robust_get(rt, url, max_retries=3, timeout=10, request_lock=rt.morechildren_lock)
+    with rt.state_lock:
+        rt.runtime_state["morechildren_requests"] += 1
+    if not ok or not resp:
+        rt.log(f"[More] post={post_id} | size={len(ids)} | RESULT=FAIL status={status}")
+        return []
+    try:
+        return ((resp.json() or {}).get("json", {}).get("data", {}) or {}).get("things", []) or []
+    except Exception as e:
+        rt.log(f"[More] JSON 解析失败: {e}")
+        return []
+
+
+def fetch_comment_subtree(rt: CrawlerRuntime, post_id, parent_id):
+    """“继续这个讨论串”：/comments/<post>/_/<parent>.json 拉取父评论下的整棵子树，返回评论 children"""
+    url = f"https://www.reddit.com/comments/{post_id}/_/{parent_id}.json?limit=500"
+    resp, ok, status = robust_get(rt, url, max_retries=3, timeout=10)
+    with rt.state_lock:
+        rt.runtime_state["deep_thread_requests"] += 1
+    if not ok or not resp:
+        rt.log(f"[More] post={post_id} | parent={parent_id} | 子树 RESULT=FAIL status={status}")
+        return []
+    try:
+        return resp.json()[1]["data"]["children"] or []
+    except Exception as e:
+        rt.log(f"[More] 子树 JSON 解析失败: {e}")
+        return []
+
+
+def expand_more_comments(rt: CrawlerRuntime, post_id, more_ids, known_ids=None, deep_parents=()):
+    """
+    把 more 折叠节点批量展开成评论：
+    - 有 children 的 more：/api/morechildren 每批最多 100 个 id，逐批串行（Reddit 只允许一个并发）
+    - “继续这个讨论串”（children 为空）：按父评论拉子树，有界并发（共享抓取池 / more_workers 个线程）
+    - 按 id 去重；展开结果里新出现的 more 继续下一轮，最多 MORECHILDREN_MAX_ROUNDS 轮
+    返回新增的评论列表（与 iter_comments 产出的结构一致）。
+    """
+    known = set(known_ids or ())
+    requested, expanded_parents = set(), set()
+    out = []
+    pending = [i for i in dict.fromkeys(more_ids) if i and i != "_"]
+    deep = list(deep_parents or ())
+    workers = int(rt.cfg.get("more_workers", 4))
+    for _ in range(MORECHILDREN_MAX_ROUNDS):
+        pending = [i for i in pending if i not in known and i not in requested]
+        deep = [p for p in dict.fromkeys(deep) if p not in expanded_parents]
+        if (not pending and not deep) or rt.stop_event.is_set():
+            break
+        requested.update(pending)
+        expanded_parents.update(deep)
+
+        batches = [pending[i:i + MORECHILDREN_BATCH_SIZE] for i in range(0, len(pending), MORECHILDREN_BATCH_SIZE)]
+        results = [fetch_more_children(rt, post_id, b) for b in batches]
+        if deep and rt.fetch_engine is not None:
+            results += rt.fetch_engine.map(fetch_comment_subtree, [(rt, post_id, p) for p in deep])
+        elif deep:
+            with ThreadPoolExecutor(max_workers=max(min(workers, len(deep)), 1), thread_name_prefix="more") as ex:
+                results += list(ex.map(lambda p: fetch_comment_subtree(rt, post_id, p), deep))
+
+        pending, deep = [], []
+        for things in results:
+            # morechildren 返回扁平的 t1 / more；子树返回以父评论为根的树（父评论已在 known 里）
+            for c in iter_comments(things or [], pending, deep_parents=deep):
+                cid = c.get("id")
+                if cid and cid not in known:
+                    known.add(cid)
+                    out.append(c)
+
+    with rt.state_lock:
+        rt.runtime_state["more_comments_expanded"] += len(out)
+    return out
+
+
+def thread_comments(rt: CrawlerRuntime, data, post_id, want_ids=None,
+                    start_ts=None, end_ts=None, skip_blocked=False):
+    """
+    thread JSON -> 逐条产出评论（含楼中楼），过滤条件见 iter_comments。
+    cfg expand_more_comments（默认开）时，通过 /api/morechildren 补全被 more 折叠的评论，
+    并拉取 “继续这个讨论串” 折叠的深层子树；
+    传入 want_ids 时，只有这些 id 没在已下载部分找到才展开。
+    """
+    more_ids, deep_parents, known = [], [], set()
+    try:
+        children = data[1]["data"]["children"]
+    except Exception:
+        return
+    found = 0
+    for c in iter_comments(children, more_ids, known, start_ts, end_ts, skip_blocked, want_ids, deep_parents):
+        found += 1
+        yield c
+    if not (more_ids or deep_parents) or not rt.cfg.get("expand_more_comments", True):
+        return
+    if want_ids is not None and found >= len(want_ids):
+        return
+    for c in expand_more_comments(rt, post_id, more_ids, known, deep_parents):
+        if _keep_comment(c, start_ts, end_ts, skip_blocked, want_ids):
+            yield c
 
 
 def build_search_url(keyword, subreddit=None, search_type="comments", sort="new",t="all"):
@@ -457,7 +2211,7 @@ def build_search_url(keyword, subreddit=None, search_type="comments", sort="new"
     return base + "?" + urlencode(params)
 
 
-def parse_posts_search_page_with_cursor(html_text):
+def _parse_posts_search_page_bs4(html_text):
     soup = BeautifulSoup(html_text, "html.parser")
     meta = []
     for a in soup.select('a[data-testid="post-title"]'):
@@ -471,6 +2225,14 @@ def parse_posts_search_page_with_cursor(html_text):
         except Exception:
             continue
 
+    ts_map = {}
+    for tracker in soup.find_all("search-telemetry-tracker"):
+        _collect_post_ts_from_tracker(tracker.get("data-faceplate-tracking-context"), ts_map)
+    for tag in soup.find_all(attrs={"created-timestamp": True}):
+        _collect_post_ts_from_attrs(tag.attrs, ts_map)
+    for m in meta:
+        m["created_utc"] = ts_map.get(m["post_id_short"])
+
     next_url = None
     for part in soup.find_all("faceplate-partial"):
         src = part.get("src")
@@ -479,92 +2241,483 @@ def parse_posts_search_page_with_cursor(html_text):
             break
     return meta, next_url
 
-def parse_comments_search_page_with_cursor(html_text):
-    soup = BeautifulSoup(html_text, "html.parser")
-    cards = soup.select('div[data-testid="search-sdui-comment-unit"]')
-    ptc = {}
-    for card in cards:
+def _parse_comments_search_page_bs4(html_text):
+    soup = BeautifulSoup(html_text, "html.parser")
+    cards = soup.select('div[data-testid="search-sdui-comment-unit"]')
+    ptc = {}
+    for card in cards:
+        try:
+            tracker = card.find("search-telemetry-tracker")
+            if not tracker:
+                continue
+            ctx = json.loads(html.unescape(tracker.get("data-faceplate-tracking-context")))
+            p, c, s = ctx.get("post", {}), ctx.get("comment", {}), ctx.get("subreddit", {})
+            pid, cid = p.get("id"), c.get("id")
+            if not pid or not cid:
+                continue
+            pid_s = pid[3:] if pid.startswith("t3_") else pid
+            cid_s = cid[3:] if cid.startswith("t1_") else cid
+            sub_name = s.get("name")
+            if not sub_name:
+                continue
+            cids = ptc.setdefault((sub_name, pid_s), [])
+            if cid_s not in cids:
+                cids.append(cid_s)
+        except Exception:
+            continue
+
+    next_url = None
+    for part in soup.find_all("faceplate-partial"):
+        src = part.get("src")
+        if src and "cursor=" in src:
+            next_url = urljoin("https://www.reddit.com", src)
+            break
+    return ptc, next_url
+
+# =========================
+# 搜索页解析：默认走正则快速路径（不建 DOM），异常时回退 BeautifulSoup
+# cfg["search_parser"]="bs4" 可强制使用 BeautifulSoup
+# =========================
+_TAG_ATTRS_RE = r"((?:[^>\"']|\"[^\"]*\"|'[^']*')*)"
+_A_TAG_RE = re.compile(r"<a\b" + _TAG_ATTRS_RE + r">(.*?)</a\s*>", re.I | re.S)
+_PARTIAL_TAG_RE = re.compile(r"<faceplate-partial\b" + _TAG_ATTRS_RE + r">", re.I)
+_TRACKER_TAG_RE = re.compile(r"<search-telemetry-tracker\b" + _TAG_ATTRS_RE + r">", re.I)
+_DIV_TOKEN_RE = re.compile(r"<(/?)div\b" + _TAG_ATTRS_RE + r">", re.I)
+_ATTR_RE = re.compile(r"([^\s=/>\"']+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>\"']+)))?")
+_INNER_TAG_RE = re.compile(r"<[^>]*>")
+
+
+_CREATED_TS_TAG_RE = re.compile(r"<[a-zA-Z][\w-]*\b(?=[^>]*created-timestamp)" + _TAG_ATTRS_RE + r">")
+
+# 对账用的粗计数：只认标签名和属性，不管属性语法；与快速路径的结果数对不上就整页交给 bs4
+_POST_TITLE_MARK_RE = re.compile(r"<a\s[^>]*?(?<=\s)data-testid\s*=\s*([\"']?)post-title\1(?![\w-])", re.I)
+_COMMENT_CARD_MARK_RE = re.compile(
+    r"<div\s[^>]*?(?<=\s)data-testid\s*=\s*([\"']?)search-sdui-comment-unit\1(?![\w-])", re.I)
+_TRACKER_MARK_RE = re.compile(r"<search-telemetry-tracker\b", re.I)
+_CURSOR_MARK_RE = re.compile(r"<faceplate-partial\b[^>]*cursor=", re.I)
+
+
+def parse_created_ts(value):
+    """搜索页里的发帖时间：epoch 秒/毫秒 或 ISO 字符串 -> epoch 秒；无法解析返回 None"""
+    if value is None or value == "":
+        return None
+    try:
+        ts = float(value)
+        return ts / 1000.0 if ts > 1e12 else ts
+    except (TypeError, ValueError):
+        pass
+    try:
+        dt = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+    except ValueError:
+        return None
+
+
+def _collect_post_ts_from_tracker(ctx_raw, ts_map: dict):
+    if not ctx_raw:
+        return
+    try:
+        post = (json.loads(html.unescape(ctx_raw)) or {}).get("post") or {}
+    except (ValueError, AttributeError):
+        return
+    pid = post.get("id") or ""
+    ts = parse_created_ts(post.get("created_timestamp"))
+    if pid and ts is not None:
+        ts_map.setdefault(pid[3:] if pid.startswith("t3_") else pid, ts)
+
+
+def _collect_post_ts_from_attrs(attrs: dict, ts_map: dict):
+    pid = attrs.get("post-id") or attrs.get("id") or ""
+    ts = parse_created_ts(attrs.get("created-timestamp"))
+    if pid.startswith("t3_") and ts is not None:
+        ts_map.setdefault(pid[3:], ts)
+
+
+def _parse_attrs(attr_text: str) -> dict:
+    out = {}
+    for m in _ATTR_RE.finditer(attr_text or ""):
+        name = m.group(1).lower()
+        if name in out:
+            continue
+        val = m.group(2) if m.group(2) is not None else (m.group(3) if m.group(3) is not None else m.group(4))
+        out[name] = html.unescape(val) if val is not None else ""
+    return out
+
+
+def _inner_text_stripped(inner_html: str) -> str:
+    # 等价于 BeautifulSoup 的 get_text(strip=True)：每段文本各自 strip 后直接拼接
+    parts = (html.unescape(t).strip() for t in _INNER_TAG_RE.split(inner_html))
+    return "".join(p for p in parts if p)
+
+
+def _find_next_cursor_fast(html_text):
+    for m in _PARTIAL_TAG_RE.finditer(html_text):
+        src = _parse_attrs(m.group(1)).get("src")
+        if src and "cursor=" in src:
+            return urljoin("https://www.reddit.com", src)
+    if _CURSOR_MARK_RE.search(html_text):
+        raise ValueError("cursor partial present but not parsed")
+    return None
+
+
+def _parse_posts_search_page_fast(html_text):
+    meta = []
+    n_titles = 0
+    for m in _A_TAG_RE.finditer(html_text):
+        attrs = _parse_attrs(m.group(1))
+        if attrs.get("data-testid") != "post-title":
+            continue
+        n_titles += 1
+        try:
+            full = urljoin("https://www.reddit.com", attrs.get("href", ""))
+            if "/comments/" not in full:
+                continue
+            pid = full.split("/comments/")[1].split("/")[0]
+            meta.append({"post_id_short": pid, "post_url": full, "post_title": _inner_text_stripped(m.group(2))})
+        except Exception:
+            continue
+
+    # 标题锚点没配上（标签未闭合、属性引号错乱等）会整条漏掉，只能靠计数发现
+    if n_titles != len(_POST_TITLE_MARK_RE.findall(html_text)):
+        raise ValueError("post-title count mismatch")
+
+    # 发帖时间（用于抓详情前的日期预过滤）：tracker 上下文 / 带 created-timestamp 的帖子节点
+    ts_map = {}
+    n_trackers = 0
+    for m in _TRACKER_TAG_RE.finditer(html_text):
+        n_trackers += 1
+        _collect_post_ts_from_tracker(_parse_attrs(m.group(1)).get("data-faceplate-tracking-context"), ts_map)
+    if n_trackers != len(_TRACKER_MARK_RE.findall(html_text)):
+        raise ValueError("tracker count mismatch")
+    for m in _CREATED_TS_TAG_RE.finditer(html_text):
+        _collect_post_ts_from_attrs(_parse_attrs(m.group(1)), ts_map)
+    for m in meta:
+        m["created_utc"] = ts_map.get(m["post_id_short"])
+    return meta, _find_next_cursor_fast(html_text)
+
+
+def _comment_card_spans(html_text):
+    """评论卡片 <div> 到与之配对的 </div> 的范围（按文档顺序）；未闭合的卡片延伸到文末，与 bs4 一致"""
+    spans = []
+    stack = []  # 未闭合的 div：卡片起点，或 None（普通 div）
+    for m in _DIV_TOKEN_RE.finditer(html_text):
+        if m.group(1):
+            if stack:
+                start = stack.pop()
+                if start is not None:
+                    spans.append((start, m.start()))
+        else:
+            is_card = _parse_attrs(m.group(2)).get("data-testid") == "search-sdui-comment-unit"
+            stack.append(m.start() if is_card else None)
+    spans.extend((start, len(html_text)) for start in stack if start is not None)
+    spans.sort()
+    return spans
+
+
+def _parse_comments_search_page_fast(html_text):
+    # 只在卡片自身范围内找第一个 tracker（同 bs4 的 card.find）：卡片关闭后才出现的 tracker 不归它
+    # 卡片数、卡片内 tracker、上下文 JSON 任一对不上都抛 ValueError，由调用方整页回退 bs4
+    ptc = {}
+    spans = _comment_card_spans(html_text)
+    if len(spans) != len(_COMMENT_CARD_MARK_RE.findall(html_text)):
+        raise ValueError("comment card count mismatch")
+    for start, end in spans:
+        m = _TRACKER_TAG_RE.search(html_text, start, end)
+        if not m:
+            if _TRACKER_MARK_RE.search(html_text, start, end):
+                raise ValueError("tracker present in card but not parsed")
+            continue
+        ctx_raw = _parse_attrs(m.group(1)).get("data-faceplate-tracking-context")
+        if not ctx_raw:
+            continue
+        try:
+            ctx = json.loads(html.unescape(ctx_raw))
+        except (TypeError, ValueError) as e:
+            raise ValueError("tracker context not parsed") from e
+        try:
+            p, c, s = ctx.get("post", {}), ctx.get("comment", {}), ctx.get("subreddit", {})
+            pid, cid = p.get("id"), c.get("id")
+            if not pid or not cid:
+                continue
+            pid_s = pid[3:] if pid.startswith("t3_") else pid
+            cid_s = cid[3:] if cid.startswith("t1_") else cid
+            sub_name = s.get("name")
+            if not sub_name:
+                continue
+            cids = ptc.setdefault((sub_name, pid_s), [])
+            if cid_s not in cids:
+                cids.append(cid_s)
+        except Exception:
+            continue
+    return ptc, _find_next_cursor_fast(html_text)
+
+
+def parse_posts_search_page_with_cursor(html_text, parser="fast"):
+    if parser != "bs4":
+        try:
+            return _parse_posts_search_page_fast(html_text)
+        except Exception:
+            pass
+    return _parse_posts_search_page_bs4(html_text)
+
+
+def parse_comments_search_page_with_cursor(html_text, parser="fast"):
+    if parser != "bs4":
+        try:
+            return _parse_comments_search_page_fast(html_text)
+        except Exception:
+            pass
+    return _parse_comments_search_page_bs4(html_text)
+
+
+def parse_search_page(rt: CrawlerRuntime, resp, kind: str):
+    """kind=posts/comments；开了多进程解析就把原始字节交给进程池，否则在当前线程解析"""
+    parser = rt.cfg.get("search_parser", "fast")
+    if rt.parse_pool is not None:
+        return rt.parse_pool.run(f"{kind}_page", resp.content, encoding=resp.encoding, parser=parser)[0]
+    if kind == "posts":
+        return parse_posts_search_page_with_cursor(resp.text, parser)
+    return parse_comments_search_page_with_cursor(resp.text, parser)
+
+
+def _intern(s):
+    return sys.intern(s) if isinstance(s, str) else s
+
+
+def prepare_row(post, comment, source):
+    """
+    紧凑行：按 CSV_HEADERS 顺序的 tuple，只存原始值（时间戳保留 epoch，subreddit/作者名 intern）。
+    clean_text / format_ts / comment_url 拼接推迟到写线程的 format_row 里做，输出与原 dict 行一致。
+    """
+    if comment:
+        return (
+            _intern(post.get("subreddit")), post.get("post_id"), _intern(post.get("post_author")),
+            post.get("post_author_flair"), post.get("post_title"), post.get("post_selftext"),
+            post.get("post_ups"), post.get("post_downs"), post.get("post_score"),
+            post.get("post_created_utc"), post.get("post_url"),
+            comment.get("id"), comment.get("parent_id"), _intern(comment.get("author")),
+            comment.get("author_flair_text"), comment.get("body"),
+            comment.get("ups"), comment.get("downs"), comment.get("score"),
+            comment.get("created_utc"), comment.get("permalink"),
+            source,
+        )
+    return (
+        _intern(post.get("subreddit")), post.get("post_id"), _intern(post.get("post_author")),
+        post.get("post_author_flair"), post.get("post_title"), post.get("post_selftext"),
+        post.get("post_ups"), post.get("post_downs"), post.get("post_score"),
+        post.get("post_created_utc"), post.get("post_url"),
+        "", "", "", "", "", "", "", "", "", "",
+        source,
+    )
+
+
+def _as_is(v):
+    return "" if v is None else v
+
+
+def _format_comment_ts(v):
+    # 无评论的 post 行里该列为 ""
+    return "" if v == "" else format_ts(v)
+
+
+def _format_comment_url(v):
+    return clean_text(_build_comment_url(v))
+
+
+# 每列的输出格式化（与 CSV_HEADERS 一一对应）
+ROW_FORMATTERS = (
+    clean_text, clean_text, clean_text, clean_text, clean_text, clean_text,
+    _as_is, _as_is, _as_is, format_ts, clean_text,
+    clean_text, clean_text, clean_text, clean_text, clean_text,
+    _as_is, _as_is, _as_is, _format_comment_ts,
+    _format_comment_url,
+    _as_is,
+)
+
+
+def format_row(row) -> list:
+    """紧凑行 -> CSV 输出值"""
+    return [f(v) for f, v in zip(ROW_FORMATTERS, row)]
+
+
+_WRITER_CLOSE = object()
+
+
+class _WriterSync:
+    """写队列里的屏障：写线程处理到它时刷盘并回报文件大小"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.size = 0
+
+
+class CsvRowWriter:
+    """
+    单个输出 CSV 的专用写线程：
+    - worker 只把一批 rows 放进有界队列（队列满时阻塞，形成背压），不再构造 DataFrame、不抢文件锁
+    - 写线程用带大缓冲的 csv.writer 追加，按 CSV_HEADERS 顺序输出
+    - 每 flush_interval 秒、停止信号、关闭时 flush
+    - 单行格式化失败只丢这一行（计入 rows_failed）；文件写失败则记下错误，
+      之后的 put/sync 把它抛回给调用方，本次运行标记为 failed
+    """
+
+    def __init__(self, rt: CrawlerRuntime, path: str, queue_size: int = 256,
+                 buffer_size: int = 1 << 20, flush_interval: float = 1.0):
+        self.rt = rt
+        self.path = path
+        self.flush_interval = float(flush_interval)
+        self.q = queue.Queue(maxsize=max(int(queue_size), 1))
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        # 文件已由 run_crawler 用 utf-8-sig 写好表头；追加部分不再写 BOM
+        self.f = open(path, "a", newline="", encoding="utf-8-sig" if new_file else "utf-8", buffering=int(buffer_size))
+        # 行尾与原 DataFrame.to_csv 保持一致
+        self.w = csv.writer(self.f, lineterminator=os.linesep)
+        if new_file:
+            self.w.writerow(CSV_HEADERS)
+        self.start_pos = self.f.tell()
+        self.bytes_written = 0
+        self.rows_written = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name=f"csv-writer-{os.path.basename(path)}", daemon=True)
+        self.thread.start()
+
+    def put(self, rows):
+        self._raise_error()
+        self.q.put(rows)
+
+    def sync(self) -> int:
+        """阻塞到此前排队的行全部落盘，返回文件字节数"""
+        barrier = _WriterSync()
+        self.q.put(barrier)
+        while not barrier.event.wait(1.0):
+            if not self.thread.is_alive():  # 已被并发关闭：文件已完整落盘
+                return os.path.getsize(self.path)
+        self._raise_error()
+        return barrier.size
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise OSError(f"写入 {self.path} 失败: {self.error}") from self.error
+
+    def _write_rows(self, rows):
+        """逐行格式化：坏行单独跳过，其余照常写出；只有真正写出的行才记入去重库"""
+        out, ok = [], []
+        for r in rows:
+            try:
+                out.append(format_row(r))
+                ok.append(r)
+            except Exception as e:
+                self.rt.log(f"[写入错误] {self.path}: 跳过 1 行 post={r[_ROW_POST_ID]} comment={r[_ROW_COMMENT_ID]} | {e}")
+                with self.rt.state_lock:
+                    self.rt.runtime_state["rows_failed"] += 1
+        if not out:
+            return
+        self.w.writerows(out)
+        self.rows_written += len(out)
+        if self.rt.seen_store is not None:
+            self.rt.seen_store.mark_rows(self.path, ok)
+
+    def _flush(self):
+        self.f.flush()
+        self.bytes_written = self.f.tell() - self.start_pos
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            try:
+                if item is _WRITER_CLOSE:
+                    self._flush()
+                    return
+                if isinstance(item, _WriterSync):
+                    try:
+                        self._flush()
+                        item.size = os.fstat(self.f.fileno()).st_size
+                    finally:
+                        item.event.set()
+                    continue
+                if item and self.error is None:
+                    self._write_rows(item)
+                now = time.monotonic()
+                if item is None or self.rt.stop_event.is_set() or now - last_flush >= self.flush_interval:
+                    self._flush()
+                    last_flush = now
+            except Exception as e:
+                # 文件层面的失败（磁盘满、句柄失效……）：后续行不再写，错误交给生产者
+                if self.error is None:
+                    self.error = e
+                    with self.rt.state_lock:
+                        self.rt.runtime_state["write_error"] = f"{self.path}: {e}"
+                self.rt.log(f"[写入错误] {self.path}: {e}")
+            self.rt.update_writer_stats()
+
+    def close(self):
+        self.q.put(_WRITER_CLOSE)
+        self.thread.join()
         try:
-            tracker = card.find("search-telemetry-tracker")
-            if not tracker:
-                continue
-            ctx = json.loads(html.unescape(tracker.get("data-faceplate-tracking-context")))
-            p, c, s = ctx.get("post", {}), ctx.get("comment", {}), ctx.get("subreddit", {})
-            pid, cid = p.get("id"), c.get("id")
-            if not pid or not cid:
-                continue
-            pid_s = pid[3:] if pid.startswith("t3_") else pid
-            cid_s = cid[3:] if cid.startswith("t1_") else cid
-            sub_name = s.get("name")
-            if not sub_name:
-                continue
-            ptc.setdefault((sub_name, pid_s), set()).add(cid_s)
+            self.f.close()
         except Exception:
-            continue
-
-    next_url = None
-    for part in soup.find_all("faceplate-partial"):
-        src = part.get("src")
-        if src and "cursor=" in src:
-            next_url = urljoin("https://www.reddit.com", src)
-            break
-    return ptc, next_url
+            pass
 
-def prepare_row(post, comment, source):
-    row = {
-        "post_subreddit": clean_text(post.get("subreddit")),
-        "post_id": clean_text(post.get("post_id")),
-        "post_author": clean_text(post.get("post_author")),
-        "post_author_flair": clean_text(post.get("author_flair_text")),
-        "post_title": clean_text(post.get("post_title")),
-        "post_body": clean_text(post.get("post_selftext")),
-        "post_ups": post.get("post_ups"),
-        "post_downs": post.get("post_downs"),
-        "post_score": post.get("post_score"),
-        "post_created_utc": format_ts(post.get("post_created_utc")),
-        "post_url": clean_text(post.get("post_url")),
-    }
-    if comment:
-        row.update({
-            "comment_id": clean_text(comment.get("id")),
-            "comment_parent_id": clean_text(comment.get("parent_id")),
-            "comment_author": clean_text(comment.get("author")),
-            "comment_author_flair": clean_text(comment.get("author_flair_text")),
-            "comment_body": clean_text(comment.get("body")),
-            "comment_ups": comment.get("ups"),
-            "comment_downs": comment.get("downs"),
-            "comment_score": comment.get("score"),
-            "comment_created_utc": format_ts(comment.get("created_utc")),
-            "comment_url": clean_text(_build_comment_url(post.get("post_url"), comment)),
-        })
-    else:
-        for k in ["comment_id", "comment_parent_id", "comment_author","comment_author_flair", "comment_body",
-                  "comment_ups", "comment_downs", "comment_score", "comment_created_utc", "comment_url"]:
-            row[k] = ""
-    row["source"] = source
-    return {k: ("" if v is None else v) for k, v in row.items()}
 
 def append_rows(rt: CrawlerRuntime, path: str, rows: list):
     if not rows:
         return
-    df = pd.DataFrame(rows)
-    with rt.file_write_lock:
-        header = not os.path.exists(path)
-        df.to_csv(path, mode="a", header=header, index=False, encoding="utf-8-sig")
+    rt.csv_writer(path).put(rows)
+
+
+def skip_known(rt: CrawlerRuntime, kind: str, ids) -> set:
+    """only_new 模式：返回以往运行已导出过的 id（调用方在下载详情前跳过）；否则返回空集合"""
+    if not rt.only_new or rt.seen_store is None:
+        return set()
+    try:
+        known = rt.seen_store.known(kind, ids)
+    except sqlite3.Error as e:
+        rt.log(f"[去重库] 查询失败，按未见过处理: {e}")
+        return set()
+    if known:
+        with rt.state_lock:
+            rt.runtime_state["known_skipped"] += len(known)
+    return known
+
+
+def drop_known_comments(rt: CrawlerRuntime, comments):
+    """only_new 模式：去掉以往运行已导出过的评论"""
+    if not rt.only_new or rt.seen_store is None:
+        return comments
+    comments = list(comments)
+    known = skip_known(rt, "c", [c.get("id") for c in comments])
+    return [c for c in comments if c.get("id") not in known] if known else comments
 
 def crawl_posts_listing_for_subreddit(rt: CrawlerRuntime, subreddit: str, start_ts: float, end_ts: float, out_posts_csv: str):
     """
     用 listing 接口抓指定 subreddit 的最新帖子（new），替代 “空格关键词 + search” 的做法。
-    依旧按时间范围过滤，并保持输出格式与 posts 阶段一致（必要时也顺带抓评论）。
+    依旧按时间范围过滤，并保持输出格式与 posts 阶段一致。
+    post 行直接由 listing 数据生成；评论（cfg listing_comments，默认 True，与原先一致顺带抓评论）
+    通过运行内共用的有界详情池拉取帖子详情。
     """
     if not subreddit:
         rt.log("[Listing] subreddit 为空，无法使用 listing 接口")
         return
 
-    after = None
-    page = 1
-    consecutive_old = 0
-    post_fetched = 0
+    want_comments = bool(rt.cfg.get("listing_comments", True))
+    detail_workers = int(rt.cfg.get("listing_detail_workers", rt.cfg.get("max_workers", 4)))
+
+    task = checkpoint_task("listing", out_posts_csv, subreddit, "")
+    cur = task_cursor(rt, task)
+    if cur.get("done"):
+        rt.log(f"[续爬] listing r/{subreddit} 已完成，跳过")
+        return
+
+    after = cur.get("after")
+    page = cur.get("page", 1)
+    consecutive_old = cur.get("consecutive_old", 0)
+    post_fetched = cur.get("post_fetched", 0)
     post_count = rt.cfg.get("post_count", None)
     while not rt.stop_event.is_set():
         rt.wait_if_paused_or_stopped()
@@ -597,6 +2750,8 @@ def crawl_posts_listing_for_subreddit(rt: CrawlerRuntime, subreddit: str, start_
 
         rows = []
         saved = 0
+        kept = []
+        known = skip_known(rt, "p", [((item or {}).get("data") or {}).get("id") for item in children])
 
         for item in children:
             if rt.stop_event.is_set():
@@ -607,11 +2762,6 @@ def crawl_posts_listing_for_subreddit(rt: CrawlerRuntime, subreddit: str, start_
             if not pid:
                 continue
 
-            with rt.seen_data_lock:
-                if ("p", pid) in rt.seen_posts:
-                    continue
-                rt.seen_posts.add(("p", pid))
-
             p_ts = float(d.get("created_utc") or 0)
 
             # 时间过滤 & 提前停止（越往后越旧）
@@ -626,7 +2776,12 @@ def crawl_posts_listing_for_subreddit(rt: CrawlerRuntime, subreddit: str, start_
                 if p_ts > end_ts:
                     continue
                 consecutive_old = 0
-            else:
+
+            # 已导出过 / 本次已处理的帖子放在时间判断之后跳过：已知的旧帖照样计入连续旧帖，能正常停止翻页
+            if pid in known or not rt.seen_posts.add_if_absent(pid):
+                continue
+
+            if post_count is not None:
                 post_fetched += 1
                 # 停止条件：当抓取的评论数 >= post_count 时停止
                 if post_fetched > post_count:
@@ -634,41 +2789,38 @@ def crawl_posts_listing_for_subreddit(rt: CrawlerRuntime, subreddit: str, start_
                     after = None
                     break
 
-            # 为了和你现有逻辑完全一致：依旧用 comments/{id}.json 拉完整信息 +（可选）顺带抓评论
-            post_json = fetch_post_json(rt, subreddit, pid)
-            if not post_json:
-                continue
-
-            post_info = extract_post_info_from_json(post_json, subreddit, pid, original_url=("https://www.reddit.com" + d.get("permalink", "")))
-            if not post_info:
-                continue
-
-            # 先写 post 行
-            rows.append(prepare_row(post_info, None, f"listing_new_{subreddit}"))
-            saved += 1
+            # listing 的 child data 已经是完整帖子信息，直接出 post 行，不再逐帖请求 comments/{id}.json
+            post_info = post_info_from_data(d, subreddit, pid, original_url=("https://www.reddit.com" + d.get("permalink", "")))
+            kept.append((pid, post_info))
 
             # 命中计数（保持你 UI 口径一致）
             with rt.state_lock:
                 rt.runtime_state["posts_fetched"] += 1
-                rt.runtime_state["current_group_has_data"] = True
+                rt.data_files.add(out_posts_csv)
                 cur_posts = rt.runtime_state["posts_fetched"]
             rt.update_state(posts_fetched=cur_posts)
 
-            # 再顺带抓该贴所有评论（和 crawl_posts_for_keyword 一致）
-            all_c = []
-            try:
-                flatten_comments(post_json[1]["data"]["children"], all_c)
-            except Exception:
-                all_c = []
+        # 需要评论时才拉帖子详情：共用详情池批量抓取
+        threads = {}
+        if want_comments and kept:
+            keys = [(subreddit, pid) for pid, _ in kept]
+            threads = dict(zip(keys, fetch_post_jsons_bounded(rt, keys, detail_workers)))
+
+        for pid, post_info in kept:
+            if rt.stop_event.is_set():
+                return
+            rows.append(prepare_row(post_info, None, f"listing_new_{subreddit}"))
+            saved += 1
+
+            post_json = threads.get((subreddit, pid))
+            if not post_json:
+                continue
 
-            for c in all_c:
+            # 顺带抓该贴所有评论（和 crawl_posts_for_keyword 一致；屏蔽作者/时间过滤在遍历中完成）
+            for c in drop_known_comments(rt, thread_comments(rt, post_json, pid, start_ts=start_ts, end_ts=end_ts,
+                                                             skip_blocked=True)):
                 if rt.stop_event.is_set():
                     return
-                if is_blocked_author(c.get("author")):
-                    continue
-                c_ts = float(c.get("created_utc") or 0)
-                if c_ts < start_ts or c_ts > end_ts:
-                    continue
 
                 rows.append(prepare_row(post_info, c, f"listing_new_comments_{subreddit}"))
                 saved += 1
@@ -681,12 +2833,45 @@ def crawl_posts_listing_for_subreddit(rt: CrawlerRuntime, subreddit: str, start_
         if not after:
             break
         page += 1
+        save_cursor(rt, task, after=after, page=page, consecutive_old=consecutive_old, post_fetched=post_fetched)
+
+    finish_task(rt, task)
+
+def posts_to_prefetch(metas, known, seen, start_ts, end_ts, consecutive_old=0, limit=None) -> list:
+    """
+    按 posts 主循环的顺序和停止条件，预估本页会下载详情的帖子 id（只看搜索页自带的发帖时间）：
+    连续旧帖达到 5 个、或达到剩余数量 limit 就停，之后的帖子不预取。
+    没有时间的帖子要下载后才知道新旧，按会下载处理。
+    """
+    todo = []
+    for m in metas:
+        if limit is not None and len(todo) >= limit:
+            break
+        ts = m.get("created_utc")
+        if ts is not None and ts < start_ts:
+            consecutive_old += 1
+            if consecutive_old >= 5:
+                break
+            continue
+        pid = m["post_id_short"]
+        if (ts is not None and ts > end_ts) or pid in known or pid in seen:
+            continue
+        todo.append(pid)
+        consecutive_old = 0
+    return todo
+
 
 def crawl_posts_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str, start_ts: float, end_ts: float, out_posts_csv: str):
-    url = build_search_url(keyword, subreddit, "posts", sort=rt.cfg["sort"],t=rt.cfg["t"])
-    page = 1
-    consecutive_old = 0  # 追踪连续的旧帖子数量
-    posts_fetched = 0  # 追踪已抓取的帖子数量
+    task = checkpoint_task("posts", out_posts_csv, subreddit, keyword)
+    cur = task_cursor(rt, task)
+    if cur.get("done"):
+        rt.log(f"[续爬] Posts keyword={keyword} 已完成，跳过")
+        return
+
+    url = cur.get("url") or build_search_url(keyword, subreddit, "posts", sort=rt.cfg["sort"],t=rt.cfg["t"])
+    page = cur.get("page", 1)
+    consecutive_old = cur.get("consecutive_old", 0)  # 追踪连续的旧帖子数量
+    posts_fetched = cur.get("posts_fetched", 0)  # 追踪已抓取的帖子数量
 
     # 获取 post_count，如果没有传入则默认为 None
     post_count = rt.cfg.get("post_count", None)  # 获取 post_count，如果没有提供则为 None
@@ -707,22 +2892,23 @@ def crawl_posts_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str, st
             rt.log(f"[Posts] keyword={keyword} | page={page} | RESULT=FAIL status={status}")
             break
 
-        metas, next_url = parse_posts_search_page_with_cursor(resp.text)
+        metas, next_url = parse_search_page(rt, resp, "posts")
 
-        new_count, saved = 0, 0
+        new_count, saved, skipped = 0, 0, 0
         rows = []
 
+        known = skip_known(rt, "p", [m["post_id_short"] for m in metas])
+        limit = None if post_count is None else max(post_count - posts_fetched, 0)
+        todo = [(subreddit, pid) for pid in
+                posts_to_prefetch(metas, known, rt.seen_posts, start_ts, end_ts, consecutive_old, limit)]
+        prefetched = prefetch_post_jsons(rt, todo)
+
         for m in metas:
             if rt.stop_event.is_set():
                 rt.log("[系统] 收到停止信号，退出当前 posts 循环")
                 return
 
             pid = m["post_id_short"]
-            with rt.seen_data_lock:
-                if ("p", pid) in rt.seen_posts:
-                    continue
-                rt.seen_posts.add(("p", pid))
-            new_count += 1
 
             # 1. 如果传入了 post_count，检查是否达到指定数量，停止爬取
             if post_count is not None and posts_fetched >= post_count:
@@ -736,9 +2922,32 @@ def crawl_posts_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str, st
                 url = None  # 设置 URL 为 None 停止继续翻页
                 break
 
+            # 搜索页已带发帖时间：窗口外的帖子直接跳过，不下载详情（旧帖照常计入连续旧帖）
+            pre_ts = m.get("created_utc")
+            if pre_ts is not None and not (start_ts <= pre_ts <= end_ts):
+                skipped += 1
+                with rt.state_lock:
+                    rt.runtime_state["prefilter_skipped"] += 1
+                if pre_ts < start_ts:
+                    consecutive_old += 1
+                    if consecutive_old >= 5:
+                        rt.log(f"[Posts] 连续抓取了 5 个旧帖子，停止翻页，跳转到下载文件。")
+                        url = None  # 停止翻页
+                        break
+                continue
+
+            # 已导出过 / 本次已处理的帖子放在时间窗判断之后跳过：已知的旧帖照样计入连续旧帖，
+            # 否则 only_new 重跑时整页都是已知帖子，会一直翻到搜索结果末尾
+            if pid in known or not rt.seen_posts.add_if_absent(pid):
+                continue
+            new_count += 1
+
             # 继续处理帖子信息
             guessed_sub = subreddit
-            data = fetch_post_json(rt, guessed_sub, pid)
+            if (guessed_sub, pid) in prefetched:
+                data = prefetched[(guessed_sub, pid)]
+            else:
+                data = fetch_post_json(rt, guessed_sub, pid)
             if not data:
                 continue
 
@@ -766,27 +2975,16 @@ def crawl_posts_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str, st
             posts_fetched += 1
             with rt.state_lock:
                 rt.runtime_state["posts_fetched"] = posts_fetched
-                rt.runtime_state["current_group_has_data"] = True
+                rt.data_files.add(out_posts_csv)
             rt.update_state(posts_fetched=posts_fetched)
 
             # ✅ 新增：顺带抓该 post 下所有评论（含楼中楼）
-            all_c = []
-            try:
-                # data 是 fetch_post_json() 返回的 [post_listing, comments_listing]
-                flatten_comments(data[1]["data"]["children"], all_c)
-            except Exception:
-                all_c = []
-
-            for c in all_c:
+            # data 是 fetch_post_json() 返回的 [post_listing, comments_listing]
+            # 屏蔽作者 + 日期过滤在遍历中完成
+            for c in drop_known_comments(rt, thread_comments(rt, data, pid, start_ts=start_ts, end_ts=end_ts,
+                                                             skip_blocked=True)):
                 if rt.stop_event.is_set():
                     return
-                if is_blocked_author(c.get("author")):
-                    continue
-
-                # 如果你希望评论也受日期过滤，就保留这个时间判断
-                c_ts = float(c.get("created_utc") or 0)
-                if c_ts < start_ts or c_ts > end_ts:
-                    continue
 
                 rows.append(prepare_row(post_info, c, f"post_all_comments_{keyword}"))
                 saved += 1
@@ -797,7 +2995,7 @@ def crawl_posts_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str, st
                     cur_c = rt.runtime_state["comments_fetched"]
                 rt.update_state(comments_fetched=cur_c)
 
-        rt.log(f"[Posts] keyword={keyword} | page={page} | new_posts={new_count} | saved={saved} | RESULT=SUCCESS | next={bool(next_url)}")
+        rt.log(f"[Posts] keyword={keyword} | page={page} | new_posts={new_count} | saved={saved} | prefilter_skipped={skipped} | RESULT=SUCCESS | next={bool(next_url)}")
 
         if rows:
             append_rows(rt, out_posts_csv, rows)
@@ -813,19 +3011,28 @@ def crawl_posts_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str, st
 
         url = next_url
         page += 1
+        save_cursor(rt, task, url=url, page=page, consecutive_old=consecutive_old, posts_fetched=posts_fetched)
         rt.update_state(
             posts_fetched=rt.runtime_state["posts_fetched"],
             comments_fetched=rt.runtime_state["comments_fetched"],
         )
 
+    finish_task(rt, task)
+
 
 
 def crawl_comments_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str, start_ts: float, end_ts: float, out_comments_csv: str):
-    url = build_search_url(keyword, subreddit, "comments", sort=rt.cfg["sort"])
-    page = 1
-    consecutive_old = 0
+    task = checkpoint_task("comments", out_comments_csv, subreddit, keyword)
+    cur = task_cursor(rt, task)
+    if cur.get("done"):
+        rt.log(f"[续爬] Comments keyword={keyword} 已完成，跳过")
+        return
+
+    url = cur.get("url") or build_search_url(keyword, subreddit, "comments", sort=rt.cfg["sort"])
+    page = cur.get("page", 1)
+    consecutive_old = cur.get("consecutive_old", 0)
     post_count = rt.cfg.get("post_count", None)  # 获取 post_count，如果没有提供则为 None
-    comments_fetched = 0
+    comments_fetched = cur.get("comments_fetched", 0)
     if post_count is None:
         rt.log("[INFO] 未传入 post_count，爬取将基于连续旧评论数量（5）来停止")
         while url and (not rt.stop_event.is_set()):
@@ -844,44 +3051,23 @@ def crawl_comments_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str,
                 rt.log(f"[Comments] keyword={keyword} | page={page} | RESULT=FAIL status={status}")
                 break
 
-            ptc, next_url = parse_comments_search_page_with_cursor(resp.text)
+            ptc, next_url = parse_search_page(rt, resp, "comments")
 
             new_comment_refs, saved = 0, 0
             rows = []
 
-            for (sub_name, pid), cids in ptc.items():
+            for new_cids, post_info, matched in iter_matched_comments(rt, ptc):
                 if rt.stop_event.is_set():
                     rt.log("[系统] 收到停止信号，退出当前 comments 循环")
                     return
 
-                with rt.seen_data_lock:
-                    new_cids = {cid for cid in cids if ("c", sub_name, pid, cid) not in rt.seen_comments}
-                    for cid in new_cids:
-                        rt.seen_comments.add(("c", sub_name, pid, cid))
-                if not new_cids:
-                    continue
-
                 new_comment_refs += len(new_cids)
-
-                data = fetch_post_json(rt, sub_name, pid)
-                if not data:
-                    continue
-                post_info = extract_post_info_from_json(data, sub_name, pid)
                 if not post_info:
                     continue
 
-                all_c = []
-                try:
-                    flatten_comments(data[1]["data"]["children"], all_c)
-                except Exception:
-                    pass
-
-                for c in all_c:
+                for c in matched:
                     if rt.stop_event.is_set():
                         return
-                    cid = c.get("id")
-                    if cid not in new_cids:
-                        continue
                     if is_blocked_author(c.get("author")):
                         continue
 
@@ -901,7 +3087,7 @@ def crawl_comments_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str,
                     saved += 1
                     with rt.state_lock:
                         rt.runtime_state["comments_fetched"] += 1
-                        rt.runtime_state["current_group_has_data"] = True
+                        rt.data_files.add(out_comments_csv)
 
                 if url is None:
                     break
@@ -916,6 +3102,8 @@ def crawl_comments_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str,
                 break
             url = next_url
             page += 1
+            save_cursor(rt, task, url=url, page=page, consecutive_old=consecutive_old,
+                        comments_fetched=comments_fetched)
 
         rt.update_state(
             posts_fetched=rt.runtime_state["posts_fetched"],
@@ -940,43 +3128,22 @@ def crawl_comments_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str,
                 rt.log(f"[Comments] keyword={keyword} | page={page} | RESULT=FAIL status={status}")
                 break
 
-            ptc, next_url = parse_comments_search_page_with_cursor(resp.text)
+            ptc, next_url = parse_search_page(rt, resp, "comments")
 
             new_comment_refs, saved = 0, 0
             rows = []
-            for (sub_name, pid), cids in ptc.items():
+            for new_cids, post_info, matched in iter_matched_comments(rt, ptc):
                 if rt.stop_event.is_set():
                     rt.log("[系统] 收到停止信号，退出当前 comments 循环")
                     return
 
-                with rt.seen_data_lock:
-                    new_cids = {cid for cid in cids if ("c", sub_name, pid, cid) not in rt.seen_comments}
-                    for cid in new_cids:
-                        rt.seen_comments.add(("c", sub_name, pid, cid))
-                if not new_cids:
-                    continue
-
                 new_comment_refs += len(new_cids)
-
-                data = fetch_post_json(rt, sub_name, pid)
-                if not data:
-                    continue
-                post_info = extract_post_info_from_json(data, sub_name, pid)
                 if not post_info:
                     continue
 
-                all_c = []
-                try:
-                    flatten_comments(data[1]["data"]["children"], all_c)
-                except Exception:
-                    pass
-
-                for c in all_c:
+                for c in matched:
                     if rt.stop_event.is_set():
                         return
-                    cid = c.get("id")
-                    if cid not in new_cids:
-                        continue
                     if is_blocked_author(c.get("author")):
                         continue
 
@@ -990,7 +3157,7 @@ def crawl_comments_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str,
                         break
                     with rt.state_lock:
                         rt.runtime_state["comments_fetched"] += 1
-                        rt.runtime_state["current_group_has_data"] = True
+                        rt.data_files.add(out_comments_csv)
 
                 if url is None:
                     break
@@ -1005,182 +3172,432 @@ def crawl_comments_for_keyword(rt: CrawlerRuntime, keyword: str, subreddit: str,
                 break
             url = next_url
             page += 1
+            save_cursor(rt, task, url=url, page=page, consecutive_old=consecutive_old,
+                        comments_fetched=comments_fetched)
 
         rt.update_state(
             posts_fetched=rt.runtime_state["posts_fetched"],
             comments_fetched=rt.runtime_state["comments_fetched"],
         )
 
-def finalize_outputs(rt: CrawlerRuntime, file_prefix: str, output_dir: str, copy_to_desktop: bool = False):
-    out_posts = os.path.join(output_dir, f"{file_prefix}_raw_posts.csv")
-    out_comments = os.path.join(output_dir, f"{file_prefix}_raw_comments.csv")
+    finish_task(rt, task)
 
-    # ✅ 磁盘最终只保留这一个
-    xlsx_path = os.path.join(output_dir, f"{file_prefix}.xlsx")
+# =========================
+# Finalize：分块流式合并（内存上限与行数无关）
+# =========================
+FINALIZE_CHUNK_ROWS = 20000
 
-    df_p = pd.read_csv(out_posts) if os.path.exists(out_posts) else pd.DataFrame()
-    df_c = pd.read_csv(out_comments) if os.path.exists(out_comments) else pd.DataFrame()
+MERGED_COLUMNS = [
+    "post_subreddit", "username", "author_flair", "id", "parent_id", "post_title",
+    "text_score", "text_created_utc", "text_url", "text", "type", "post_comment_count",
+]
 
-    # ===== 新增：把 df_p 拆成 post 行 和 comment 行（因为 posts 阶段已经会顺便抓评论） =====
-    df_p_posts = pd.DataFrame()
-    df_p_comments = pd.DataFrame()
 
-    if not df_p.empty:
-        if "comment_id" not in df_p.columns:
-            df_p["comment_id"] = ""
-        mask_is_comment = df_p["comment_id"].notna() & (df_p["comment_id"].astype(str).str.strip() != "")
-        df_p_comments = df_p[mask_is_comment].copy()
-        df_p_posts = df_p[~mask_is_comment].copy()
-    else:
-        df_p_posts = df_p
-        df_p_comments = pd.DataFrame()
-
-    body = df_p_posts.get("post_body")
-    title = df_p_posts.get("post_title")
-
-    if "post_body" not in df_p_posts.columns:
-        df_p_posts["post_body"] = ""
-        body = df_p_posts["post_body"]
-    if "post_title" not in df_p_posts.columns:
-        df_p_posts["post_title"] = ""
-        title = df_p_posts["post_title"]
-
-    #mask_empty_body = body.isna() | (body.astype(str).str.strip() == "")
-    #df_p_posts.loc[mask_empty_body, "post_body"] = title.astype(str)
-
-    if "post_id" in df_p_posts.columns:
-        before = len(df_p_posts)
-        df_p_posts = df_p_posts.drop_duplicates(subset=["post_id"])
-        rt.log(f"[去重] posts: {before} -> {len(df_p_posts)} （按 post_id；body空则用title填充）")
-    else:
-        rt.log("[提示] posts 缺少 post_id 列，跳过去重（按 post_id）")
-
-    # comments：按 comment_body 去重
-    if not df_c.empty and "comment_body" in df_c.columns:
-        df_c = df_c[df_c["comment_body"].notna() & (df_c["comment_body"].astype(str).str.strip() != "")]
-        before = len(df_c)
-        df_c = df_c.drop_duplicates(subset=["comment_body"])
-        rt.log(f"[去重] comments: {before} -> {len(df_c)} （按 comment_body）")
-
-    # posts阶段顺便抓到的 comments：按 comment_body 去重
-    if not df_p_comments.empty:
-        if "comment_body" in df_p_comments.columns:
-            df_p_comments = df_p_comments[
-                df_p_comments["comment_body"].notna() & (df_p_comments["comment_body"].astype(str).str.strip() != "")]
-            before = len(df_p_comments)
-            df_p_comments = df_p_comments.drop_duplicates(subset=["comment_body"])
-            rt.log(f"[去重] posts_comments: {before} -> {len(df_p_comments)} （按 comment_body）")
-
-    out_p = pd.DataFrame()
-    if not df_p_posts.empty:
-        out_p["post_subreddit"] = df_p_posts.get("post_subreddit")
-        out_p["username"] = df_p_posts.get("post_author")
-        out_p["author_flair"] = df_p_posts.get("post_author_flair")
-        out_p["id"] = df_p_posts.get("post_id")
-        out_p["parent_id"] = pd.NA
-        out_p["post_title"] = df_p_posts.get("post_title")
-        out_p["text_score"] = df_p_posts.get("post_score")
-        out_p["text_created_utc"] = df_p_posts.get("post_created_utc")
-        out_p["text_url"] = df_p_posts.get("post_url")
-        out_p["_post_url"] = df_p_posts.get("post_url")
-        out_p["text"] = df_p_posts.get("post_body")
-        out_p["type"] = "post"
-
-    def build_out_c(df_src: pd.DataFrame) -> pd.DataFrame:
-        out = pd.DataFrame()
-        if df_src is None or df_src.empty:
-            return out
-        out["post_subreddit"] = df_src.get("post_subreddit")
-        out["username"] = df_src.get("comment_author")
-        out["author_flair"] = df_src.get("comment_author_flair")
-        out["id"] = df_src.get("comment_id")
-        out["parent_id"] = df_src.get("comment_parent_id")
-        out["post_title"] = df_src.get("post_title")
-        out["text_score"] = df_src.get("comment_score")
-        out["text_created_utc"] = df_src.get("comment_created_utc")
-        out["_post_url"] = df_src.get("post_url")
+def _iter_csv_chunks(path: str, chunk_rows: int = FINALIZE_CHUNK_ROWS, **read_kwargs):
+    """按块读取 CSV；文件不存在或为空时什么都不产出。"""
+    if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, **read_kwargs):
+        yield chunk
+
+
+def _nonempty_mask(series: pd.Series) -> pd.Series:
+    return series.notna() & (series.astype(str).str.strip() != "")
+
+
+def _dedupe_key(v) -> bytes:
+    """去重键：16 字节摘要，长文本也只占固定内存；NaN 视为同一个值（与 drop_duplicates 一致）。"""
+    if pd.isna(v):
+        return b"\0"
+    return hashlib.blake2b(str(v).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def _first_seen_mask(values: pd.Series, seen: set) -> pd.Series:
+    keep = []
+    for v in values:
+        k = _dedupe_key(v)
+        if k in seen:
+            keep.append(False)
+        else:
+            seen.add(k)
+            keep.append(True)
+    # 用 Series 而不是 list：空块时 df[[]] 会被当成选列
+    return pd.Series(keep, index=values.index, dtype=bool)
+
+
+def _merged_view(df: pd.DataFrame, kind: str) -> pd.DataFrame:
+    if kind == "post":
+        return pd.DataFrame({
+            "post_subreddit": df["post_subreddit"],
+            "username": df["post_author"],
+            "author_flair": df["post_author_flair"],
+            "id": df["post_id"],
+            "parent_id": pd.NA,
+            "post_title": df["post_title"],
+            "text_score": df["post_score"],
+            "text_created_utc": df["post_created_utc"],
+            "text_url": df["post_url"],
+            "_post_url": df["post_url"],
+            "text": df["post_body"],
+            "type": "post",
+        })
+    return pd.DataFrame({
+        "post_subreddit": df["post_subreddit"],
+        "username": df["comment_author"],
+        "author_flair": df["comment_author_flair"],
+        "id": df["comment_id"],
+        "parent_id": df["comment_parent_id"],
+        "post_title": df["post_title"],
+        "text_score": df["comment_score"],
+        "text_created_utc": df["comment_created_utc"],
         # ✅ 需求：merged 中 type=comment 的 text_url 改为 comment_url
-        out["text_url"] = df_src.get("comment_url")
-        out["text"] = df_src.get("comment_body")
-        out["type"] = "comment"
-        return out
+        "text_url": df["comment_url"],
+        "_post_url": df["post_url"],
+        "text": df["comment_body"],
+        "type": "comment",
+    })
 
-    out_c1 = build_out_c(df_p_comments)  # posts阶段顺便抓的评论
-    out_c2 = build_out_c(df_c)          # comments搜索抓的评论
-    out_c = pd.concat([out_c1, out_c2], ignore_index=True)
 
-    final_df = pd.concat([out_p, out_c], ignore_index=True)
+def _spool_append(path: str, df: pd.DataFrame):
+    if df.empty:
+        return
+    df.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
 
-    # merged：按 id 去重（post_id / comment_id）
-    if not final_df.empty and "id" in final_df.columns:
-        before = len(final_df)
 
-        # id 不能为空
-        final_df = final_df[
-            final_df["id"].notna() &
-            (final_df["id"].astype(str).str.strip() != "")
-        ]
+# Excel 单个 sheet 最多 1,048,576 行（含表头）
+XLSX_MAX_DATA_ROWS = 1048576 - 1
 
-        final_df = final_df.drop_duplicates(subset=["id"])
 
-        # ✅ 统计 merged（去重后）里各 type 数量
-        merged_posts = 0
-        merged_comments = 0
-        if "type" in final_df.columns:
-            merged_posts = int((final_df["type"] == "post").sum())
-            merged_comments = int((final_df["type"] == "comment").sum())
+class StreamingXlsxBook:
+    """
+    逐行落盘的 xlsx 写入器，整个 workbook 不驻留内存：
+      - 装了 xlsxwriter：constant_memory 模式（更快）
+      - 否则：openpyxl write_only 模式
+    单元格一律按原值写入：标题/正文以 "=" 开头也写成文本，不会变成公式；数字样的字符串不转数字。
+    """
 
-        # ✅ 把统计结果写回 runtime_state（给 UI 用）
-        with rt.state_lock:
-            rt.runtime_state["comments_saved"] = int(
-                rt.runtime_state.get("comments_saved", 0)
-            ) + merged_comments
+    def __init__(self, path: str):
+        self.path = path
+        if xlsxwriter is not None:
+            self.engine = "xlsxwriter"
+            self._wb = xlsxwriter.Workbook(path, {
+                "constant_memory": True,
+                "strings_to_urls": False,
+                "strings_to_formulas": False,
+                "strings_to_numbers": False,
+            })
+        else:
+            self.engine = "openpyxl"
+            self._wb = Workbook(write_only=True)
+
+    def add_sheet(self, name: str, header):
+        """新建 sheet 并写表头，返回 append(row) 函数。"""
+        if self.engine == "xlsxwriter":
+            ws = self._wb.add_worksheet(name)
+            ws.write_row(0, 0, header)
+            next_row = [1]
+
+            def append(row):
+                ws.write_row(next_row[0], 0, row)
+                next_row[0] += 1
+            return append
+
+        ws = self._wb.create_sheet(name)
+        ws.append(list(header))
+
+        def append(row):
+            # openpyxl 把 "=" 开头的字符串当公式：显式写成文本单元格
+            ws.append([self._text_cell(ws, v) if isinstance(v, str) and v.startswith("=") else v for v in row])
+        return append
+
+    @staticmethod
+    def _text_cell(ws, value):
+        cell = WriteOnlyCell(ws, value)
+        cell.data_type = "s"
+        return cell
+
+    def close(self):
+        if self.engine == "xlsxwriter":
+            self._wb.close()
+        else:
+            self._wb.save(self.path)
 
-        rt.log(f"[去重] merged: {before} -> {len(final_df)} （按 id）")
 
-    # ✅ 新增：merged 子表里统计每个 post 对应的评论数（仅填充 type==post 行）
-    try:
-        final_df["post_comment_count"] = ""
-        if (not final_df.empty) and ("type" in final_df.columns) and ("_post_url" in final_df.columns):
-            comment_counts = (
-                final_df[final_df["type"] == "comment"]
-                .groupby("_post_url")
-                .size()
-            )
-            mask_post = final_df["type"] == "post"
-            final_df.loc[mask_post, "post_comment_count"] = (
-                final_df.loc[mask_post, "_post_url"].map(comment_counts).fillna(0).astype(int)
-            )
-    except Exception:
-        pass
+def _xlsx_value(v):
+    # NaN/NA 写成空单元格；numpy 标量转成 Python 原生类型
+    if v is None or v is pd.NA or (isinstance(v, float) and v != v):
+        return None
+    if hasattr(v, "item"):
+        return v.item()
+    return v
 
-    # 统计完成后，删除内部字段（避免影响你下游使用）
-    if "_post_url" in final_df.columns:
-        try:
-            final_df = final_df.drop(columns=["_post_url"])
-        except Exception:
-            pass
 
-    # ✅ 写 3 个子表：posts / comments / merged
-    with pd.ExcelWriter(xlsx_path, engine="openpyxl") as writer:
-        # ✅ posts 子表：直接写 raw_posts.csv 的全量内容（post + comments）
-        (df_p if not df_p.empty else pd.DataFrame(columns=CSV_HEADERS)).to_excel(
-            writer, sheet_name="posts", index=False
-        )
+def _write_sheet_rows(book: StreamingXlsxBook, name: str, chunks, columns) -> list:
+    """
+    逐块逐行写入；超过 Excel 行数上限时自动续写到 name_2、name_3 ……
+    没有任何数据时只写表头。返回 [(sheet 名, 数据行数), ...]。
+    """
+    header = None
+    append = None
+    written = []
+    for chunk in chunks:
+        if header is None:
+            header = [str(c) for c in chunk.columns]
+        for row in chunk.itertuples(index=False, name=None):
+            if append is None or written[-1][1] >= XLSX_MAX_DATA_ROWS:
+                sheet = name if not written else f"{name}_{len(written) + 1}"
+                append = book.add_sheet(sheet, header)
+                written.append([sheet, 0])
+            append([_xlsx_value(v) for v in row])
+            written[-1][1] += 1
+    if not written:
+        book.add_sheet(name, header or list(columns))
+        written.append([name, 0])
+    return [tuple(w) for w in written]
+
+
+def _stream_merge(rt: CrawlerRuntime, out_posts: str, out_comments: str, spool_dir: str) -> dict:
+    """
+    三趟顺序扫描 raw CSV，把 merged 拆成 posts / comments 两个落盘分片：
+      1) raw_posts 中的 post 行：按 post_id 去重
+      2) raw_posts 中顺带抓的 comment 行：按 comment_body 去重
+      3) raw_comments：按 comment_body 去重（同时落盘 comments 子表）
+    raw CSV 一律按文本读取（不做类型推断），去重键与落盘分片都不会丢前导 0 等原文；
+    merged 按 id 去重，顺序与原先 concat([out_p, out_c1, out_c2]) 一致；
+    post_comment_count 在扫描 comment 时顺便累计。
+    """
+    st = {
+        "spool_posts": os.path.join(spool_dir, "merged_posts.csv"),
+        "spool_comments": os.path.join(spool_dir, "merged_comments.csv"),
+        "spool_c": os.path.join(spool_dir, "comments.csv"),
+        "posts_before": 0, "posts_after": 0,
+        "pc_before": 0, "pc_after": 0,
+        "c_before": 0, "c_after": 0,
+        "merged_before": 0, "merged_posts": 0, "merged_comments": 0,
+        "comment_counts": {},
+    }
+    merged_ids = set()
+    counts = st["comment_counts"]
+
+    def feed_merged(view: pd.DataFrame, spool_path: str, kind: str):
+        st["merged_before"] += len(view)
+        view = view[_nonempty_mask(view["id"])]
+        view = view[_first_seen_mask(view["id"], merged_ids)]
+        if kind == "comment":
+            st["merged_comments"] += len(view)
+            for u in view["_post_url"]:
+                if pd.notna(u):
+                    k = str(u)
+                    counts[k] = counts.get(k, 0) + 1
+        else:
+            st["merged_posts"] += len(view)
+        _spool_append(spool_path, view)
+
+    # 1) post 行
+    seen_pids = set()
+    for chunk in _iter_csv_chunks(out_posts, dtype=str):
+        chunk = chunk.reindex(columns=CSV_HEADERS)
+        posts = chunk[~_nonempty_mask(chunk["comment_id"])]
+        st["posts_before"] += len(posts)
+        posts = posts[_first_seen_mask(posts["post_id"], seen_pids)]
+        st["posts_after"] += len(posts)
+        feed_merged(_merged_view(posts, "post"), st["spool_posts"], "post")
+    seen_pids.clear()
+
+    # 2) posts 阶段顺带抓的评论
+    seen_bodies = set()
+    for chunk in _iter_csv_chunks(out_posts, dtype=str):
+        chunk = chunk.reindex(columns=CSV_HEADERS)
+        pc = chunk[_nonempty_mask(chunk["comment_id"])]
+        pc = pc[_nonempty_mask(pc["comment_body"])]
+        st["pc_before"] += len(pc)
+        pc = pc[_first_seen_mask(pc["comment_body"], seen_bodies)]
+        st["pc_after"] += len(pc)
+        feed_merged(_merged_view(pc, "comment"), st["spool_comments"], "comment")
+
+    # 3) comments 搜索抓的评论（去重集合独立于第 2 步，与原逻辑一致）
+    seen_bodies = set()
+    for chunk in _iter_csv_chunks(out_comments, dtype=str):
+        c = chunk[_nonempty_mask(chunk["comment_body"])]
+        st["c_before"] += len(c)
+        c = c[_first_seen_mask(c["comment_body"], seen_bodies)]
+        st["c_after"] += len(c)
+        _spool_append(st["spool_c"], c)
+        feed_merged(_merged_view(c.reindex(columns=CSV_HEADERS), "comment"), st["spool_comments"], "comment")
+    seen_bodies.clear()
+    merged_ids.clear()
+
+    return st
+
+
+def _iter_merged_chunks(st: dict, **read_kwargs):
+    counts = st["comment_counts"]
+
+    def post_count(u):
+        return counts.get(str(u), 0) if pd.notna(u) else 0
+
+    for chunk in _iter_csv_chunks(st["spool_posts"], **read_kwargs):
+        chunk["post_comment_count"] = chunk["_post_url"].map(post_count).astype(int)
+        yield chunk.reindex(columns=MERGED_COLUMNS)
+    for chunk in _iter_csv_chunks(st["spool_comments"], **read_kwargs):
+        chunk["post_comment_count"] = ""
+        yield chunk.reindex(columns=MERGED_COLUMNS)
 
-        # 2) comments 子表：清洗/去重后的 df_c
-        (df_c if not df_c.empty else pd.DataFrame(columns=CSV_HEADERS)).to_excel(
-            writer, sheet_name="comments", index=False
-        )
 
-        # 3) 合并子表：final_df（你原来的合并逻辑不变 + 新增列）
-        final_df.to_excel(writer, sheet_name="merged", index=False)
+# =========================
+# 输出格式：xlsx / parquet
+# =========================
+OUTPUT_FORMATS = ("xlsx", "parquet", "both")
+PARQUET_DATASET_DIR = "Reddit_parquet"
+
+_INT_COLUMNS = {
+    "post_ups", "post_downs", "post_score",
+    "comment_ups", "comment_downs", "comment_score",
+    "text_score", "post_comment_count",
+}
+_DATE_COLUMNS = {"post_created_utc", "comment_created_utc", "text_created_utc"}
+
+
+def output_formats(rt: CrawlerRuntime) -> set:
+    """cfg["output_format"]：xlsx（默认）/ parquet / both；未安装 pyarrow 时回退 xlsx。"""
+    fmt = str(rt.cfg.get("output_format") or "xlsx").strip().lower()
+    if fmt not in OUTPUT_FORMATS:
+        rt.log(f"[提示] 未知输出格式 {fmt!r}，按 xlsx 输出")
+        fmt = "xlsx"
+    formats = {"xlsx", "parquet"} if fmt == "both" else {fmt}
+    if "parquet" in formats and pq is None:
+        rt.log("[提示] 未安装 pyarrow，无法输出 parquet，改为 xlsx")
+        formats = {"xlsx"}
+    return formats
+
+
+def _parquet_schema(columns):
+    fields = []
+    for c in columns:
+        if c in _INT_COLUMNS:
+            fields.append(pa.field(c, pa.int64()))
+        elif c in _DATE_COLUMNS:
+            fields.append(pa.field(c, pa.date32()))
+        else:
+            fields.append(pa.field(c, pa.string()))
+    return pa.schema(fields)
+
+
+def _arrow_table(chunk: pd.DataFrame, schema) -> "pa.Table":
+    """按 schema 转换一块数据：数值列 int64，日期列 date32，其余 string；无法解析的值记为 null。"""
+    chunk = chunk.reindex(columns=schema.names)
+    arrays = []
+    for field in schema:
+        col = chunk[field.name]
+        if pa.types.is_int64(field.type):
+            col = pd.to_numeric(col, errors="coerce").astype("Int64")
+        elif pa.types.is_date32(field.type):
+            col = pd.to_datetime(col, errors="coerce", format="%Y-%m-%d").dt.date
+        else:
+            col = col.astype(object).where(col.notna(), None)
+        arrays.append(pa.array(col, type=field.type, from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
 
-    abs_xlsx = os.path.abspath(xlsx_path)
-    rt.log(f"[完成] 输出: {abs_xlsx} | sheets=3 | posts={len(df_p_posts)} | comments={len(df_c)} | merged={len(final_df)}")
+def _write_xlsx(rt: CrawlerRuntime, xlsx_path: str, sheets) -> list:
+    book = StreamingXlsxBook(xlsx_path)
+    written = []
+    try:
+        for name, chunks_fn, columns in sheets:
+            # 只有数值列做类型推断；文本列固定为 str，避免不同分块推断结果不一致
+            dtypes = {c: str for c in list(columns) + ["_post_url"] if c not in _INT_COLUMNS}
+            parts = _write_sheet_rows(book, name, chunks_fn(dtype=dtypes), columns)
+            if len(parts) > 1:
+                rt.log(f"[拆分] {name} 超过 Excel 行数上限，已拆成 {len(parts)} 个子表："
+                       f"{', '.join(f'{n}({c})' for n, c in parts)}")
+            written.extend(parts)
+    finally:
+        book.close()
+    return written
+
+
+def _write_parquet(output_dir: str, group: str, file_prefix: str, sheets, compression: str) -> list:
+    """
+    每个子表一个数据集，按关键词组做 hive 分区：
+      Reddit_parquet/<sheet>/group=<group>/<file_prefix>.parquet
+    pd.read_parquet("Reddit_parquet/merged") 可直接读出全部组（带 group 列）。
+    """
+    part = "group=" + quote(str(group), safe="")
+    paths = []
+    for name, chunks_fn, columns in sheets:
+        part_dir = os.path.join(output_dir, PARQUET_DATASET_DIR, name, part)
+        os.makedirs(part_dir, exist_ok=True)
+        path = os.path.join(part_dir, f"{file_prefix}.parquet")
+        schema = _parquet_schema(columns)
+        with pq.ParquetWriter(path, schema, compression=compression) as w:
+            # 全部按文本读入再显式转换，避免 id/正文被推断成数字
+            for chunk in chunks_fn(dtype=str):
+                w.write_table(_arrow_table(chunk, schema))
+        paths.append(os.path.abspath(path))
+    return paths
+
+
+def finalize_outputs(rt: CrawlerRuntime, file_prefix: str, output_dir: str, copy_to_desktop: bool = False,
+                     group: str = None) -> list:
+    out_posts = os.path.join(output_dir, f"{file_prefix}_raw_posts.csv")
+    out_comments = os.path.join(output_dir, f"{file_prefix}_raw_comments.csv")
+
+    xlsx_path = os.path.join(output_dir, f"{file_prefix}.xlsx")
+    formats = output_formats(rt)
+    outputs = []
+    t0 = time.perf_counter()
+    timings = {}
+    sheet_count = 3
+
+    # 中间分片落在输出目录下的临时目录，结束后整体删除
+    spool_dir = tempfile.mkdtemp(prefix=f".{file_prefix}_finalize_", dir=output_dir)
+    try:
+        st = _stream_merge(rt, out_posts, out_comments, spool_dir)
+        timings["merge"] = time.perf_counter() - t0
+
+        rt.log(f"[去重] posts: {st['posts_before']} -> {st['posts_after']} （按 post_id）")
+        rt.log(f"[去重] comments: {st['c_before']} -> {st['c_after']} （按 comment_body）")
+        if st["pc_before"]:
+            rt.log(f"[去重] posts_comments: {st['pc_before']} -> {st['pc_after']} （按 comment_body）")
+
+        merged_total = st["merged_posts"] + st["merged_comments"]
+        with rt.state_lock:
+            rt.runtime_state["comments_saved"] = int(
+                rt.runtime_state.get("comments_saved", 0)
+            ) + st["merged_comments"]
+        rt.log(f"[去重] merged: {st['merged_before']} -> {merged_total} （按 id）")
+
+        # ✅ 3 个子表：posts / comments / merged（逐块写入，不整表载入内存）
+        sheets = [
+            # posts：直接写 raw_posts.csv 的全量内容（post + comments）
+            ("posts", lambda **kw: _iter_csv_chunks(out_posts, **kw), CSV_HEADERS),
+            # comments：清洗/去重后的 comments
+            ("comments", lambda **kw: _iter_csv_chunks(st["spool_c"], **kw), CSV_HEADERS),
+            # merged：post 行在前、comment 行在后，post 行带 post_comment_count
+            ("merged", lambda **kw: _iter_merged_chunks(st, **kw), MERGED_COLUMNS),
+        ]
+        if "xlsx" in formats:
+            t = time.perf_counter()
+            sheet_count = len(_write_xlsx(rt, xlsx_path, sheets))
+            outputs.append(os.path.abspath(xlsx_path))
+            timings["xlsx"] = time.perf_counter() - t
+        if "parquet" in formats:
+            t = time.perf_counter()
+            compression = str(rt.cfg.get("parquet_compression") or "zstd")
+            outputs.extend(_write_parquet(output_dir, group or file_prefix, file_prefix, sheets, compression))
+            timings["parquet"] = time.perf_counter() - t
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    total_s = time.perf_counter() - t0
+    with rt.state_lock:
+        rt.runtime_state["finalize_s"] = float(rt.runtime_state.get("finalize_s", 0.0)) + total_s
+    rt.log(f"[耗时] finalize {total_s:.2f}s | " + " | ".join(f"{k}={v:.2f}s" for k, v in timings.items()))
+    rt.log(f"[完成] 输出: {' | '.join(outputs)} | sheets={sheet_count} | posts={st['posts_after']} | comments={st['c_after']} | merged={merged_total}")
 
-    # ✅ 桌面复制：交给页面开关控制（不勾就不复制）
-    if copy_to_desktop:
+    # ✅ 桌面复制：交给页面开关控制（不勾就不复制；仅 xlsx）
+    if copy_to_desktop and "xlsx" in formats:
+        abs_xlsx = os.path.abspath(xlsx_path)
         try:
             desk = desktop_dir()
             stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1198,14 +3615,191 @@ def finalize_outputs(rt: CrawlerRuntime, file_prefix: str, output_dir: str, copy
             os.remove(out_posts)
         if os.path.exists(out_comments):
             os.remove(out_comments)
-        rt.log("[清理] 已删除临时 raw_posts/raw_comments CSV（仅保留 xlsx）")
+        rt.log("[清理] 已删除临时 raw_posts/raw_comments CSV（仅保留最终输出）")
     except Exception as e:
         rt.log(f"[清理失败] {e}")
 
-    return abs_xlsx
+    return outputs
+
+
+def package_outputs(rt: CrawlerRuntime, output_dir: str, outputs: list):
+    """单个 xlsx 直接返回；多个文件或含 parquet 时打包成 zip（保留分区目录结构）。"""
+    if not outputs:
+        return None
+    if len(outputs) == 1 and outputs[0].lower().endswith(".xlsx"):
+        return outputs[0]
+    zip_path = os.path.join(output_dir, f"Reddit_outputs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+    import zipfile
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for p in outputs:
+            if p and os.path.exists(p):
+                z.write(p, arcname=os.path.relpath(p, output_dir))
+    rt.log(f"[打包] 结果已打包：{os.path.abspath(zip_path)} | files={len(outputs)}")
+    return os.path.abspath(zip_path)
+
+
+# =========================
+# 全局任务调度（关键词组 × subreddit × 关键词）
+# =========================
+class WorkScheduler:
+    """
+    整个任务摊平成（关键词组, subreddit, 关键词）小任务，由一组常驻 worker 取用：
+    - 组间加权公平：每组一个虚拟时间，每派发一个任务加 1/权重，总是派给虚拟时间最小的组
+      （cfg group_priority={组名: 权重}，默认 1；权重 2 的组大约拿到 2 倍的派发份额，同权重轮流）
+    - 组内按 subreddit、关键词的原顺序派发
+    - 某组任务全部结束即由 drained() 交给调用线程 finalize，不占 worker；
+      停止信号之后才结束的组任务可能被中途打断，completed() 为 False
+    任务在开始前一次性登记，worker 取不到任务就退出，不会空等。
+    """
+
+    def __init__(self, rt: CrawlerRuntime, run_task):
+        self.rt = rt
+        self.run_task = run_task
+        self.cond = threading.Condition()
+        self._groups = {}
+        self._drained = deque()
+        self._live = 0
+
+    def add_group(self, group, tasks, weight: float = 1.0):
+        with self.cond:
+            self._groups[group] = {"pending": deque(tasks), "running": 0,
+                                   "weight": max(float(weight), 0.01), "vtime": 0.0, "completed": True}
+            if not tasks:
+                self._drained.append(group)
+
+    def _take(self):
+        with self.cond:
+            if self.rt.stop_event.is_set():
+                return None
+            ready = [(name, g) for name, g in self._groups.items() if g["pending"]]
+            if not ready:
+                return None
+            # 虚拟时间相同取先登记的组
+            name, g = min(ready, key=lambda item: item[1]["vtime"])
+            g["vtime"] += 1.0 / g["weight"]
+            g["running"] += 1
+            return name, g["pending"].popleft()
+
+    def _done(self, group):
+        with self.cond:
+            g = self._groups[group]
+            g["running"] -= 1
+            if not g["running"] and not g["pending"]:
+                g["completed"] = not self.rt.stop_event.is_set()
+                self._drained.append(group)
+                self.cond.notify_all()
+
+    def completed(self, group) -> bool:
+        """排空的组是否在停止前正常跑完（否则其最后的任务可能被停止打断）"""
+        with self.cond:
+            return self._groups[group]["completed"]
+
+    def _worker(self):
+        try:
+            while True:
+                self.rt.wait_if_paused_or_stopped()
+                item = self._take()
+                if item is None:
+                    return
+                group, task = item
+                try:
+                    self.run_task(group, task)
+                except Exception as e:
+                    self.rt.log(f"[调度] 任务异常 group={group} task={task} | {e}")
+                finally:
+                    self._done(group)
+        finally:
+            with self.cond:
+                self._live -= 1
+                self.cond.notify_all()
+
+    def start(self, executor, workers: int):
+        """在 executor（线程池或 PooledFetchEngine）上启动 worker，数量不超过任务总数"""
+        with self.cond:
+            total = sum(len(g["pending"]) for g in self._groups.values())
+            n = max(min(int(workers), total), 0)
+            self._live = n
+        for _ in range(n):
+            executor.submit(self._worker)
+        self.rt.log(f"[调度] 关键词组={len(self._groups)} | 任务={total} | worker={n}")
+
+    def drained(self):
+        """按排空顺序逐个产出关键词组；worker 全部退出且没有待处理的组时结束"""
+        while True:
+            with self.cond:
+                while not self._drained and self._live:
+                    self.cond.wait()
+                if not self._drained:
+                    return
+                group = self._drained.popleft()
+            yield group
+
+    def join(self):
+        with self.cond:
+            while self._live:
+                self.cond.wait()
 
 
 def run_crawler(rt: CrawlerRuntime):
+    """
+    跑一次抓取任务。cfg 除 UI 传入的基础项（mode / 日期 / keyword_groups / com_down …）外，可选项及默认值：
+    - engine="threads"：设为 "pooled" 时所有任务共用抓取线程池，在途请求上限 fetch_concurrency=32
+    - parse_processes=0：>0 时搜索页 / 帖子 JSON 交给多进程解析
+    - post_cache=False：帖子 JSON 磁盘缓存（post_cache_dir / post_cache_ttl_s / post_cache_max_mb）
+    - only_new=False / seen_store：跨运行去重，跳过以往运行已导出的帖子 / 评论
+    - listing_comments=True：空格关键词走 listing(new) 时顺带拉帖子详情抓评论；
+      False 时每页只发 1 个 listing 请求（listing_detail_workers 默认 max_workers）
+    - expand_more_comments=True / more_workers=4 / comment_hydration="thread"：评论树展开与补全方式
+    - checkpoint=False：每 checkpoint_interval_s=30 秒落一次检查点（会让写线程刷盘），中断后 resume=True 续爬
+    - search_parser="fast" / output_format="xlsx" / group_priority={}
+    """
+    engine = str(rt.cfg.get("engine", "threads")).lower()
+    if engine == "asyncio":
+        # 旧配置名：从来不是事件循环，实际就是共享抓取线程池
+        rt.log('[引擎] engine="asyncio" 已弃用，按 engine="pooled"（共享抓取线程池）运行；'
+               'async_concurrency 请改为 fetch_concurrency')
+        engine = "pooled"
+    if engine == "pooled":
+        concurrency = int(rt.cfg.get("fetch_concurrency") or rt.cfg.get("async_concurrency") or 32)
+        # 连接池要能容纳全部在途请求
+        rt.http_pool_size = max(rt.http_pool_size, concurrency)
+        rt.fetch_engine = PooledFetchEngine(rt, concurrency, job_workers=int(rt.cfg.get("max_workers", 4)))
+        rt.log(f"[引擎] 共享抓取池 | 请求线程={concurrency}")
+    parse_processes = int(rt.cfg.get("parse_processes") or 0)
+    if parse_processes > 0:
+        rt.parse_pool = ParsePool(rt, parse_processes,
+                                  shm_min_bytes=int(rt.cfg.get("parse_shm_min_bytes", PARSE_SHM_MIN_BYTES)))
+        rt.log(f"[解析] 多进程解析 | 进程数={parse_processes}")
+    completed = False
+    try:
+        result = _run_crawler(rt)
+        completed = not rt.stop_event.is_set()
+        return result
+    finally:
+        # 正常跑完删除检查点；停止/异常时落一次最新检查点，供续爬
+        if rt.checkpoint is not None:
+            if completed:
+                rt.checkpoint.clear()
+            else:
+                rt.checkpoint.save()
+                rt.log(f"[检查点] 已保存：{rt.checkpoint.dir}（可用续爬从中断处继续）")
+        # 任务结束（含停止/异常）统一释放引擎与连接池
+        if rt.fetch_engine is not None:
+            rt.fetch_engine.close()
+            rt.fetch_engine = None
+        if rt.parse_pool is not None:
+            rt.parse_pool.close()
+            rt.parse_pool = None
+        rt.close_detail_pool()
+        rt.close_writers()
+        rt.close_sessions()
+        rt.close_seen_store()
+        if rt.post_cache is not None:
+            rt.post_cache.flush()
+        rt.mark_idle_after_stop()
+
+
+def _run_crawler(rt: CrawlerRuntime):
     cfg = rt.cfg
     mode = str(cfg.get("mode", "1"))  # 1=全站 2=指定社群
     subreddits = str(cfg.get("subreddits", ""))
@@ -1223,6 +3817,8 @@ def run_crawler(rt: CrawlerRuntime):
     rt.log("=== Reddit Crawler ===")
     rt.log(f"模式: {'全站' if mode == '1' else '指定社群'} | 日期: {start_date} -> {end_date} | workers={max_workers}")
     rt.log(f"输出目录: {os.path.abspath(output_dir)}")
+    if rt.seen_store is not None:
+        rt.log(f"[去重库] {rt.seen_store.path} | 仅抓新增={'是' if rt.only_new else '否'}")
 
     # 如果选择了 LINK 模式 (mode == "3")，跳过日期和数量参数，直接抓取链接
     if mode == "3":
@@ -1281,17 +3877,9 @@ def run_crawler(rt: CrawlerRuntime):
             rt.update_state(posts_fetched=cur_posts)
 
             # 写 comment 行（含楼中楼）
-            all_c = []
-            try:
-                flatten_comments(data[1]["data"]["children"], all_c)
-            except Exception:
-                all_c = []
-
-            for c in all_c:
+            for c in thread_comments(rt, data, pid, skip_blocked=True):
                 if rt.stop_event.is_set():
                     break
-                if is_blocked_author(c.get("author")):
-                    continue
                 rows.append(prepare_row(post_info, c, f"link_comments_{i}"))
                 with rt.state_lock:
                     rt.runtime_state["comments_fetched"] += 1
@@ -1312,17 +3900,22 @@ def run_crawler(rt: CrawlerRuntime):
             rt.log("[系统] 已停止：跳过 finalize")
             return None
 
-        out_xlsx = finalize_outputs(rt, file_prefix, output_dir,
-                                    copy_to_desktop=bool(cfg.get("copy_to_desktop", False)))
+        rt.close_writers([out_posts_csv, out_comments_csv])
+        outputs = finalize_outputs(rt, file_prefix, output_dir,
+                                   copy_to_desktop=bool(cfg.get("copy_to_desktop", False)), group="LINKS")
+        rt.commit_seen([out_posts_csv, out_comments_csv])
+        final_path = package_outputs(rt, output_dir, outputs)
+        with rt.state_lock:
+            rt.runtime_state["output_files"] = outputs
 
         rt.update_state(
             posts_saved=int(rt.runtime_state.get("posts_fetched", 0)),
             comments_saved=int(rt.runtime_state.get("comments_fetched", 0)),
             end_ts=time.time(),
-            status="finished"
+            status="failed" if rt.runtime_state.get("write_error") else "finished"
         )
         rt.log("[任务结束]")
-        return out_xlsx
+        return final_path
 
     # 处理其他模式（mode == 1 或 mode == 2），即全站模式或指定社群模式
     if sort_option == "new":
@@ -1346,14 +3939,53 @@ def run_crawler(rt: CrawlerRuntime):
         targets = subs if subs else [None]
         sub_label = "MULTI" if len(targets) > 1 else (targets[0] or "ALL")
 
+    # 断点续爬：检查点放在输出目录下（cfg checkpoint=True 开启，默认关闭；resume=True 从检查点继续）
+    if cfg.get("checkpoint", False) or cfg.get("resume"):
+        rt.checkpoint = CrawlCheckpoint(rt, output_dir, interval_s=float(cfg.get("checkpoint_interval_s", 30)))
+        if cfg.get("resume"):
+            rt.checkpoint.load()
+
     outputs = []
+    copy_to_desktop = bool(cfg.get("copy_to_desktop", False))
+    group_priority = cfg.get("group_priority") or {}
+    allow_space = (mode != "1") and bool(cfg.get("allow_space_keyword", False))
+    group_files = {}  # group -> (file_prefix, out_posts_csv, out_comments_csv)
+
+    def run_task(group, task):
+        sub, kw = task
+        _, out_posts_csv, out_comments_csv = group_files[group]
+        label = kw if len(group_files) == 1 else f"{group}/{kw}"
+        with rt.state_lock:
+            rt._active_keywords[label] += 1
+            rt.runtime_state["active_keywords"] = sorted(rt._active_keywords)
+            rt.runtime_state["current_keyword"] = kw
+            rt.runtime_state["current_group"] = group
+        rt._emit_state()
+        try:
+            if str(kw).strip() == "":
+                rt.log(f"[策略] r/{sub} 空格关键词：改走 listing(new) 仅抓 Posts（可顺带抓评论），跳过 search")
+                crawl_posts_listing_for_subreddit(rt, sub, start_ts, end_ts, out_posts_csv)
+            elif com_down == "是":
+                crawl_posts_for_keyword(rt, kw, sub, start_ts, end_ts, out_posts_csv)
+                crawl_comments_for_keyword(rt, kw, sub, start_ts, end_ts, out_comments_csv)
+            else:
+                crawl_posts_for_keyword(rt, kw, sub, start_ts, end_ts, out_posts_csv)
+        except Exception as e:
+            rt.log(f"[线程错误] group={group} sub={sub or 'ALL'} kw={kw} | {e}")
+            rt.log(traceback.format_exc())
+        finally:
+            with rt.state_lock:
+                rt._active_keywords[label] -= 1
+                if rt._active_keywords[label] <= 0:
+                    del rt._active_keywords[label]
+                rt.runtime_state["active_keywords"] = sorted(rt._active_keywords)
+                if not rt._active_keywords:
+                    rt.runtime_state["current_keyword"] = None
+            rt._emit_state()
 
-    for group, kws in (keyword_groups or {}).items():
-        if rt.stop_event.is_set():
-            break
-        allow_space_keyword = bool(cfg.get("allow_space_keyword", False))
-        allow_space = (mode != "1") and allow_space_keyword
+    scheduler = WorkScheduler(rt, run_task)
 
+    for group, kws in (keyword_groups or {}).items():
         norm_kws = []
         for k in (kws or []):
             if k is None:
@@ -1376,86 +4008,77 @@ def run_crawler(rt: CrawlerRuntime):
         out_posts_csv = os.path.join(output_dir, f"{file_prefix}_raw_posts.csv")
         out_comments_csv = os.path.join(output_dir, f"{file_prefix}_raw_comments.csv")
 
-        for path in [out_posts_csv, out_comments_csv]:
-            with open(path, "w", newline="", encoding="utf-8-sig") as f:
-                w = csv.DictWriter(f, fieldnames=CSV_HEADERS)
-                w.writeheader()
-
-        rt.log(f"\n=== 关键词组: {group} | 前缀: {file_prefix} ===")
-        rt.update_state(current_group=group)
-
-        for sub in targets:
-            if rt.stop_event.is_set():
-                break
-            rt.wait_if_paused_or_stopped()
-            rt.log(f">>> Subreddit: {sub or 'ALL'}")
-
-            def job(kw):
-                if str(kw).strip() == "":
-                    rt.log("[策略] 指定社群空格关键词：改走 listing(new) 仅抓 Posts（可顺带抓评论），跳过 search")
-                    crawl_posts_listing_for_subreddit(rt, sub, start_ts, end_ts, out_posts_csv)
-                    return
-                if com_down=="是":
-                    crawl_posts_for_keyword(rt, kw, sub, start_ts, end_ts, out_posts_csv)
-                    crawl_comments_for_keyword(rt, kw, sub, start_ts, end_ts, out_comments_csv)
-                else:
-                    crawl_posts_for_keyword(rt, kw, sub, start_ts, end_ts, out_posts_csv)
-
-            with ThreadPoolExecutor(max_workers=max_workers) as ex:
-                futures = {}
-                for kw in kws:
-                    with rt.state_lock:
-                        rt._active_keywords.add(kw)
-                        rt.runtime_state["active_keywords"] = sorted(rt._active_keywords)
-                        rt.runtime_state["current_keyword"] = kw
-                    rt._emit_state()
-
-                    futures[ex.submit(job, kw)] = kw
-
-                for fu in as_completed(futures):
-                    kw_done = futures.get(fu)
-                    try:
-                        fu.result()
-                    except Exception as e:
-                        rt.log(f"[线程错误] kw={kw_done} | {e}")
-                        rt.log(traceback.format_exc())
-                    finally:
-                        with rt.state_lock:
-                            if kw_done in rt._active_keywords:
-                                rt._active_keywords.remove(kw_done)
-                            rt.runtime_state["active_keywords"] = sorted(rt._active_keywords)
-                            if not rt._active_keywords:
-                                rt.runtime_state["current_keyword"] = None
-                        rt._emit_state()
+        done_outputs = rt.checkpoint.finalized_outputs(file_prefix) if rt.checkpoint is not None else None
+        if done_outputs is not None:
+            rt.log(f"[续爬] 关键词组 {group} 已完成，跳过")
+            outputs.extend(done_outputs)
+            continue
 
-        if rt.stop_event.is_set():
-            rt.log("[系统] 已停止：跳过 finalize")
-            break
+        resumed = rt.checkpoint is not None and rt.checkpoint.begin_group([out_posts_csv, out_comments_csv])
+        if not resumed:
+            for path in [out_posts_csv, out_comments_csv]:
+                with open(path, "w", newline="", encoding="utf-8-sig") as f:
+                    w = csv.DictWriter(f, fieldnames=CSV_HEADERS)
+                    w.writeheader()
+
+        group_files[group] = (file_prefix, out_posts_csv, out_comments_csv)
+        # 组内顺序与原来一致：subreddit 在外层、关键词在内层
+        scheduler.add_group(group, [(sub, kw) for sub in targets for kw in kws],
+                            weight=float(group_priority.get(group, 1) or 1))
+        rt.log(f"=== 关键词组: {group} | 前缀: {file_prefix} | 任务={len(targets) * len(kws)} ===")
+
+    # 一个常驻 worker 池跑全部任务；共享抓取池下 worker 跑在池的任务线程上
+    if rt.fetch_engine is not None:
+        ex_ctx = contextlib.nullcontext(rt.fetch_engine)
+    else:
+        ex_ctx = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawl")
+    def finalize_group(group):
+        file_prefix, out_posts_csv, out_comments_csv = group_files[group]
+        paths = [out_posts_csv, out_comments_csv]
 
         update = {
             "processed_groups": rt.runtime_state["processed_groups"] + 1,
         }
-        if rt.runtime_state.get("current_group_has_data"):
+        with rt.state_lock:
+            has_data = any(p in rt.data_files for p in paths)
+        if has_data:
             update["hit_group"] = group
-
         rt.update_state(**update)
-        rt.runtime_state["current_group_has_data"] = False
-
-        out_xlsx = finalize_outputs(rt, file_prefix, output_dir,
-                                    copy_to_desktop=bool(cfg.get("copy_to_desktop", False)))
-        if out_xlsx:
-            outputs.append(out_xlsx)
-
-    final_path = outputs[-1] if outputs else None
-    if len(outputs) > 1:
-        zip_path = os.path.join(output_dir, f"Reddit_outputs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
-        import zipfile
-        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as z:
-            for p in outputs:
-                if p and os.path.exists(p):
-                    z.write(p, arcname=os.path.basename(p))
-        rt.log(f"[打包] 多组结果已打包：{os.path.abspath(zip_path)} | files={len(outputs)}")
-        final_path = os.path.abspath(zip_path)
+
+        rt.close_writers(paths)
+        if rt.checkpoint is not None:
+            rt.checkpoint.seal_group(paths)
+        group_outputs = finalize_outputs(rt, file_prefix, output_dir,
+                                         copy_to_desktop=copy_to_desktop, group=group)
+        outputs.extend(group_outputs)
+        rt.commit_seen(paths)
+        if rt.checkpoint is not None:
+            rt.checkpoint.finish_group(file_prefix, group_outputs, paths)
+
+    with ex_ctx as ex:
+        scheduler.start(ex, max_workers)
+        try:
+            # 某组任务排空就在本线程 finalize，其余组继续占满 worker；
+            # 停止后仍把停止前已跑完的组逐个 finalize，被打断的组留给检查点续爬
+            for group in scheduler.drained():
+                if not scheduler.completed(group):
+                    rt.log(f"[系统] 已停止：关键词组 {group} 未跑完，跳过 finalize")
+                    continue
+                try:
+                    finalize_group(group)
+                except Exception as e:
+                    # 单组 finalize 失败不影响其他组
+                    rt.log(f"[线程错误] finalize 关键词组 {group} 失败 | {e}")
+                    rt.log(traceback.format_exc())
+        except BaseException:
+            # 中断（KeyboardInterrupt 等）：让 worker 尽快收手（检查点照常保存），不要在后台继续跑完全部任务
+            rt.stop_event.set()
+            raise
+        finally:
+            # 停止时等 worker 各自退出，再交给 run_crawler 收尾
+            scheduler.join()
+
+    final_path = package_outputs(rt, output_dir, outputs)
 
     with rt.state_lock:
         rt.runtime_state["output_files"] = [os.path.abspath(p) for p in outputs]
@@ -1465,7 +4088,7 @@ def run_crawler(rt: CrawlerRuntime):
         posts_saved=int(rt.runtime_state.get("posts_fetched", 0)),
         comments_saved=int(rt.runtime_state.get("comments_saved", 0)),
         end_ts=time.time(),
-        status="finished"
+        status="failed" if rt.runtime_state.get("write_error") else "finished"
     )
 
     rt.log("[任务结束]")
@@ -361,6 +361,27 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# ✅ 新增：断点续爬（选择被中断任务的输出目录，按检查点里保存的配置继续）
+resumable = sorted(
+    (p for p in BASE_DIR.glob("outputs_*") if (p / "_checkpoint" / "state.json").exists()),
+    key=lambda p: (p / "_checkpoint" / "state.json").stat().st_mtime,
+    reverse=True,
+)
+if resumable and not st.session_state.running:
+    with st.expander(f"断点续爬（{len(resumable)} 个中断的任务）"):
+        resume_dir = st.selectbox(
+            "选择中断的任务",
+            resumable,
+            format_func=lambda p: f"{p.name}（{time.strftime('%Y-%m-%d %H:%M', time.localtime((p / '_checkpoint' / 'state.json').stat().st_mtime))}）"
+        )
+        if st.button("从检查点继续", type="primary"):
+            resume_cfg = core.CrawlCheckpoint.saved_cfg(resume_dir)
+            if not resume_cfg:
+                st.error("检查点不存在或已损坏，无法续爬。")
+            else:
+                resume_cfg.update(output_dir=resume_dir, resume=True)
+                start_crawl(resume_cfg)
+
 if mode == "3":
     left, right = st.columns([1.08, 0.92], gap="large")
     with left:
@@ -440,7 +461,7 @@ if mode == "3":
             if s["total_groups"] > 0:
                 st.progress(s["processed_groups"] / s["total_groups"])
 
-        if s and s.get("status") == "finished":
+        if s and s.get("status") in ("finished", "failed"):
             total = int(s["end_ts"] - s["start_ts"])
             h, m, sec = total // 3600, (total % 3600) // 60, total % 60
 
@@ -466,7 +487,7 @@ if mode == "3":
                 mtime = os.path.getmtime(out_path)
 
                 if out_path.lower().endswith(".zip"):
-                    st.caption("已生成多个关键词组结果，已自动打包为 ZIP。请下载后解压查看各组 Excel。")
+                    st.caption("已生成多个结果文件（多个关键词组或 Parquet），已自动打包为 ZIP。请下载后解压查看。")
                 else:
                     sheet = st.selectbox("预览子表", ["merged", "posts", "comments"], index=0)
                     df = read_excel_cached(out_path, mtime, sheet)
@@ -542,6 +563,15 @@ if mode == "1":
                 index=1,  # 默认选择 "是"
                 disabled=st.session_state.running
             )
+            output_format = st.selectbox(
+                "输出格式",
+                # 没装 pyarrow 时只提供 xlsx
+                options=["xlsx", "parquet", "both"] if core.pq is not None else ["xlsx"],
+                index=0,  # 默认 xlsx
+                format_func=lambda x: {"xlsx": "Excel（xlsx）", "parquet": "Parquet（按关键词组分区）",
+                                       "both": "Excel + Parquet"}[x],
+                disabled=st.session_state.running
+            )
 
 
 
@@ -556,6 +586,20 @@ if mode == "1":
             value=st.session_state.auto_download_enabled,
             disabled=st.session_state.running
         )
+        # ✅ 新增：增量抓取（跳过以往运行已导出过的帖子/评论）
+        only_new = st.checkbox(
+            "仅抓取新增（跳过以往运行已抓过的帖子/评论）",
+            value=False,
+            disabled=st.session_state.running,
+            key="only_new_all"
+        )
+        # 断点续爬：定时保存检查点（中断后可在“断点续爬”里继续）
+        use_checkpoint = st.checkbox(
+            "保存断点（中断后可续爬）",
+            value=False,
+            disabled=st.session_state.running,
+            key="checkpoint_all"
+        )
         # ✅ 新增：是否允许“空格关键词”爬取（仅指定社群模式可选）
 
         st.markdown("### 关键词组（每行一个组）")
@@ -618,7 +662,10 @@ if mode == "1":
                         "sort": sort_option,
                         "post_count": post_count,
                         "t":t_option,
-                        "com_down":com_down
+                        "com_down":com_down,
+                        "output_format": output_format,
+                        "only_new": bool(only_new),
+                        "checkpoint": bool(use_checkpoint)
                     }
                     start_crawl(cfg)
 
@@ -657,7 +704,7 @@ if mode == "1":
 
             if s["total_groups"] > 0:
                 st.progress(s["processed_groups"] / s["total_groups"])
-        if s and s.get("status") == "finished":
+        if s and s.get("status") in ("finished", "failed"):
             total = int(s["end_ts"] - s["start_ts"])
             h, m, sec = total // 3600, (total % 3600) // 60, total % 60
 
@@ -682,7 +729,7 @@ if mode == "1":
                 mtime = os.path.getmtime(out_path)
 
                 if out_path.lower().endswith(".zip"):
-                    st.caption("已生成多个关键词组结果，已自动打包为 ZIP。请下载后解压查看各组 Excel。")
+                    st.caption("已生成多个结果文件（多个关键词组或 Parquet），已自动打包为 ZIP。请下载后解压查看。")
                 else:
                     sheet = st.selectbox("预览子表", ["merged", "posts", "comments"], index=0)
                     df = read_excel_cached(out_path, mtime, sheet)
@@ -765,6 +812,15 @@ if mode == "2":
                 index=1,  # 默认选择 "是"
                 disabled=st.session_state.running
             )
+            output_format = st.selectbox(
+                "输出格式",
+                # 没装 pyarrow 时只提供 xlsx
+                options=["xlsx", "parquet", "both"] if core.pq is not None else ["xlsx"],
+                index=0,  # 默认 xlsx
+                format_func=lambda x: {"xlsx": "Excel（xlsx）", "parquet": "Parquet（按关键词组分区）",
+                                       "both": "Excel + Parquet"}[x],
+                disabled=st.session_state.running
+            )
 
         # 如果选择了 "new" 排序方式，保留日期范围；否则设置日期为全选范围
         if sort_option != "new":
@@ -786,6 +842,26 @@ if mode == "2":
                 value=False,
                 disabled=st.session_state.running
             )
+            # 空格关键词走 listing(new)：不抓评论时每页只需 1 个请求
+            listing_comments = st.checkbox(
+                "爬取所有贴文时顺带抓评论（每帖多 1 个请求）",
+                value=True,
+                disabled=st.session_state.running or not allow_space_keyword
+            )
+        # ✅ 新增：增量抓取（跳过以往运行已导出过的帖子/评论）
+        only_new = st.checkbox(
+            "仅抓取新增（跳过以往运行已抓过的帖子/评论）",
+            value=False,
+            disabled=st.session_state.running,
+            key="only_new_sub"
+        )
+        # 断点续爬：定时保存检查点（中断后可在“断点续爬”里继续）
+        use_checkpoint = st.checkbox(
+            "保存断点（中断后可续爬）",
+            value=False,
+            disabled=st.session_state.running,
+            key="checkpoint_sub"
+        )
 
         st.markdown("### 关键词组（每行一个组）")
         kg_df = st.data_editor(
@@ -846,10 +922,14 @@ if mode == "2":
                         "output_dir": output_dir,
                         "copy_to_desktop": False,
                         "allow_space_keyword": bool(allow_space_keyword),
+                        "listing_comments": bool(listing_comments),
                         "sort": sort_option,
                         "post_count": post_count,
                         "t":t_option,
                         "com_down": com_down,
+                        "output_format": output_format,
+                        "only_new": bool(only_new),
+                        "checkpoint": bool(use_checkpoint),
                     }
                     start_crawl(cfg)
 
@@ -888,7 +968,7 @@ if mode == "2":
 
             if s["total_groups"] > 0:
                 st.progress(s["processed_groups"] / s["total_groups"])
-        if s and s.get("status") == "finished":
+        if s and s.get("status") in ("finished", "failed"):
             total = int(s["end_ts"] - s["start_ts"])
             h, m, sec = total // 3600, (total % 3600) // 60, total % 60
 
@@ -913,7 +993,7 @@ if mode == "2":
                 mtime = os.path.getmtime(out_path)
 
                 if out_path.lower().endswith(".zip"):
-                    st.caption("已生成多个关键词组结果，已自动打包为 ZIP。请下载后解压查看各组 Excel。")
+                    st.caption("已生成多个结果文件（多个关键词组或 Parquet），已自动打包为 ZIP。请下载后解压查看。")
                 else:
                     sheet = st.selectbox("预览子表", ["merged", "posts", "comments"], index=0)
                     df = read_excel_cached(out_path, mtime, sheet)
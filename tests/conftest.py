@@ -0,0 +1,136 @@
+import contextlib
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import Get_Red as core  # noqa: E402
+
+
+class FakeResponse:
+    """requests.Response 的最小替身：content / encoding / text / json()"""
+
+    def __init__(self, body, status_code=200, encoding="utf-8"):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode(encoding)
+        self.content = body
+        self.encoding = encoding
+        self.status_code = status_code
+        self.headers = {}
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def query(url: str) -> dict:
+    return {k: v[0] for k, v in parse_qs(urlparse(url).query).items()}
+
+
+def iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def post_data(pid: str, created_utc: float = 1.7e9, sub: str = "s") -> dict:
+    return {"id": pid, "name": f"t3_{pid}", "subreddit": sub, "title": f"T{pid}", "selftext": "",
+            "author": "a", "created_utc": created_utc, "permalink": f"/r/{sub}/comments/{pid}/x/",
+            "score": 3, "ups": 3, "downs": 0, "num_comments": 0}
+
+
+def comment_data(cid: str, parent: str, created_utc: float = 1.7e9, replies=None, sub: str = "s",
+                 pid: str = "p0") -> dict:
+    return {"kind": "t1", "data": {
+        "id": cid, "name": f"t1_{cid}", "parent_id": parent, "link_id": f"t3_{pid}", "author": f"u{cid}",
+        "body": f"b{cid}", "created_utc": created_utc, "score": 1, "ups": 1, "downs": 0,
+        "permalink": f"/r/{sub}/comments/{pid}/x/{cid}/", "replies": replies or "",
+    }}
+
+
+def thread_json(pid: str, children, created_utc: float = 1.7e9) -> list:
+    return [
+        {"kind": "Listing", "data": {"children": [{"kind": "t3", "data": post_data(pid, created_utc)}]}},
+        {"kind": "Listing", "data": {"children": list(children)}},
+    ]
+
+
+def posts_search_html(items, cursor=None) -> str:
+    """items: [(post_id, created_utc)]，结构同 Reddit 搜索页（标题链接 + 带 created-timestamp 的帖子节点）"""
+    parts = []
+    for pid, ts in items:
+        parts.append(
+            f'<div><a data-testid="post-title" href="/r/s/comments/{pid}/t/">T{pid}</a>'
+            f'<shreddit-post post-id="t3_{pid}" created-timestamp="{iso(ts)}"></shreddit-post></div>'
+        )
+    if cursor:
+        parts.append(f'<faceplate-partial src="/svc/shreddit/search?q=k&amp;cursor={cursor}" loading="lazy">'
+                     f'</faceplate-partial>')
+    return "<html><body>" + "".join(parts) + "</body></html>"
+
+
+def comments_search_html(items, cursor=None) -> str:
+    """items: [(subreddit, post_id, comment_id)]，结构同 Reddit 评论搜索页（评论卡片 + tracking context）"""
+    parts = []
+    for sub, pid, cid in items:
+        ctx = json.dumps({"comment": {"id": f"t1_{cid}"}, "post": {"id": f"t3_{pid}"}, "subreddit": {"name": sub}})
+        ctx = ctx.replace("&", "&amp;").replace('"', "&quot;")
+        parts.append(
+            f'<div data-testid="search-sdui-comment-unit">'
+            f'<search-telemetry-tracker data-faceplate-tracking-context="{ctx}"><p>b{cid}</p>'
+            f'</search-telemetry-tracker></div>'
+        )
+    if cursor:
+        parts.append(f'<faceplate-partial src="/svc/shreddit/search?q=k&amp;type=comment&amp;cursor={cursor}" '
+                     f'loading="lazy"></faceplate-partial>')
+    return "<html><body>" + "".join(parts) + "</body></html>"
+
+
+@pytest.fixture
+def make_rt(tmp_path):
+    made = []
+
+    def make(**cfg):
+        base = {"mode": "2", "post_cache": False, "sort": "new", "t": "all", "output_dir": str(tmp_path)}
+        base.update(cfg)
+        rt = core.CrawlerRuntime(base, lambda m: None)
+        made.append(rt)
+        return rt
+
+    yield make
+    for rt in made:
+        rt.close_detail_pool()
+        rt.close_writers()
+        rt.close_sessions()
+        rt.close_seen_store()
+
+
+@pytest.fixture
+def fake_get(monkeypatch):
+    """按 URL 路由的 robust_get 替身；handler(url) 返回 body（dict/list/str）或 None（请求失败）"""
+    calls = []
+
+    def install(handler):
+        def robust_get(rt, url, max_retries=4, timeout=8, request_lock=None):
+            calls.append(url)
+            with request_lock or contextlib.nullcontext():
+                body = handler(url)
+            if body is None:
+                return None, False, 0
+            return FakeResponse(body), True, 200
+
+        monkeypatch.setattr(core, "robust_get", robust_get)
+        return calls
+
+    return install
@@ -0,0 +1,170 @@
+import csv
+import os
+
+import pandas as pd
+
+import Get_Red as core
+from conftest import comment_data, comments_search_html, posts_search_html, query, thread_json
+
+CFG = dict(subreddits="s", start_date="2024-01-01", end_date="2024-12-31", keyword_groups={"g": ["k"]})
+
+
+def row(pid, cid=None):
+    r = [None] * len(core.CSV_HEADERS)
+    r[core._ROW_POST_ID] = pid
+    r[core._ROW_COMMENT_ID] = cid
+    return tuple(r)
+
+
+def new_group(tmp_path):
+    paths = [str(tmp_path / "g_raw_posts.csv"), str(tmp_path / "g_raw_comments.csv")]
+    for p in paths:
+        with open(p, "w", newline="", encoding="utf-8-sig") as f:
+            csv.writer(f).writerow(core.CSV_HEADERS)
+    return paths
+
+
+def start(make_rt, tmp_path, **cfg):
+    rt = make_rt(**{**CFG, **cfg})
+    rt.checkpoint = core.CrawlCheckpoint(rt, str(tmp_path))
+    return rt
+
+
+def test_save_and_load_restore_cursors_and_counters(make_rt, tmp_path):
+    rt = start(make_rt, tmp_path)
+    posts, comments = new_group(tmp_path)
+    assert rt.checkpoint.begin_group([posts, comments]) is False
+    task = core.checkpoint_task("posts", posts, "s", "k")
+    core.save_cursor(rt, task, cursor="abc", page=3)
+    rt.runtime_state["posts_fetched"] = 7
+    rt.checkpoint.save()
+
+    rt2 = start(make_rt, tmp_path)
+    assert rt2.checkpoint.load()
+    assert core.task_cursor(rt2, task) == {"cursor": "abc", "page": 3}
+    assert rt2.runtime_state["posts_fetched"] == 7
+
+
+def test_changed_config_ignores_checkpoint(make_rt, tmp_path):
+    rt = start(make_rt, tmp_path)
+    rt.checkpoint.update(core.checkpoint_task("posts", "x.csv", "s", "k"), page=2)
+    rt.checkpoint.save()
+    assert not start(make_rt, tmp_path, end_date="2025-01-31").checkpoint.load()
+
+
+def test_begin_group_truncates_rows_written_after_the_checkpoint(make_rt, tmp_path):
+    rt = start(make_rt, tmp_path)
+    posts, comments = new_group(tmp_path)
+    rt.checkpoint.begin_group([posts, comments])
+    core.append_rows(rt, posts, [row("p1"), row("p1", "c1")])
+    core.append_rows(rt, comments, [row("p1", "c2")])
+    rt.checkpoint.save()
+    saved_size = os.path.getsize(posts)
+    core.append_rows(rt, posts, [row("p2")])  # 检查点之后才写的行
+    rt.close_writers()
+    assert os.path.getsize(posts) > saved_size
+
+    rt2 = start(make_rt, tmp_path)
+    rt2.checkpoint.load()
+    assert rt2.checkpoint.begin_group([posts, comments]) is True
+    assert os.path.getsize(posts) == saved_size
+    assert "p1" in rt2.seen_posts and "c2" in rt2.seen_comments
+    assert "p2" not in rt2.seen_posts
+    # posts 阶段顺带抓的评论不进 seen_comments（与不中断的运行一致）
+    assert "c1" not in rt2.seen_comments
+
+
+def test_begin_group_without_saved_data_drops_stale_cursors(make_rt, tmp_path):
+    rt = start(make_rt, tmp_path)
+    posts, comments = new_group(tmp_path)
+    task = core.checkpoint_task("posts", posts, "s", "k")
+    rt.checkpoint.update(task, page=5)
+    rt.checkpoint.save()
+    os.remove(comments)
+
+    rt2 = start(make_rt, tmp_path)
+    rt2.checkpoint.load()
+    assert rt2.checkpoint.begin_group([posts, comments]) is False
+    assert core.task_cursor(rt2, task) == {}
+
+
+def test_finished_group_is_skipped_and_its_ids_stay_seen(make_rt, tmp_path):
+    rt = start(make_rt, tmp_path)
+    posts, comments = new_group(tmp_path)
+    rt.checkpoint.begin_group([posts, comments])
+    core.append_rows(rt, posts, [row("p1"), row("p1", "c1")])
+    core.append_rows(rt, comments, [row("p1", "c2")])
+    rt.close_writers()
+    rt.checkpoint.seal_group([posts, comments])
+    rt.checkpoint.finish_group("g", ["g.xlsx"], [posts, comments])
+
+    rt2 = start(make_rt, tmp_path)
+    rt2.checkpoint.load()
+    assert rt2.checkpoint.finalized_outputs("g") == ["g.xlsx"]
+    assert "p1" in rt2.seen_posts and "c2" in rt2.seen_comments
+    assert "c1" not in rt2.seen_comments
+
+
+def test_finished_task_is_not_crawled_again(make_rt, tmp_path, fake_get):
+    calls = fake_get(lambda url: None)
+    rt = start(make_rt, tmp_path)
+    posts, _ = new_group(tmp_path)
+    task = core.checkpoint_task("listing", posts, "s", "")
+    core.finish_task(rt, task)
+    core.crawl_posts_listing_for_subreddit(rt, "s", 0, 2e9, posts)
+    assert calls == []
+
+    rt.stop_event.set()
+    core.finish_task(rt, core.checkpoint_task("listing", posts, "t", ""))
+    assert core.task_cursor(rt, core.checkpoint_task("listing", posts, "t", "")) == {}
+
+
+NEW_TS = 1.7e9
+THREADS = {"p1": ["c1", "c2"], "p2": ["c9"]}
+
+
+def crawl_handler(url):
+    if "/search/" in url:
+        if query(url)["type"] == "comments":
+            return comments_search_html([("s", "p1", "c1"), ("s", "p2", "c9")])
+        return posts_search_html([(pid, NEW_TS) for pid in THREADS])
+    pid = url.split("/comments/")[1].split("/")[0].split(".")[0]
+    return thread_json(pid, [comment_data(cid, f"t3_{pid}", NEW_TS, pid=pid) for cid in THREADS[pid]], NEW_TS)
+
+
+def run_group(make_rt, out_dir, **cfg):
+    rt = make_rt(output_dir=str(out_dir), subreddits="s", start_date="2023-01-01", end_date="2024-12-31",
+                 keyword_groups={"g": ["k"]}, com_down="是", max_workers=1, checkpoint=True, **cfg)
+    core.run_crawler(rt)
+    return pd.read_excel(out_dir / "Reddit_g_in_s.xlsx", sheet_name=None)
+
+
+def test_resumed_run_matches_uninterrupted_run(make_rt, fake_get, monkeypatch, tmp_path):
+    fake_get(crawl_handler)
+    full = run_group(make_rt, tmp_path / "full")
+
+    # 第一次在 posts 阶段结束后被停止，第二次从检查点续爬
+    crawl_comments = core.crawl_comments_for_keyword
+    monkeypatch.setattr(core, "crawl_comments_for_keyword", lambda rt, *a: rt.stop_event.set())
+    rt = make_rt(output_dir=str(tmp_path / "resumed"), subreddits="s", start_date="2023-01-01",
+                 end_date="2024-12-31", keyword_groups={"g": ["k"]}, com_down="是", max_workers=1, checkpoint=True)
+    core.run_crawler(rt)
+    assert (tmp_path / "resumed" / "_checkpoint" / "state.json").exists()
+    monkeypatch.setattr(core, "crawl_comments_for_keyword", crawl_comments)
+    resumed = run_group(make_rt, tmp_path / "resumed", resume=True)
+
+    assert full.keys() == resumed.keys()
+    for name in full:
+        pd.testing.assert_frame_equal(full[name], resumed[name], obj=name)
+    assert len(full["comments"]) == 2  # 命中的评论也在 posts 阶段出现过，续爬后不能被去重掉
+
+
+def test_checkpoint_is_opt_in(make_rt, fake_get, monkeypatch, tmp_path):
+    fake_get(crawl_handler)
+    saves = []
+    monkeypatch.setattr(core.CrawlCheckpoint, "save", lambda self, blocking=True: saves.append(blocking))
+    rt = make_rt(output_dir=str(tmp_path / "plain"), subreddits="s", start_date="2023-01-01", end_date="2024-12-31",
+                 keyword_groups={"g": ["k"]}, com_down="是", max_workers=1)
+    core.run_crawler(rt)
+    assert saves == []
+    assert not (tmp_path / "plain" / "_checkpoint").exists()
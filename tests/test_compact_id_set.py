@@ -0,0 +1,73 @@
+import random
+
+import Get_Red as core
+
+
+def base36(n):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if not n:
+            return out
+
+
+def test_matches_builtin_set_across_compactions():
+    rng = random.Random(7)
+    ids = core.CompactIdSet(buffer_size=16)
+    ref = set()
+    for _ in range(2000):
+        item = base36(rng.randrange(5000)) if rng.random() < 0.95 else f"x-{rng.randrange(50)}"
+        assert ids.add_if_absent(item) == (item not in ref)
+        ref.add(item)
+    assert len(ids) == len(ref)
+    assert all(i in ids for i in ref)
+    assert not any(base36(n) in ids for n in range(5000, 5100))
+    assert len(ids._runs) <= 12  # 段数 O(log n)
+
+
+def test_dump_and_load_roundtrip(tmp_path):
+    ids = core.CompactIdSet(buffer_size=8)
+    items = [base36(n * 37) for n in range(100)]
+    for i in items:
+        ids.add_if_absent(i)
+    ids.dump(tmp_path / "ids.bin")
+    loaded = core.CompactIdSet()
+    loaded.load(tmp_path / "ids.bin")
+    assert len(loaded) == 100
+    assert all(i in loaded for i in items)
+    assert not loaded.add_if_absent(items[3])
+    assert loaded.add_if_absent("zzzz")
+
+
+def test_memory_bytes_tracks_growth():
+    ids = core.CompactIdSet(buffer_size=64)
+    empty = ids.memory_bytes()
+    for n in range(1000):
+        ids.add_if_absent(base36(n))
+    assert ids.memory_bytes() > empty
+    assert ids.memory_bytes() < 1000 * 64
+
+
+def test_serialize_state_caches_seen_stats(make_rt, monkeypatch):
+    rt = make_rt()
+    rt._seen_stats_ts -= core.SEEN_STATS_INTERVAL_S
+    rt.seen_posts.add_if_absent("abc")
+    calls = []
+    real = core.CompactIdSet.memory_bytes
+    monkeypatch.setattr(core.CompactIdSet, "memory_bytes", lambda self: calls.append(1) or real(self))
+    first = rt.serialize_state()
+    for _ in range(100):
+        rt.serialize_state()
+    assert first["seen_ids"] == 1
+    assert len(calls) == 2  # 两个集合各算一次
+
+    rt.seen_comments.add_if_absent("def")
+    assert rt.serialize_state()["seen_ids"] == 1
+    rt._seen_stats_ts -= core.SEEN_STATS_INTERVAL_S
+    assert rt.serialize_state()["seen_ids"] == 2
+
+    rt.seen_comments.add_if_absent("ghi")
+    rt.runtime_state["status"] = "finished"
+    assert rt.serialize_state()["seen_ids"] == 3
@@ -0,0 +1,69 @@
+import csv
+
+import pytest
+
+import Get_Red as core
+
+
+def row(pid, cid=None):
+    r = [None] * len(core.CSV_HEADERS)
+    r[core._ROW_POST_ID] = pid
+    r[core._ROW_COMMENT_ID] = cid
+    return tuple(r)
+
+
+def read_ids(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [r["post_id"] for r in csv.DictReader(f)]
+
+
+@pytest.fixture
+def bad_rows_fail(monkeypatch):
+    real = core.format_row
+
+    def format_row(r):
+        if r[core._ROW_POST_ID] == "bad":
+            raise ValueError("boom")
+        return real(r)
+
+    monkeypatch.setattr(core, "format_row", format_row)
+
+
+def test_bad_row_only_drops_itself(make_rt, bad_rows_fail, tmp_path):
+    rt = make_rt()
+    path = str(tmp_path / "posts.csv")
+    core.append_rows(rt, path, [row("a"), row("bad"), row("b")])
+    core.append_rows(rt, path, [row("c")])
+    rt.close_writers()
+
+    assert read_ids(path) == ["a", "b", "c"]
+    assert rt.runtime_state["rows_failed"] == 1
+    assert rt.runtime_state["write_error"] is None
+
+
+def test_only_written_rows_are_marked_seen(make_rt, bad_rows_fail, tmp_path):
+    rt = make_rt(seen_store=str(tmp_path / "seen.sqlite"))
+    path = str(tmp_path / "posts.csv")
+    core.append_rows(rt, path, [row("a"), row("bad")])
+    rt.close_writers()
+    rt.commit_seen([path])
+    assert rt.seen_store.known("p", ["a", "bad"]) == {"a"}
+
+
+def test_file_error_reaches_producer_and_fails_run(make_rt, tmp_path):
+    rt = make_rt()
+    path = str(tmp_path / "posts.csv")
+    w = rt.csv_writer(path)
+
+    class Broken:
+        def writerows(self, rows):
+            raise OSError("disk full")
+
+    w.w = Broken()
+    w.put([row("a")])
+    with pytest.raises(OSError, match="disk full"):
+        w.sync()
+    with pytest.raises(OSError):
+        core.append_rows(rt, path, [row("b")])
+    assert "disk full" in rt.runtime_state["write_error"]
+    rt.close_writers()
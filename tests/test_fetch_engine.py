@@ -0,0 +1,67 @@
+import threading
+import time
+
+import Get_Red as core
+
+START, END = 1.7e9, 1.8e9
+OLD, NEW = 1.6e9, 1.75e9
+
+
+def metas(*items):
+    return [{"post_id_short": pid, "created_utc": ts} for pid, ts in items]
+
+
+def test_prefetch_stops_at_consecutive_old_posts():
+    page = metas(("a", NEW), *[(f"o{i}", OLD) for i in range(5)], ("b", NEW), ("c", NEW))
+    assert core.posts_to_prefetch(page, set(), set(), START, END) == ["a"]
+    # 上一页已累计 4 个旧帖：本页第一个旧帖就停
+    page = metas(("o0", OLD), ("a", NEW))
+    assert core.posts_to_prefetch(page, set(), set(), START, END, consecutive_old=4) == []
+
+
+def test_prefetch_respects_remaining_count_and_skips_known():
+    page = metas(("a", NEW), ("k", NEW), ("b", None), ("c", NEW), ("d", NEW))
+    assert core.posts_to_prefetch(page, {"k"}, set(), START, END, limit=2) == ["a", "b"]
+    assert core.posts_to_prefetch(page, set(), {"a", "c"}, START, END) == ["k", "b", "d"]
+    assert core.posts_to_prefetch(page, set(), set(), START, END, limit=0) == []
+
+
+def test_pooled_engine_bounds_concurrency_and_keeps_order(make_rt):
+    rt = make_rt()
+    engine = core.PooledFetchEngine(rt, concurrency=3, job_workers=2)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def fetch(i):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        if i == 5:
+            raise ValueError("boom")
+        return i * 2
+
+    try:
+        out = engine.submit(engine.map, fetch, [(i,) for i in range(12)]).result()
+    finally:
+        engine.close()
+    assert out == [i * 2 if i != 5 else None for i in range(12)]
+    assert peak[0] == 3
+
+
+def test_asyncio_engine_name_maps_to_pooled_with_a_warning(make_rt, monkeypatch):
+    rt = make_rt(engine="asyncio", async_concurrency=5)
+    logs, seen = [], {}
+    rt.log_q = lambda m: logs.append(m) if isinstance(m, str) else None
+
+    def fake_run(rt):
+        seen["engine"] = rt.fetch_engine
+        return None
+
+    monkeypatch.setattr(core, "_run_crawler", fake_run)
+    core.run_crawler(rt)
+    assert isinstance(seen["engine"], core.PooledFetchEngine)
+    assert seen["engine"].concurrency == 5
+    assert any("已弃用" in m for m in logs)
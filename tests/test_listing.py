@@ -0,0 +1,58 @@
+import csv
+
+import Get_Red as core
+from conftest import comment_data, post_data, query, thread_json
+
+START_TS = 1.7e9
+END_TS = 1.8e9
+NEW_TS = 1.75e9
+
+
+def listing_handler(pages=2, per_page=3):
+    def handler(url):
+        if "/comments/" in url:
+            pid = url.split("/comments/")[1].split("/")[0].split(".")[0]
+            return thread_json(pid, [comment_data(f"c{pid}", f"t3_{pid}", NEW_TS, pid=pid)])
+        page = int(query(url).get("after", "0"))
+        nxt = str(page + 1) if page + 1 < pages else None
+        return {"data": {"after": nxt, "children": [{"kind": "t3", "data": post_data(f"p{page}x{i}", NEW_TS)}
+                                                    for i in range(per_page)]}}
+    return handler
+
+
+def test_listing_keeps_comments_by_default_and_reuses_one_pool(tmp_path, make_rt, fake_get, monkeypatch):
+    created = []
+
+    class CountingPool(core.ThreadPoolExecutor):
+        def __init__(self, *a, **kw):
+            created.append(kw.get("thread_name_prefix"))
+            super().__init__(*a, **kw)
+
+    monkeypatch.setattr(core, "ThreadPoolExecutor", CountingPool)
+    calls = fake_get(listing_handler())
+    rt = make_rt()
+    out = tmp_path / "posts.csv"
+    core.crawl_posts_listing_for_subreddit(rt, "s", START_TS, END_TS, str(out))
+    rt.close_writers()
+
+    assert len([u for u in calls if "/comments/" in u]) == 6
+    with open(out, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted(r["comment_id"] for r in rows if r["comment_id"]) == sorted(
+        f"cp{p}x{i}" for p in range(2) for i in range(3))
+    assert created.count("post-detail") == 1
+
+
+def test_listing_comments_can_be_switched_off(tmp_path, make_rt, fake_get):
+    calls = fake_get(listing_handler())
+    rt = make_rt(listing_comments=False)
+    core.crawl_posts_listing_for_subreddit(rt, "s", START_TS, END_TS, str(tmp_path / "posts.csv"))
+    assert [u for u in calls if "/comments/" in u] == []
+    assert rt.runtime_state["posts_fetched"] == 6
+
+
+def test_listing_comments_switch_is_part_of_the_checkpoint_fingerprint():
+    base = {"mode": "2", "subreddits": "s", "keyword_groups": {"g": [" "]}, "allow_space_keyword": True}
+    fp = core.CrawlCheckpoint._fingerprint
+    assert fp(base) == fp({**base, "listing_comments": None})
+    assert fp({**base, "listing_comments": True}) != fp({**base, "listing_comments": False})
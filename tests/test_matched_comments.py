@@ -0,0 +1,33 @@
+import Get_Red as core
+from conftest import comment_data, post_data, query
+
+
+def info_handler(url):
+    names = query(url)["id"].split(",")
+    children = []
+    for n in reversed(names):  # /api/info 不保证返回顺序
+        if n.startswith("t3_"):
+            children.append({"kind": "t3", "data": post_data(n[3:])})
+        else:
+            children.append(comment_data(n[3:], "t3_p1"))
+    return {"data": {"children": children}}
+
+
+def test_info_hydration_keeps_search_order(make_rt, fake_get):
+    ids = [f"c{i:02d}" for i in (7, 3, 11, 1, 9, 5, 2, 8)]
+    ptc = {("s", "p1"): ids, ("s", "p0"): ["z9", "a1"]}
+    for _ in range(5):
+        calls = fake_get(info_handler)
+        rt = make_rt(comment_hydration="info")
+        out = [(pi["post_id"], new, [c["id"] for c in matched])
+               for new, pi, matched in core.iter_matched_comments(rt, ptc)]
+        assert out == [("p1", ids, ids), ("p0", ["z9", "a1"], ["z9", "a1"])]
+        assert query(calls[0])["id"].split(",") == ["t3_p1", *(f"t1_{c}" for c in ids), "t3_p0", "t1_z9", "t1_a1"]
+
+
+def test_seen_comments_are_dropped_in_order(make_rt, fake_get):
+    fake_get(info_handler)
+    rt = make_rt(comment_hydration="info")
+    rt.seen_comments.add_if_absent("c3")
+    out = [new for new, _, _ in core.iter_matched_comments(rt, {("s", "p1"): ["c9", "c3", "c1"]})]
+    assert out == [["c9", "c1"]]
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import Get_Red as core
+from conftest import comment_data, thread_json
+
+
+def listing(children):
+    return {"kind": "Listing", "data": {"children": children}}
+
+
+def stub(parent_cid):
+    # “继续这个讨论串”：children 为空、id 为 "_"
+    return {"kind": "more", "data": {"id": "_", "name": "t1__", "parent_id": f"t1_{parent_cid}", "count": 0,
+                                     "children": []}}
+
+
+def deep_thread():
+    c2 = comment_data("c2", "t1_c1", replies=listing([stub("c2")]))
+    c1 = comment_data("c1", "t3_p0", replies=listing([c2]))
+    return thread_json("p0", [c1])
+
+
+def subtree_handler(url):
+    if "/comments/p0/_/c2.json" in url:
+        c4 = comment_data("c4", "t1_c3", replies=listing([stub("c4")]))
+        c3 = comment_data("c3", "t1_c2", replies=listing([c4]))
+        return thread_json("p0", [comment_data("c2", "t1_c1", replies=listing([c3]))])
+    if "/comments/p0/_/c4.json" in url:
+        return thread_json("p0", [comment_data("c4", "t1_c3", replies=listing([comment_data("c5", "t1_c4")]))])
+    return None
+
+
+def test_continue_this_thread_stubs_are_fetched(make_rt, fake_get):
+    calls = fake_get(subtree_handler)
+    rt = make_rt()
+    ids = [c["id"] for c in core.thread_comments(rt, deep_thread(), "p0")]
+    assert ids == ["c1", "c2", "c3", "c4", "c5"]
+    assert len(calls) == 2
+    assert rt.runtime_state["deep_thread_requests"] == 2
+
+
+def test_projection_keeps_stub_parent(make_rt, fake_get):
+    fake_get(subtree_handler)
+    rt = make_rt()
+    projected = core.project_post_json(deep_thread())
+    assert [c["id"] for c in core.thread_comments(rt, projected, "p0")] == ["c1", "c2", "c3", "c4", "c5"]
+
+
+def test_morechildren_requests_are_serialized(make_rt, fake_get):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def handler(url):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return {"json": {"data": {"things": []}}}
+
+    calls = fake_get(handler)
+    rt = make_rt(more_workers=8)
+    threads = [threading.Thread(target=core.expand_more_comments,
+                                args=(rt, f"p{n}", [f"m{n}x{i}" for i in range(350)])) for n in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 12  # 3 帖 × 4 批
+    assert peak[0] == 1
+
+
+def test_morechildren_lock_is_not_held_across_backoff(make_rt, monkeypatch):
+    rt = make_rt()
+    held_during_get, held_during_sleep = [], []
+
+    class Resp:
+        def __init__(self, status):
+            self.status_code = status
+            self.headers = {}
+
+        def json(self):
+            return {"json": {"data": {"things": [{"kind": "t1", "data": {"id": "c9"}}]}}}
+
+    class Session:
+        statuses = [429, 200]
+
+        def get(self, url, **kw):
+            held_during_get.append(rt.morechildren_lock.locked())
+            return Resp(self.statuses.pop(0))
+
+    monkeypatch.setattr(rt, "session", lambda proxy: Session())
+    monkeypatch.setattr(core, "interruptible_sleep",
+                        lambda rt_, s: held_during_sleep.append(rt.morechildren_lock.locked()))
+    things = core.fetch_more_children(rt, "p0", ["c9"])
+    assert [t["data"]["id"] for t in things] == ["c9"]
+    assert held_during_get == [True, True]
+    assert held_during_sleep and not any(held_during_sleep)
@@ -0,0 +1,73 @@
+import csv
+
+import Get_Red as core
+from conftest import posts_search_html, post_data, query
+
+START_TS = 1.7e9
+END_TS = 1.8e9
+OLD_TS = 1.6e9
+
+
+def seed_store(path, kind, ids):
+    store = core.SeenStore(path)
+    rows = []
+    for i in ids:
+        row = [""] * len(core.CSV_HEADERS)
+        if kind == "p":
+            row[core._ROW_POST_ID] = i
+        else:
+            row[core._ROW_COMMENT_ID] = i
+        rows.append(row)
+    store.mark_rows("seed", rows)
+    store.commit(["seed"])
+    store.close()
+
+
+def test_known_old_posts_still_stop_search_paging(tmp_path, make_rt, fake_get):
+    pages = 10
+    ids = {p: [f"p{p}x{i}" for i in range(10)] for p in range(pages)}
+    store = tmp_path / "seen.sqlite3"
+    seed_store(store, "p", [i for page in ids.values() for i in page])
+
+    def handler(url):
+        page = int(query(url).get("cursor", "0"))
+        nxt = str(page + 1) if page + 1 < pages else None
+        return posts_search_html([(i, OLD_TS) for i in ids[page]], cursor=nxt)
+
+    calls = fake_get(handler)
+    rt = make_rt(only_new=True, seen_store=str(store))
+    out = tmp_path / "posts.csv"
+    core.crawl_posts_for_keyword(rt, "k", "s", START_TS, END_TS, str(out))
+
+    # 第一页就有 5 个连续旧帖：不应继续翻页，也不应下载任何帖子详情
+    assert len(calls) == 1
+    assert rt.runtime_state["known_skipped"] == 10
+
+
+def test_known_old_posts_still_stop_listing(tmp_path, make_rt, fake_get):
+    pages = 10
+    store = tmp_path / "seen.sqlite3"
+    seed_store(store, "p", [f"p{p}x{i}" for p in range(pages) for i in range(10)])
+
+    def handler(url):
+        page = int(query(url).get("after", "0"))
+        nxt = str(page + 1) if page + 1 < pages else None
+        return {"data": {"after": nxt, "children": [{"kind": "t3", "data": post_data(f"p{page}x{i}", OLD_TS)}
+                                                    for i in range(10)]}}
+
+    calls = fake_get(handler)
+    rt = make_rt(only_new=True, seen_store=str(store), com_down="否")
+    core.crawl_posts_listing_for_subreddit(rt, "s", START_TS, END_TS, str(tmp_path / "posts.csv"))
+    assert len(calls) == 1
+
+
+def test_known_recent_posts_are_skipped_without_download(tmp_path, make_rt, fake_get):
+    store = tmp_path / "seen.sqlite3"
+    seed_store(store, "p", ["a1", "a2"])
+    calls = fake_get(lambda url: posts_search_html([("a1", 1.75e9), ("a2", 1.75e9)]) if "search" in url else None)
+    rt = make_rt(only_new=True, seen_store=str(store))
+    out = tmp_path / "posts.csv"
+    core.crawl_posts_for_keyword(rt, "k", "s", START_TS, END_TS, str(out))
+    rt.close_writers()
+    assert [u for u in calls if "/comments/" in u] == []
+    assert not out.exists() or len(list(csv.reader(open(out, encoding="utf-8-sig")))) <= 1
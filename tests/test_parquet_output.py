@@ -0,0 +1,15 @@
+import pytest
+
+import Get_Red as core
+
+
+def test_parquet_falls_back_to_xlsx_without_pyarrow(make_rt, monkeypatch):
+    monkeypatch.setattr(core, "pq", None)
+    assert core.output_formats(make_rt(output_format="both")) == {"xlsx"}
+
+
+def test_output_format_selection(make_rt):
+    pytest.importorskip("pyarrow")
+    assert core.output_formats(make_rt(output_format="both")) == {"xlsx", "parquet"}
+    assert core.output_formats(make_rt(output_format="parquet")) == {"parquet"}
+    assert core.output_formats(make_rt(output_format="csv")) == {"xlsx"}
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import Get_Red as core
+from conftest import FIXTURES, comment_data, thread_json
+
+
+def payloads():
+    thread = thread_json("p1", [comment_data("c1", "t3_p1", replies=[comment_data("c2", "t1_c1")])])
+    return [
+        ("post_json", json.dumps(thread).encode("utf-8"), None),
+        ("posts_page", (FIXTURES / "search_posts.html").read_bytes(), "utf-8"),
+        ("comments_page", (FIXTURES / "search_comments.html").read_bytes(), "utf-8"),
+        ("comments_page", (FIXTURES / "search_comments_truncated.html").read_bytes(), "utf-8"),
+    ]
+
+
+@pytest.fixture(scope="module")
+def pool_rt(tmp_path_factory):
+    rt = core.CrawlerRuntime({"output_dir": str(tmp_path_factory.mktemp("out")), "post_cache": False}, lambda m: None)
+    pool = core.ParsePool(rt, 1, shm_min_bytes=4096)
+    yield rt, pool
+    pool.close()
+    rt.close_sessions()
+
+
+def test_pool_output_matches_in_thread_parse(pool_rt):
+    rt, pool = pool_rt
+    for kind, payload, encoding in payloads():
+        result, parse_s = pool.run(kind, payload, encoding=encoding)
+        assert result == core._parse_payload(kind, payload, encoding), kind
+        assert parse_s >= 0
+    # 大页面走共享内存，小载荷走管道
+    assert rt.runtime_state["parse_shm_bytes"] > 0
+    assert rt.runtime_state["parse_offloaded"] == 4
+    assert rt.runtime_state["parse_offload_s"] > 0
+
+
+def test_decode_time_excludes_the_round_trip(make_rt):
+    rt = make_rt()
+
+    class SlowPool:
+        def run(self, kind, payload, encoding=None, parser=None):
+            return core._parse_payload(kind, payload, encoding, parser), 0.25
+
+    rt.parse_pool = SlowPool()
+    data = core.decode_post_json(rt, json.dumps(thread_json("p1", [])).encode("utf-8"), "p1")
+    rt.parse_pool = None
+    assert data[0]["data"]["children"][0]["data"]["id"] == "p1"
+    assert rt.runtime_state["json_decode_s"] == 0.25
+
+
+def test_closed_pool_falls_back_to_in_thread_parse(make_rt):
+    rt = make_rt()
+    pool = core.ParsePool(rt, 1)
+    pool.close()
+    kind, payload, encoding = payloads()[1]
+    result, _ = pool.run(kind, payload, encoding=encoding)
+    assert result == core._parse_payload(kind, payload, encoding)
+    assert rt.runtime_state["parse_offloaded"] == 0
@@ -0,0 +1,61 @@
+import json
+import threading
+
+import Get_Red as core
+
+
+def test_cache_is_off_by_default():
+    rt = core.CrawlerRuntime({"mode": "2"}, lambda m: None)
+    assert rt.post_cache is None
+
+
+def test_roundtrip_and_ttl(tmp_path, monkeypatch):
+    cache = core.PostJsonCache(tmp_path, ttl_s=10)
+    cache.put("abc", b'{"x": 1}')
+    assert cache.get("abc") == b'{"x": 1}'
+    now = core.time.time()
+    monkeypatch.setattr(core.time, "time", lambda: now + 11)
+    assert cache.get("abc") is None
+
+
+def test_open_does_not_scan_and_size_persists(tmp_path, monkeypatch):
+    cache = core.PostJsonCache(tmp_path)
+    for i in range(5):
+        cache.put(f"p{i}", b"x" * 100)
+    cache.flush()
+    total = cache.total_bytes
+    assert json.loads((tmp_path / "size.json").read_text())["total_bytes"] == total
+
+    def no_scan(self):
+        raise AssertionError("cache directory scanned")
+
+    monkeypatch.setattr(core.PostJsonCache, "_scan", no_scan)
+    reopened = core.PostJsonCache(tmp_path)
+    assert reopened.get("p1") == b"x" * 100
+    reopened.put("p9", b"y" * 100)
+    assert reopened.total_bytes > total
+
+
+def test_concurrent_puts_keep_exact_total(tmp_path):
+    cache = core.PostJsonCache(tmp_path)
+
+    def worker(n):
+        for i in range(50):
+            cache.put(f"p{i % 10}", bytes([n]) * (100 + i))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.total_bytes == sum(size for _, size, _ in cache._scan())
+
+
+def test_eviction_keeps_total_under_limit(tmp_path):
+    cache = core.PostJsonCache(tmp_path, max_bytes=4000)
+    for i in range(40):
+        cache.put(f"p{i}", bytes(range(256)) * 2)
+    actual = sum(size for _, size, _ in cache._scan())
+    assert actual <= 4000
+    assert cache.total_bytes == actual
+    assert cache.get("p39") is not None
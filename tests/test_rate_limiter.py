@@ -0,0 +1,29 @@
+import Get_Red as core
+
+A = {"https": "http://user:pw@a.example:8000"}
+B = {"https": "http://user:pw@b.example:8000"}
+
+
+def test_exhausted_quota_blocks_only_that_proxy():
+    lim = core.AdaptiveRateLimiter({"search": 1000.0})
+    a, b = core.proxy_label(A), core.proxy_label(B)
+    old, new, block = lim.on_response("search", 200, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "120"}, a)
+    assert block == 120
+    assert new == old  # 配额见底不降共享速率
+    assert lim.reserve("search", a) > 100
+    assert lim.reserve("search", b) < 1
+    assert lim.reserve("post_json", a) < 1
+
+
+def test_429_cuts_the_shared_rate():
+    lim = core.AdaptiveRateLimiter()
+    old, new, block = lim.on_response("search", 429, {}, core.proxy_label(A))
+    assert new == old * lim.DECREASE_FACTOR
+    assert block == 0
+
+
+def test_held_proxy_is_not_picked_until_reset():
+    pm = core.ProxyManager([A, B])
+    pm.hold(A, 60)
+    assert all(pm.pick() is B for _ in range(50))
+    assert pm.stats[core.proxy_label(A)]["quarantine_count"] == 0
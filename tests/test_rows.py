@@ -0,0 +1,22 @@
+import Get_Red as core
+from conftest import comment_data, post_data
+
+
+def formatted(row):
+    return dict(zip(core.CSV_HEADERS, core.format_row(row)))
+
+
+def test_post_and_comment_rows_carry_author_flair():
+    post = post_data("p1")
+    post["author_flair_text"] = "Mod Team"
+    info = core.post_info_from_data(post, "s", "p1", original_url="https://www.reddit.com/r/s/comments/p1/")
+    comment = comment_data("c1", "t3_p1")
+    comment["author_flair_text"] = "Regular"
+
+    post_row = formatted(core.prepare_row(info, None, "test"))
+    assert post_row["post_author_flair"] == "Mod Team"
+    assert post_row["comment_author_flair"] == ""
+
+    comment_row = formatted(core.prepare_row(info, comment, "test"))
+    assert comment_row["post_author_flair"] == "Mod Team"
+    assert comment_row["comment_author_flair"] == "Regular"
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import Get_Red as core
+
+
+def run_scheduler(rt, groups, run_task, workers=1):
+    sch = core.WorkScheduler(rt, run_task)
+    for name, tasks, weight in groups:
+        sch.add_group(name, tasks, weight=weight)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        sch.start(ex, workers)
+        drained = list(sch.drained())
+        sch.join()
+    return sch, drained
+
+
+def test_weighted_dispatch_order(make_rt):
+    rt = make_rt()
+    order = []
+    run_scheduler(rt, [("a", list(range(4)), 2), ("b", list(range(2)), 1)],
+                  lambda group, task: order.append(group))
+    # 权重 2 的组拿到约 2 倍份额，虚拟时间相同先给先登记的组
+    assert order == ["a", "b", "a", "a", "b", "a"]
+
+
+def test_drained_yields_groups_as_they_finish(make_rt):
+    rt = make_rt()
+    _, drained = run_scheduler(rt, [("empty", [], 1), ("long", [1, 2, 3], 1), ("short", [1], 1)],
+                               lambda group, task: None)
+    assert drained == ["empty", "short", "long"]
+
+
+def test_group_finishing_after_stop_is_not_completed(make_rt):
+    rt = make_rt()
+
+    def run_task(group, task):
+        if group == "b":
+            rt.stop_event.set()
+
+    sch, drained = run_scheduler(rt, [("a", [1], 1), ("b", [1], 1), ("c", [1], 1)], run_task)
+    assert drained == ["a", "b"]
+    assert sch.completed("a") and not sch.completed("b")
+
+
+@pytest.fixture
+def crawl_groups(make_rt, monkeypatch, tmp_path):
+    finalized = []
+
+    def run(stop_on=None, fail_on=None):
+        def crawl(rt, kw, sub, start_ts, end_ts, out):
+            if kw == stop_on:
+                rt.stop_event.set()
+
+        def finalize(rt, file_prefix, output_dir, copy_to_desktop=False, group=None):
+            if group == fail_on:
+                raise RuntimeError("finalize boom")
+            finalized.append(group)
+            return []
+
+        monkeypatch.setattr(core, "crawl_posts_for_keyword", crawl)
+        monkeypatch.setattr(core, "finalize_outputs", finalize)
+        monkeypatch.setattr(core, "package_outputs", lambda rt, output_dir, outputs: None)
+        rt = make_rt(subreddits="s", start_date="2024-01-01", end_date="2024-12-31", max_workers=1,
+                     keyword_groups={"a": ["k1"], "b": ["k2"], "c": ["k3"]})
+        core._run_crawler(rt)
+        return rt
+
+    run.finalized = finalized
+    return run
+
+
+def test_groups_drained_before_stop_are_still_finalized(crawl_groups):
+    rt = crawl_groups(stop_on="k2")
+    assert crawl_groups.finalized == ["a"]
+    assert rt.stop_event.is_set()
+
+
+def test_failed_finalize_does_not_stop_other_groups(crawl_groups):
+    rt = crawl_groups(fail_on="a")
+    assert crawl_groups.finalized == ["b", "c"]
+    assert not rt.stop_event.is_set()
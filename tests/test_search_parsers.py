@@ -0,0 +1,107 @@
+import pytest
+
+import Get_Red as core
+from conftest import FIXTURES
+
+# 子目录（如 fixtures/recorded/）里另存的真实搜索页也会被自动纳入对拍
+POST_PAGES = sorted(str(p.relative_to(FIXTURES)) for p in FIXTURES.rglob("search_posts*.html"))
+COMMENT_PAGES = sorted(str(p.relative_to(FIXTURES)) for p in FIXTURES.rglob("search_comments*.html"))
+
+
+def read(name):
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+
+@pytest.mark.parametrize("name", POST_PAGES)
+def test_posts_fast_parser_matches_bs4(name):
+    page = read(name)
+    fast = core._parse_posts_search_page_fast(page)
+    assert fast == core._parse_posts_search_page_bs4(page)
+    assert fast[0]
+
+
+@pytest.mark.parametrize("name", COMMENT_PAGES)
+def test_comments_fast_parser_matches_bs4(name):
+    page = read(name)
+    fast = core._parse_comments_search_page_fast(page)
+    assert fast == core._parse_comments_search_page_bs4(page)
+    assert fast[0]
+
+
+def test_posts_page_fields():
+    metas, next_url = core.parse_posts_search_page_with_cursor(read("search_posts.html"))
+    assert [m["post_id_short"] for m in metas] == ["1cfb001", "1cfb002", "1cfb003", "1cfb004"]
+    # 与 bs4 get_text(strip=True) 一致：每段文本各自 strip 后拼接
+    assert metas[0]["post_title"] == 'Why isasyncioso "hard"?'
+    assert metas[0]["created_utc"] == core.parse_created_ts("2024-05-02T08:30:00+00:00")
+    assert metas[1]["created_utc"] == 1714638600.0  # 毫秒时间戳
+    assert metas[2]["created_utc"] is None
+    assert next_url == "https://www.reddit.com/svc/shreddit/search/?q=asyncio&type=link&cursor=dD0yMDI0"
+
+
+def test_tracker_after_closed_card_is_not_attributed():
+    ptc, next_url = core.parse_comments_search_page_with_cursor(read("search_comments.html"))
+    assert ptc == {
+        ("Python", "1cfa0x1"): ["kq1a2b3", "kq1a2b4"],
+        ("learnpython", "1cfa0x3"): ["kq1a2b6"],
+        ("asyncio", "1cfa0x4"): ["kq1a2b7"],
+    }
+    assert list(ptc) == [("Python", "1cfa0x1"), ("learnpython", "1cfa0x3"), ("asyncio", "1cfa0x4")]
+    assert next_url.endswith("cursor=bGFzdD0xMjM%3D")
+
+
+def test_card_spans_handle_nested_divs():
+    page = ('<div data-testid="search-sdui-comment-unit"><div><div></div></div>'
+            '<search-telemetry-tracker></search-telemetry-tracker></div><div></div>')
+    ((start, end),) = core._comment_card_spans(page)
+    assert page[start:end].endswith("</search-telemetry-tracker>")
+
+
+def forbid_bs4(monkeypatch):
+    def boom(html_text):
+        raise AssertionError("unexpected bs4 fallback")
+    monkeypatch.setattr(core, "_parse_posts_search_page_bs4", boom)
+    monkeypatch.setattr(core, "_parse_comments_search_page_bs4", boom)
+
+
+def test_full_pages_stay_on_fast_path(monkeypatch):
+    forbid_bs4(monkeypatch)
+    metas, next_url = core.parse_posts_search_page_with_cursor(read("search_posts_full_page.html"))
+    assert len(metas) == 25 and "cursor=" in next_url
+    ptc, next_url = core.parse_comments_search_page_with_cursor(read("search_comments_full_page.html"))
+    assert sum(map(len, ptc.values())) == 20 and "cursor=" in next_url
+
+
+TITLE = '<a data-testid="post-title" href="/r/Python/comments/{0}/t/">T{0}</a>'
+CARD = ('<div data-testid="search-sdui-comment-unit"><search-telemetry-tracker data-faceplate-tracking-context='
+        '"{{&quot;post&quot;:{{&quot;id&quot;:&quot;t3_{0}&quot;}},&quot;comment&quot;:{{&quot;id&quot;:&quot;t1_c{0}&quot;}},'
+        '&quot;subreddit&quot;:{{&quot;name&quot;:&quot;Python&quot;}}}}"></search-telemetry-tracker></div>')
+PARTIAL = '<faceplate-partial src="/svc/shreddit/search/?q=x&amp;cursor=abc"></faceplate-partial>'
+
+
+@pytest.mark.parametrize("page", [
+    # 注释里的锚点会让正则一路吞到下一个 </a>
+    "<!-- <a data-testid=\"post-title\" href=\"/r/x/comments/c0/\"> -->" + TITLE.format("p1") + TITLE.format("p2"),
+    # 未闭合的标题锚点吞掉了后一个
+    TITLE.format("p1").replace("</a>", "") + TITLE.format("p2") + TITLE.format("p3"),
+    # 属性引号错乱，正则认不出这个 tracker
+    '<search-telemetry-tracker data-x="a"b" data-faceplate-tracking-context="{}"></search-telemetry-tracker>'
+    + TITLE.format("p1"),
+    TITLE.format("p1") + PARTIAL.replace('src="', 'data-x="a"b" src="'),
+], ids=["commented-anchor", "unclosed-anchor", "broken-tracker", "broken-partial"])
+def test_posts_fast_path_falls_back_when_counts_disagree(page):
+    with pytest.raises(ValueError):
+        core._parse_posts_search_page_fast(page)
+    assert core.parse_posts_search_page_with_cursor(page) == core._parse_posts_search_page_bs4(page)
+
+
+@pytest.mark.parametrize("page", [
+    CARD.format("p1").replace('<div data-testid', '<div data-x="a"b" data-testid') + CARD.format("p2"),
+    CARD.format("p1").replace('<search-telemetry-tracker ', '<search-telemetry-tracker data-x="a"b" ') + CARD.format("p2"),
+    CARD.format("p1").replace("&quot;Python&quot;}}", "&quot;Python&quot;}") + CARD.format("p2"),
+    CARD.format("p1") + PARTIAL.replace('src="', 'data-x="a"b" src="'),
+], ids=["broken-card", "broken-tracker", "bad-context", "broken-partial"])
+def test_comments_fast_path_falls_back_when_counts_disagree(page):
+    with pytest.raises(ValueError):
+        core._parse_comments_search_page_fast(page)
+    assert core.parse_comments_search_page_with_cursor(page) == core._parse_comments_search_page_bs4(page)
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import Get_Red as core
+
+
+@pytest.fixture(params=["xlsxwriter", "openpyxl"])
+def engine(request, monkeypatch):
+    if request.param == "xlsxwriter":
+        pytest.importorskip("xlsxwriter")
+    else:
+        monkeypatch.setattr(core, "xlsxwriter", None)
+    return request.param
+
+
+def write(path, rows, header=("title", "body")):
+    book = core.StreamingXlsxBook(str(path))
+    chunks = [pd.DataFrame(rows, columns=list(header))]
+    written = core._write_sheet_rows(book, "posts", chunks, header)
+    book.close()
+    return book.engine, written
+
+
+def test_strings_are_written_verbatim(tmp_path, engine):
+    rows = [["=HYPERLINK(\"http://x\")", "=1+1"], ["007", "http://example.com"], ["+cmd", "-1"]]
+    used, _ = write(tmp_path / "out.xlsx", rows)
+    assert used == engine
+    ws = load_workbook(tmp_path / "out.xlsx")["posts"]
+    cells = [[c for c in r] for r in ws.iter_rows(min_row=2)]
+    assert [[c.value for c in r] for r in cells] == rows
+    assert all(c.data_type == "s" for r in cells for c in r)
+
+
+def test_oversized_sheet_is_split(tmp_path, engine, monkeypatch):
+    monkeypatch.setattr(core, "XLSX_MAX_DATA_ROWS", 2)
+    _, written = write(tmp_path / "out.xlsx", [[f"t{i}", "b"] for i in range(5)])
+    assert written == [("posts", 2), ("posts_2", 2), ("posts_3", 1)]
+    wb = load_workbook(tmp_path / "out.xlsx")
+    assert [ws.max_row for ws in wb] == [3, 3, 2]